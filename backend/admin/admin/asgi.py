@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "admin.settings")
+# Serve the async variants of the busiest endpoints (settings.ASYNC_VIEWS)
+os.environ.setdefault("ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
+
+# Refuse to serve with a DB_SHARDS other than the one the data was sharded with
+from admin.sharding import check_shard_count  # noqa: E402
+
+check_shard_count()
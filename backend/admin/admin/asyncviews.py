@@ -0,0 +1,57 @@
+"""
+Async function views with DRF's request handling.
+
+DRF 3.14 only has synchronous views, so under ASGI an @api_view holds a
+thread from authentication to the rendered response. async_api_view keeps
+the same pipeline (parsers, authentication, permissions, throttles,
+exception handling, content negotiation) but awaits the view itself, so
+the request only occupies a thread while a sync step or a query actually
+runs. The classes come from @permission_classes, @authentication_classes,
+@throttle_classes etc. stacked below it, exactly as with @api_view.
+
+The view body must not touch the database synchronously: use the async
+queryset methods (aget, afirst, acount, ...) or sync_to_async for code
+such as transactions and serializers that follow relations.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+def async_api_view(http_method_names):
+    def decorator(func):
+        view_class = type('AsyncAPIView', (APIView,), {
+            'http_method_names': [method.lower() for method in http_method_names],
+            'renderer_classes': getattr(func, 'renderer_classes', APIView.renderer_classes),
+            'parser_classes': getattr(func, 'parser_classes', APIView.parser_classes),
+            'authentication_classes': getattr(func, 'authentication_classes', APIView.authentication_classes),
+            'throttle_classes': getattr(func, 'throttle_classes', APIView.throttle_classes),
+            'permission_classes': getattr(func, 'permission_classes', APIView.permission_classes),
+        })
+
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            # APIView.dispatch, with the handler awaited
+            self = view_class()
+            self.args, self.kwargs = args, kwargs
+            request = self.initialize_request(request, *args, **kwargs)
+            self.request = request
+            self.headers = self.default_response_headers
+            try:
+                # Authentication loads the user and throttles hit the cache: both blocking
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+                if request.method.lower() not in self.http_method_names:
+                    self.http_method_not_allowed(request, *args, **kwargs)
+                response = await func(request, *args, **kwargs)
+            except Exception as exc:
+                response = self.handle_exception(exc)
+            self.response = self.finalize_response(request, response, *args, **kwargs)
+            return self.response
+
+        # csrf_exempt() would wrap the coroutine function in a sync one on Django 4.2
+        view.csrf_exempt = True
+        view.cls = view_class
+        view.initkwargs = {}
+        return view
+
+    return decorator
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import inspect
+from functools import wraps
+from typing import NamedTuple, Optional
+from datetime import datetime
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+REVALIDATE = {'private': True, 'no_cache': True}
+IMMUTABLE = {'private': True, 'max_age': 31536000, 'immutable': True}
+
+
+class Freshness(NamedTuple):
+    """Validators and caching policy for one GET response"""
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+    cache_control: dict = REVALIDATE
+
+
+def _variant_etag(request, etag):
+    """Fold the user, query string and Accept header into the ETag so each representation gets its own tag"""
+    basis = '|'.join((
+        etag,
+        str(getattr(request.user, 'pk', '')),
+        request.META.get('QUERY_STRING', ''),
+        request.META.get('HTTP_ACCEPT', ''),
+    ))
+    return quote_etag(hashlib.md5(basis.encode(), usedforsecurity=False).hexdigest())
+
+
+def _validate(request, freshness):
+    """(etag, last_modified, 304 response or None) for a resource with this Freshness"""
+    etag = _variant_etag(request, freshness.etag) if freshness.etag else None
+    last_modified = int(freshness.last_modified.timestamp()) if freshness.last_modified else None
+    response = None
+    if etag or last_modified:
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return etag, last_modified, response
+
+
+def _decorate(response, freshness, etag, last_modified):
+    if etag:
+        response.headers.setdefault('ETag', etag)
+    if last_modified:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_cache_control(response, **freshness.cache_control)
+    patch_vary_headers(response, ('Authorization', 'Accept'))
+    return response
+
+
+def conditional(freshness_func):
+    """
+    Conditional GET for DRF function views.
+
+    freshness_func(request, *args, **kwargs) returns a Freshness, or None when
+    the resource does not exist. It should be much cheaper than the view: when
+    the client's If-None-Match / If-Modified-Since still match, a 304 is sent
+    without running the view, so neither the main query nor serialization
+    happens. Place it below @api_view/@permission_classes so authentication
+    has already run.
+
+    Async views (see admin/asyncviews.py) take a coroutine freshness_func, or
+    a plain one that does not query.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def ainner(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await func(request, *args, **kwargs)
+
+                freshness = freshness_func(request, *args, **kwargs)
+                if inspect.isawaitable(freshness):
+                    freshness = await freshness
+                if freshness is None:
+                    return await func(request, *args, **kwargs)
+
+                etag, last_modified, response = _validate(request, freshness)
+                if response is None:
+                    response = await func(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                return _decorate(response, freshness, etag, last_modified)
+
+            return ainner
+
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return func(request, *args, **kwargs)
+
+            freshness = freshness_func(request, *args, **kwargs)
+            if freshness is None:
+                return func(request, *args, **kwargs)
+
+            etag, last_modified, response = _validate(request, freshness)
+            if response is None:
+                response = func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return _decorate(response, freshness, etag, last_modified)
+
+        return inner
+
+    return decorator
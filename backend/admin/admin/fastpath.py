@@ -0,0 +1,137 @@
+"""
+Fast read-path serialization: the output of a ModelSerializer, built from
+.values_list() rows instead of model instances.
+
+FastSerializer inspects a serializer class once and compiles each readable
+field into a column lookup plus a converter that reproduces the field's
+to_representation() for the raw database value. Nested model serializers
+become JOINed lookups. Fields whose source is a method rather than a column
+must be given explicitly as `computed` (lookups, function). Compile once
+(e.g. at module level) and reuse: only the current timezone is looked up
+per serialize() call. Anything not
+recognised falls back to the DRF field's own to_representation(), so the
+result always matches; the contract tests in transactions/tests.py keep
+the two paths byte-identical.
+"""
+import decimal
+from contextvars import ContextVar
+from operator import itemgetter
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+ISO_8601 = 'iso-8601'
+
+# The active timezone for the serialize() call in progress, read by datetime converters
+_serialize_tz = ContextVar('serialize_tz')
+
+# Fields whose representation of the database value is the value itself
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+                   serializers.PrimaryKeyRelatedField)
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if (output_format is None or output_format.lower() != ISO_8601
+            or not settings.USE_TZ or hasattr(field, 'timezone')):
+        return field.to_representation
+    # The timezone is resolved per serialize() call, as DRF resolves it per field call
+    def convert(value):
+        text = value.astimezone(_serialize_tz.get()).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _converter(field):
+    """A function of the raw column value, or None when the value passes through unchanged"""
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == '' else choices.get(str(value), value)
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_converter(field)
+    if isinstance(field, IDENTITY_FIELDS):
+        return None
+    return field.to_representation
+
+
+class FastSerializer:
+    def __init__(self, serializer_class, fields=None, computed=None):
+        self.lookups = []
+        self.getters = self._compile(serializer_class(fields=fields) if fields is not None else serializer_class(),
+                                     '', computed or {})
+
+    def _column(self, lookup):
+        try:
+            return self.lookups.index(lookup)
+        except ValueError:
+            self.lookups.append(lookup)
+            return len(self.lookups) - 1
+
+    def _compile(self, serializer, prefix, computed):
+        model = serializer.Meta.model
+        getters = []
+        for field in serializer._readable_fields:
+            name = field.field_name
+            if name in computed and not prefix:
+                lookups, func = computed[name]
+                indexes = [self._column(lookup) for lookup in lookups]
+                getters.append((name, lambda row, indexes=indexes, func=func: func(*(row[i] for i in indexes))))
+                continue
+
+            lookup = prefix + '__'.join(field.source_attrs)
+            if isinstance(field, serializers.ModelSerializer):
+                presence = self._column(lookup)
+                nested = self._compile(field, lookup + '__', {})
+                getters.append((name, lambda row, presence=presence, nested=nested: None if row[presence] is None
+                                else {key: get(row) for key, get in nested}))
+                continue
+
+            try:
+                self._check_column(model, field.source_attrs)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(
+                    f'{type(serializer).__name__}.{name} has no column source; pass it in computed'
+                )
+            index = self._column(lookup)
+            convert = _converter(field)
+            if convert is None:
+                getters.append((name, itemgetter(index)))
+            else:
+                getters.append((name, lambda row, index=index, convert=convert: None if row[index] is None
+                                else convert(row[index])))
+        return getters
+
+    @staticmethod
+    def _check_column(model, attrs):
+        for attr in attrs:
+            field = model._meta.get_field(attr)
+            if field.is_relation:
+                model = field.related_model
+
+    def serialize(self, queryset):
+        """Rows as a list of dicts in the serializer's field order"""
+        getters = self.getters
+        token = _serialize_tz.set(timezone.get_current_timezone())
+        try:
+            return [{name: get(row) for name, get in getters} for row in queryset.values_list(*self.lookups)]
+        finally:
+            _serialize_tz.reset(token)
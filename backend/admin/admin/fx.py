@@ -0,0 +1,108 @@
+import bisect
+import csv
+import os
+import threading
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from transactions.models import Transaction
+
+CENT = Decimal('0.01')
+
+
+class RateTable:
+    """Daily rates per currency, each the price of one unit in USD, from settings.FX_RATES_FILE"""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.dates = []
+        self.rates = {}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                self.dates.append(date.fromisoformat(row.pop('date')))
+                for currency, value in row.items():
+                    self.rates.setdefault(currency, []).append(Decimal(value))
+        if not self.dates:
+            raise ImproperlyConfigured(f'{path} has no rates')
+        if self.dates != sorted(self.dates):
+            raise ImproperlyConfigured(f'{path} must be sorted by date')
+
+    def usd_value(self, currency, day):
+        """Rate in force on `day`: the latest row on or before it (the first row for earlier days)"""
+        try:
+            series = self.rates[currency]
+        except KeyError:
+            raise ImproperlyConfigured(f'No FX rates for {currency}')
+        index = max(bisect.bisect_right(self.dates, day) - 1, 0)
+        return series[index]
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    """Load the rate table once per process, reloading if the file has changed"""
+    global _table
+    path = settings.FX_RATES_FILE
+    mtime = os.path.getmtime(path)
+    if _table is None or _table.path != path or _table.mtime != mtime:
+        with _table_lock:
+            if _table is None or _table.path != path or _table.mtime != mtime:
+                _table = RateTable(path)
+                _rate.cache_clear()
+    return _table
+
+
+@lru_cache(maxsize=16384)
+def _rate(source, target, day):
+    table = _table
+    return table.usd_value(source, day) / table.usd_value(target, day)
+
+
+def rate(source, target, day):
+    """Multiplier converting an amount in `source` to `target` at `day`'s rates"""
+    if source == target:
+        return Decimal('1')
+    get_table()
+    return _rate(source, target, day)
+
+
+def reporting_currency(request=None):
+    """The ?currency= override when it names a supported currency, else settings.REPORTING_CURRENCY"""
+    requested = (request.GET.get('currency') or '').upper() if request is not None else ''
+    if requested in dict(Transaction.CURRENCY_CHOICES):
+        return requested
+    return settings.REPORTING_CURRENCY
+
+
+def convert_groups(groups, target):
+    """Sum (currency, day, amount) group totals into one amount in `target`"""
+    total = Decimal('0')
+    for currency, day, amount in groups:
+        if amount:
+            total += amount * rate(currency, target, day)
+    return total.quantize(CENT)
+
+
+def currency_day_totals(queryset, field='amount', date_field='transaction_date'):
+    """(currency, day, total) groups of `field` over a queryset, for convert_groups()"""
+    return list(queryset.order_by()
+                .annotate(day=TruncDate(date_field))
+                .values_list('currency', 'day')
+                .annotate(total=Sum(field)))
+
+
+def converted_sum(queryset, target, field='amount', date_field='transaction_date'):
+    """
+    Total of `field` over a queryset in `target` currency.
+
+    The database sums per (currency, day), so Python only converts one number
+    per group rather than one per row.
+    """
+    return convert_groups(currency_day_totals(queryset, field, date_field), target)
@@ -0,0 +1,508 @@
+"""
+On-demand request profiling.
+
+A request is profiled when a staff user sends `X-Profile: 1` along with
+their usual JWT, or when it is picked at random at
+settings.PROFILE_SAMPLE_RATE. While it runs, a thread samples its stack
+every PROFILE_INTERVAL_MS, along with the sync_to_async worker threads it
+is waiting on, and every SQL query (on any database alias) and upstream
+HTTP call made on its behalf is timed. The result is written to
+PROFILE_DIR as two files. <id>.folded holds collapsed stacks, readable by
+flamegraph.pl and speedscope. <id>.json holds the request summary, the
+queries and the calls. The id comes back in the X-Profile-Id header, and
+the admin panel serves both files. They are written by a background
+thread, so they appear shortly after the response.
+
+For a request that is not profiled, the cost is one header lookup, plus
+one random() when sampling is on, and one context variable read per SQL
+query. The HTTP and sync_to_async hooks are patched in only while some
+request is being profiled. Query parameters and URL query strings are
+never recorded.
+"""
+import asyncio
+import copy
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.exceptions import APIException
+from authentication.revocation import RevocableJWTAuthentication
+
+# Bounds on what one profile keeps
+MAX_QUERIES = 2000
+MAX_HTTP_CALLS = 500
+# Finished profiles waiting for the writer thread; more than this and new ones are dropped
+MAX_UNWRITTEN = 100
+
+logger = logging.getLogger(__name__)
+
+_active = ContextVar('profile', default=None)
+
+
+class Profile:
+    def __init__(self, method, path, trigger):
+        self.id = f"{datetime.now(dt_timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.status = None
+        self.stacks = Counter()
+        self.queries = []
+        self.queries_dropped = 0
+        self.http_calls = []
+        # Thread id -> frame of each sync_to_async call running for the request right now
+        self.workers = {}
+
+    def add_query(self, alias, sql, many, elapsed):
+        if len(self.queries) < MAX_QUERIES:
+            self.queries.append({'alias': alias, 'sql': sql, 'many': many, 'ms': round(elapsed * 1000, 3)})
+        else:
+            self.queries_dropped += 1
+
+    def add_http_call(self, method, url, status, elapsed):
+        if len(self.http_calls) < MAX_HTTP_CALLS:
+            self.http_calls.append({'method': method, 'url': url, 'status': status, 'ms': round(elapsed * 1000, 3)})
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'trigger': self.trigger,
+            'started_at': datetime.fromtimestamp(self.started_at, dt_timezone.utc).isoformat(),
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'samples': sum(self.stacks.values()),
+            'query_count': len(self.queries) + self.queries_dropped,
+            'query_ms': round(sum(query['ms'] for query in self.queries), 3),
+            'http_call_count': len(self.http_calls),
+            'http_ms': round(sum(call['ms'] for call in self.http_calls), 3),
+        }
+
+
+# Stack sampling
+
+_labels = {}
+
+
+def _short_path(filename):
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        # One entry per function rather than per line, so samples in the same function merge
+        label = _labels[code] = f'{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+    return label
+
+
+def _stack(frame):
+    """A thread's frames, outermost first"""
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_chain(coro):
+    """Frames of a suspended coroutine and everything it awaits, outermost first"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return frames
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the stacks of one thread every `interval` seconds until stopped,
+    from the `root` frame (the profiling middleware) down.
+
+    With a task (async requests), the thread is an event loop that also runs
+    other requests: samples taken while this task runs keep its frames only.
+    While it awaits a sync_to_async call, the worker thread running that call
+    (see `workers`) is sampled below the await chain; otherwise the sample
+    counts as waiting at the point where it awaits.
+    """
+
+    def __init__(self, thread_id, interval, root, task=None, workers=None):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.task = task
+        self.workers = {} if workers is None else workers
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for frames in self.sample():
+                self.stacks[';'.join(frames)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def sample(self):
+        """The stacks seen at this instant: one, or one per busy worker thread"""
+        current = sys._current_frames()
+        stack = _stack(current.get(self.thread_id))
+        if self.task is None:
+            return [self._fold(stack)]
+
+        if self.task.done():
+            return []
+        chain = _await_chain(self.task.get_coro())
+        if chain and chain[0] in stack:
+            return [self._fold(stack[stack.index(chain[0]):])]
+        waiting = self._fold(chain)
+        stacks = []
+        for thread_id, entry in list(self.workers.items()):
+            worker_stack = _stack(current.get(thread_id))
+            if entry in worker_stack:
+                # From the request's own function down, without the executor frames above it
+                frames = worker_stack[worker_stack.index(entry) + 1:]
+                stacks.append(waiting + [_label(frame.f_code) for frame in frames])
+        return stacks or [waiting + ['[await]']]
+
+    def _fold(self, frames):
+        if self.root in frames:
+            frames = frames[frames.index(self.root):]
+        return [_label(frame.f_code) for frame in frames]
+
+
+# Hooks. The query hook is Django's own per-connection wrapper list and stays
+# installed; http.client and SyncToAsync are patched only while profiles run.
+
+def _record_query(execute, sql, params, many, context):
+    profile = _active.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(context['connection'].alias, sql, many, time.perf_counter() - started)
+
+
+def _add_query_hook(sender, connection, **kwargs):
+    # Fired on every (re)connect of a thread's connection; the wrapper list outlives the socket
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+_query_hook_lock = threading.Lock()
+_query_hook_installed = False
+
+
+def install_query_hook():
+    """Time SQL on every connection, on any database alias, while a profile is active"""
+    global _query_hook_installed
+    with _query_hook_lock:
+        if _query_hook_installed:
+            return
+        connection_created.connect(_add_query_hook, dispatch_uid='admin.profiling')
+        for connection in connections.all(initialized_only=True):
+            _add_query_hook(None, connection)
+        _query_hook_installed = True
+
+
+def _http_client_patches():
+    # putrequest and the base getresponse are the two steps urllib and urllib3 (requests) both go through
+    connection_putrequest = http.client.HTTPConnection.putrequest
+    connection_getresponse = http.client.HTTPConnection.getresponse
+
+    def putrequest(self, method, url, *args, **kwargs):
+        if _active.get() is not None:
+            scheme = 'https' if self.default_port == 443 else 'http'
+            target = url if '://' in url else f'{scheme}://{self.host}:{self.port}{url}'
+            self._profile_call = (method, target.split('?')[0], time.perf_counter())
+        return connection_putrequest(self, method, url, *args, **kwargs)
+
+    def getresponse(self):
+        call = self.__dict__.pop('_profile_call', None)
+        profile = _active.get()
+        if call is None or profile is None:
+            return connection_getresponse(self)
+        method, url, started = call
+        status = None
+        try:
+            response = connection_getresponse(self)
+            status = response.status
+            return response
+        finally:
+            profile.add_http_call(method, url, status, time.perf_counter() - started)
+
+    return [(http.client.HTTPConnection, 'putrequest', putrequest),
+            (http.client.HTTPConnection, 'getresponse', getresponse)]
+
+
+def _in_worker(profile, func):
+    """func, recording the thread it runs on (and its frame) in profile.workers while it runs"""
+    @wraps(func)
+    def inner(*args, **kwargs):
+        thread_id = threading.get_ident()
+        # A nested call on the same thread leaves the outer entry in place
+        entry = profile.workers.setdefault(thread_id, sys._getframe())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if entry is sys._getframe():
+                del profile.workers[thread_id]
+    return inner
+
+
+def _sync_to_async_patches():
+    # Django runs sync views and middleware under ASGI through SyncToAsync too
+    sync_to_async_call = SyncToAsync.__call__
+
+    async def __call__(self, *args, **kwargs):
+        profile = _active.get()
+        if profile is None:
+            return await sync_to_async_call(self, *args, **kwargs)
+        # The instance is shared by every request calling it; wrap a per-call copy
+        tracked = copy.copy(self)
+        tracked.func = _in_worker(profile, self.func)
+        return await sync_to_async_call(tracked, *args, **kwargs)
+
+    return [(SyncToAsync, '__call__', __call__)]
+
+
+_patch_lock = threading.Lock()
+_profiles_running = 0
+_originals = []
+
+
+def _patch_in():
+    """Called as a profile starts: the first one running puts the http.client and SyncToAsync hooks in place"""
+    global _profiles_running
+    with _patch_lock:
+        if _profiles_running == 0:
+            for owner, name, wrapper in _http_client_patches() + _sync_to_async_patches():
+                _originals.append((owner, name, getattr(owner, name)))
+                setattr(owner, name, wrapper)
+        _profiles_running += 1
+
+
+def _patch_out():
+    """Called as a profile finishes: the last one running puts the originals back"""
+    global _profiles_running
+    with _patch_lock:
+        _profiles_running -= 1
+        if _profiles_running == 0:
+            while _originals:
+                owner, name, original = _originals.pop()
+                setattr(owner, name, original)
+
+
+# Storage
+
+def profile_dir():
+    return settings.PROFILE_DIR
+
+
+def _remove(profile_id):
+    for suffix in ('.json', '.folded'):
+        try:
+            os.remove(os.path.join(profile_dir(), profile_id + suffix))
+        except FileNotFoundError:
+            pass
+
+
+class ProfileWriter(threading.Thread):
+    """
+    Writes finished profiles to PROFILE_DIR and prunes all but the newest
+    PROFILE_KEEP, off the request path. The directory is listed once, on the
+    first write; after that the writer keeps its own list of what is stored.
+    Profiles written by other processes sharing PROFILE_DIR are pruned the
+    next time a process starts writing.
+    """
+
+    def __init__(self):
+        super().__init__(name='profile-writer', daemon=True)
+        self.queue = queue.Queue(MAX_UNWRITTEN)
+        self.kept = None
+
+    def submit(self, profile):
+        try:
+            self.queue.put_nowait(profile)
+        except queue.Full:
+            logger.warning('Profile writer is behind; dropped profile %s', profile.id)
+
+    def run(self):
+        while True:
+            profile = self.queue.get()
+            try:
+                self.write(profile)
+            except OSError:
+                logger.exception('Could not write profile %s', profile.id)
+            finally:
+                self.queue.task_done()
+
+    def write(self, profile):
+        if self.kept is None:
+            # Oldest first
+            self.kept = deque(reversed(stored_ids()))
+        os.makedirs(profile_dir(), exist_ok=True)
+        base = os.path.join(profile_dir(), profile.id)
+        with open(base + '.folded', 'w') as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(base + '.json', 'w') as f:
+            json.dump({**profile.summary(), 'queries_dropped': profile.queries_dropped,
+                       'queries': profile.queries, 'http_calls': profile.http_calls}, f)
+        self.kept.append(profile.id)
+        while len(self.kept) > settings.PROFILE_KEEP:
+            _remove(self.kept.popleft())
+
+    def flush(self):
+        """Wait until every submitted profile is written"""
+        self.queue.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def writer():
+    """The process's profile writer, started on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ProfileWriter()
+            _writer.start()
+        return _writer
+
+
+def stored_ids():
+    """Ids of the stored profiles, newest first"""
+    try:
+        names = os.listdir(profile_dir())
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-5] for name in names if name.endswith('.json')), reverse=True)
+
+
+def load(profile_id):
+    """A stored profile's JSON document, or None"""
+    path = stored_path(profile_id, '.json')
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def stored_path(profile_id, suffix):
+    """Path of a stored profile file, or None; ids are checked so they cannot leave PROFILE_DIR"""
+    if profile_id not in stored_ids():
+        return None
+    return os.path.join(profile_dir(), profile_id + suffix)
+
+
+# Triggering
+
+def _is_staff(request):
+    try:
+        result = RevocableJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and result[0].is_staff
+
+
+def _sampled():
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class ProfilingMiddleware:
+    """Profiles the requests picked by X-Profile or PROFILE_SAMPLE_RATE (see the module docstring)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = settings.PROFILE_INTERVAL_MS / 1000
+        install_query_hook()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if 'HTTP_X_PROFILE' in request.META:
+            trigger = 'header' if _is_staff(request) else None
+        else:
+            trigger = 'sample' if _sampled() else None
+        if trigger is None:
+            return self.get_response(request)
+
+        profiling = self.start(request, trigger, sys._getframe(), task=None)
+        try:
+            response = self.get_response(request)
+            profiling[0].status = response.status_code
+        finally:
+            profile = self.finish(*profiling)
+            writer().submit(profile)
+        response['X-Profile-Id'] = profile.id
+        return response
+
+    async def __acall__(self, request):
+        if 'HTTP_X_PROFILE' in request.META:
+            trigger = 'header' if await sync_to_async(_is_staff)(request) else None
+        else:
+            trigger = 'sample' if _sampled() else None
+        if trigger is None:
+            return await self.get_response(request)
+
+        profiling = self.start(request, trigger, sys._getframe(), task=asyncio.current_task())
+        try:
+            response = await self.get_response(request)
+            profiling[0].status = response.status_code
+        finally:
+            profile = self.finish(*profiling)
+            writer().submit(profile)
+        response['X-Profile-Id'] = profile.id
+        return response
+
+    def start(self, request, trigger, root, task):
+        profile = Profile(request.method, request.path, trigger)
+        sampler = StackSampler(threading.get_ident(), self.interval, root, task, profile.workers)
+        _patch_in()
+        token = _active.set(profile)
+        sampler.start()
+        return profile, sampler, token, time.perf_counter()
+
+    @staticmethod
+    def finish(profile, sampler, token, started):
+        profile.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        sampler.stop()
+        profile.stacks = sampler.stacks
+        _active.reset(token)
+        _patch_out()
+        return profile
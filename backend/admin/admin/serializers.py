@@ -0,0 +1,17 @@
+class DynamicFieldsMixin:
+    """Lets a ModelSerializer be built with fields=(...) to render only a subset of its fields"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+def parse_fields(request):
+    """Read the ?fields=a,b,c sparse fieldset parameter; None means all fields"""
+    fields = request.GET.get('fields')
+    if not fields:
+        return None
+    return tuple(name.strip() for name in fields.split(',') if name.strip())
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from datetime import timedelta
+from importlib.util import find_spec
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -24,10 +25,15 @@ INSTALLED_APPS = [
     'cards',
     'transactions',
     'admin_panel',
+    'webhooks',
+    'settlements',
 ]
 
 MIDDLEWARE = [
+    'admin.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'admin.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,6 +75,21 @@ DATABASES = {
     }
 }
 
+# Sharding (admin/sharding.py): cards and transactions are split by user over
+# DB_SHARDS databases; `default` is shard 0 and keeps everything else.
+# Shard i defaults to the default server with NAME suffixed _shard{i}.
+DB_SHARDS = int(os.environ.get('DB_SHARDS', '1'))
+
+for index in range(1, DB_SHARDS):
+    DATABASES[f'shard{index}'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get(f'DB_SHARD{index}_NAME', f"{DATABASES['default']['NAME']}_shard{index}"),
+        'HOST': os.environ.get(f'DB_SHARD{index}_HOST', DATABASES['default']['HOST']),
+    }
+
+SHARD_ALIASES = ['default'] + [f'shard{index}' for index in range(1, DB_SHARDS)]
+DATABASE_ROUTERS = ['admin.sharding.ShardRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -93,13 +114,97 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.revocation.RevocableJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': [
+        'admin.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['admin.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    # Reverse proxies in front of Django (the frontend's nginx is one). Only the X-Forwarded-For
+    # entries they add are trusted for per-IP rate limits; 0 uses the socket address.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
 }
 
+# Async views (admin/asyncviews.py) for the busiest endpoints; asgi.py turns this on.
+# Under WSGI Django would run each async view in a one-off event loop, so the sync ones stay.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
+# Request Profiling (see admin/profiling.py)
+# Staff trigger a profile with an X-Profile header; this picks a random share of all requests too
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+# Newest profiles kept on disk
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '200'))
+
+# Outcome Time Series (see admin_panel/timeseries.py)
+# How often each process writes its per-minute outcome counters to the rollup table
+TIMESERIES_FLUSH_SECONDS = float(os.environ.get('TIMESERIES_FLUSH_SECONDS', '10'))
+
+# Cache Settings
+# Set REDIS_URL to share rate-limit state between workers; otherwise each process keeps its own.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        # A slow Redis falls back to per-process buckets instead of holding up requests
+        'OPTIONS': {'socket_timeout': 0.05, 'socket_connect_timeout': 0.05},
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+    },
+}
+
+# Rate Limits (token buckets: capacity N, refilled at N per period)
+RATE_LIMIT_CACHE = 'ratelimit'
+RATE_LIMITS = {
+    'auth': {
+        'user': None,
+        'ip': os.environ.get('RATE_LIMIT_AUTH_IP', '10/min'),
+        'global': os.environ.get('RATE_LIMIT_AUTH_GLOBAL', '300/min'),
+    },
+    'payments': {
+        'user': os.environ.get('RATE_LIMIT_PAYMENTS_USER', '30/min'),
+        'ip': os.environ.get('RATE_LIMIT_PAYMENTS_IP', '60/min'),
+        'global': os.environ.get('RATE_LIMIT_PAYMENTS_GLOBAL', '1000/min'),
+    },
+}
+
+# Payment Processor (FastAPI)
+PAYMENT_PROCESSOR_URL = os.environ.get('FASTAPI_API_URL', 'http://localhost:8001')
+# Shared secret the processor sends in X-Processor-Key for service-only endpoints; empty disables them
+PAYMENT_PROCESSOR_KEY = os.environ.get('PAYMENT_PROCESSOR_KEY', '')
+
+# Transaction Events (outbox relay sinks, see transactions/outbox.py)
+# Terminal status changes become merchant webhook deliveries (sent by dispatch_webhooks)
+OUTBOX_SINKS = [{'class': 'webhooks.queue.DeliveryQueueSink'}]
+if os.environ.get('OUTBOX_FILE'):
+    OUTBOX_SINKS.append({'class': 'transactions.outbox.FileSink', 'path': os.environ['OUTBOX_FILE']})
+if os.environ.get('OUTBOX_WEBHOOK_URL'):
+    OUTBOX_SINKS.append({'class': 'transactions.outbox.WebhookSink', 'url': os.environ['OUTBOX_WEBHOOK_URL']})
+# Merchant webhooks may only go to public addresses (see webhooks/destinations.py); True is for local development
+WEBHOOK_ALLOW_PRIVATE_DESTINATIONS = os.environ.get('WEBHOOK_ALLOW_PRIVATE_DESTINATIONS', 'False') == 'True'
+
+# Settlement (see settlements/engine.py)
+# Where settlement files are written, one per cutoff and shard
+SETTLEMENT_DIR = os.environ.get('SETTLEMENT_DIR', os.path.join(BASE_DIR, 'settlement_files'))
+
+# Card Fingerprints (duplicate-card detection); changing the key orphans existing fingerprints
+CARD_FINGERPRINT_KEY = os.environ.get('CARD_FINGERPRINT_KEY', SECRET_KEY)
+
+# Currency Conversion
+# CSV of daily rates: date,<CURRENCY>,... where each value is the price of one unit in USD
+FX_RATES_FILE = os.environ.get('FX_RATES_FILE', os.path.join(BASE_DIR, 'admin', 'fx_rates.csv'))
+REPORTING_CURRENCY = os.environ.get('REPORTING_CURRENCY', 'USD')
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
@@ -111,5 +216,12 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Token Revocation (see authentication/revocation.py)
+# Expected live revocations per process filter; it is rebuilt larger when exceeded
+REVOCATION_FILTER_CAPACITY = int(os.environ.get('REVOCATION_FILTER_CAPACITY', '100000'))
+REVOCATION_FILTER_ERROR_RATE = float(os.environ.get('REVOCATION_FILTER_ERROR_RATE', '0.001'))
+# How long a revocation made in another worker may go unnoticed
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', '2'))
+
 # Custom User Model
 AUTH_USER_MODEL = 'authentication.User'
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+API-only settings for the REST workers: DJANGO_SETTINGS_MODULE=admin.settings_api
+
+The API authenticates with JWTs and renders JSON, so it needs neither the
+admin site nor sessions, messages, CSRF (DRF exempts its views) or static
+files. Dropping them and the browsable renderer keeps those modules out of
+every worker's import. Keep admin.settings for the admin site, migrations and
+management commands.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, TEMPLATES
+
+API_DROPPED_APPS = {
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+}
+
+API_DROPPED_MIDDLEWARE = {
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    # Needs request.session; DRF sets request.user itself
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_DROPPED_APPS]
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in API_DROPPED_MIDDLEWARE]
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'OPTIONS': {
+            'context_processors': [
+                processor for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+                if not processor.startswith('django.contrib.messages.')
+            ],
+        },
+    },
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+}
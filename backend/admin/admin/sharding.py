@@ -0,0 +1,210 @@
+"""
+User-keyed horizontal sharding.
+
+Cards, transactions, their outbox events and the per-user stats live on the
+shard that owns the user; users and everything else stay on `default`,
+which is also shard 0. DB_SHARDS=N in settings adds shard1..shard(N-1).
+
+    user id -> bucket (user_id % BUCKETS) -> shard index (bucket % shards) -> database alias
+
+The mapping is fixed arithmetic, not a stored map, and nothing moves data
+between shards: changing DB_SHARDS would look for most users' rows on the
+wrong shard. The shard count is therefore recorded on `default` by the
+first migrate, and migrate and server start-up (wsgi.py, asgi.py) refuse
+to run with a different one (check_shard_count).
+
+Every row that gets an auto-increment id on shard i takes it from
+[i << ID_BITS, (i + 1) << ID_BITS), so ids are unique across shards and a
+bare transaction or card id routes to its shard without a lookup. The
+ranges are reserved by reserve_id_ranges() after each migrate. With 48 bits
+per shard, ids stay below 2**53 (safe as JSON numbers) for up to 32 shards.
+
+Queries on sharded models must pick their shard: the router handles model
+instances (save, delete, related lookups), the managers' for_user()/for_id()
+handle querysets, and scatter() runs a function on every shard for
+cross-user reads such as admin aggregates and exports. With DB_SHARDS=1
+(the default) every alias resolves to `default` and nothing changes.
+
+The test suite runs sharded with several SQLite databases, e.g.
+DB_SHARDS=3 DB_ENGINE=django.db.backends.sqlite3 python manage.py test
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections, models
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 1024
+ID_BITS = 48
+
+SHARDED_MODELS = {'cards.card', 'transactions.transaction', 'transactions.outboxevent', 'admin_panel.userstats',
+                  'admin_panel.userspend'}
+
+
+def aliases():
+    return settings.SHARD_ALIASES
+
+
+def enabled():
+    return len(settings.SHARD_ALIASES) > 1
+
+
+def shard_index_for_user(user_id):
+    # Only valid for the shard count the data was written with; see check_shard_count()
+    return (user_id % BUCKETS) % len(settings.SHARD_ALIASES)
+
+
+def shard_for_user(user_id):
+    return settings.SHARD_ALIASES[shard_index_for_user(user_id)]
+
+
+def shard_for_id(obj_id):
+    """Alias of the shard that issued obj_id, or None if no shard did"""
+    index = obj_id >> ID_BITS
+    return settings.SHARD_ALIASES[index] if 0 <= index < len(settings.SHARD_ALIASES) else None
+
+
+def shard_id(index, local_id):
+    """The id shard `index` issues for its local_id-th row"""
+    return (index << ID_BITS) + local_id
+
+
+def local_id(obj_id):
+    return obj_id & ((1 << ID_BITS) - 1)
+
+
+def group_by_shard(ids, shard=shard_for_id):
+    """{alias: [ids]} for ids routed by `shard` (ids that belong to no shard are dropped)"""
+    groups = {}
+    for obj_id in ids:
+        alias = shard(obj_id)
+        if alias is not None:
+            groups.setdefault(alias, []).append(obj_id)
+    return groups
+
+
+def _on_shard(func, alias, args):
+    try:
+        return func(alias, *args)
+    finally:
+        # Worker threads open their own connections; don't leave them behind
+        connections.close_all()
+
+
+def scatter(func, *args):
+    """[func(alias, *args) for every shard], run concurrently when there is more than one"""
+    if not enabled():
+        return [func('default', *args)]
+    with ThreadPoolExecutor(max_workers=len(settings.SHARD_ALIASES)) as pool:
+        return list(pool.map(lambda alias: _on_shard(func, alias, args), settings.SHARD_ALIASES))
+
+
+class ShardedManager(models.Manager):
+    def for_user(self, user_id):
+        return self.using(shard_for_user(user_id))
+
+    def for_id(self, obj_id):
+        """Queryset on the shard that issued obj_id; empty if none did"""
+        alias = shard_for_id(obj_id)
+        return self.using(alias) if alias is not None else self.none()
+
+    def create(self, **kwargs):
+        # A bare queryset writes to `default`; saving the instance lets the router pick its shard
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+def _instance_shard(instance):
+    if instance._meta.label_lower == settings.AUTH_USER_MODEL.lower():
+        # A user hint comes from assigning card.user = user: the card belongs on the user's
+        # shard, not on default where the user row was loaded from
+        return shard_for_user(instance.pk) if instance.pk is not None else None
+    if instance._state.db is not None:
+        return instance._state.db
+    user_id = getattr(instance, 'user_id', None)
+    if user_id is not None:
+        return shard_for_user(user_id)
+    transaction_id = getattr(instance, 'transaction_id', None)
+    if transaction_id is not None:
+        return shard_for_id(transaction_id)
+    return None
+
+
+class ShardRouter:
+    """Routes sharded models by the owning user; leaves the rest on default"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in SHARDED_MODELS:
+            return 'default'
+        instance = hints.get('instance')
+        return _instance_shard(instance) if instance is not None else None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Sharded rows point at users on default; the schema drops those FK constraints when sharded
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name is None:
+            return None
+        if f'{app_label}.{model_name}' in SHARDED_MODELS:
+            return db in settings.SHARD_ALIASES
+        return db == 'default'
+
+
+def reserve_id_ranges(using, **kwargs):
+    """post_migrate handler (see TransactionsConfig.ready): start the auto-increment ids of sharded tables at this shard's range"""
+    if using not in settings.SHARD_ALIASES:
+        return
+    index = settings.SHARD_ALIASES.index(using)
+    if index == 0:
+        return
+    from django.apps import apps
+    connection = connections[using]
+    start = shard_id(index, 0)
+    for label in SHARDED_MODELS:
+        model = apps.get_model(label)
+        if not isinstance(model._meta.pk, models.AutoField):
+            continue
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MAX({model._meta.pk.column}) FROM {connection.ops.quote_name(table)}')
+            if (cursor.fetchone()[0] or 0) >= start:
+                continue
+            if connection.vendor == 'mysql':
+                cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} AUTO_INCREMENT = {start + 1}')
+            elif connection.vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+            else:
+                logger.warning('Cannot reserve the id range of %s on %s (%s)', table, using, connection.vendor)
+
+
+def check_shard_count():
+    """Raise ImproperlyConfigured if DB_SHARDS differs from the count recorded at the first migrate"""
+    from transactions.models import ShardLayout
+    try:
+        recorded = ShardLayout.objects.using('default').values_list('shards', flat=True).first()
+    except DatabaseError:
+        # Not migrated yet: there is no sharded data to misplace
+        return
+    if recorded is not None and recorded != len(settings.SHARD_ALIASES):
+        raise ImproperlyConfigured(
+            f'DB_SHARDS is {len(settings.SHARD_ALIASES)} but the data is sharded across {recorded} databases; '
+            'users cannot be moved between shards, so DB_SHARDS must stay the same'
+        )
+
+
+def record_shard_count(using, **kwargs):
+    """post_migrate handler (see TransactionsConfig.ready): refuse a changed DB_SHARDS, else record it"""
+    if using != 'default':
+        return
+    from transactions.models import ShardLayout
+    check_shard_count()
+    ShardLayout.objects.using('default').get_or_create(id=1, defaults={'shards': len(settings.SHARD_ALIASES)})
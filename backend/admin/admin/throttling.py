@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import BaseThrottle
+from transactions.permissions import IsPaymentProcessor
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for a Redis rate limit cache
+    redis = None
+
+LOCAL_BUCKET_LIMIT = 10000
+# Least recently used first, so a full table drops the idlest bucket rather than every limit at once
+_local_buckets = OrderedDict()
+_local_lock = threading.Lock()
+
+# Same bucket as _take(), read and written in one step on the server (as in fastapi_app/ratelimit.py)
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return {allowed, tostring(tokens)}
+"""
+_script = None
+
+
+def parse_rate(rate):
+    """Parse 'N/period' into (capacity, tokens refilled per second)"""
+    num, period = rate.split('/')
+    capacity = int(num)
+    seconds = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+    return capacity, capacity / seconds
+
+
+def _take(state, capacity, refill_rate, now):
+    """Refill a (tokens, timestamp) bucket and try to take one token"""
+    tokens, stamp = state if state else (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * refill_rate)
+    if tokens >= 1:
+        return True, (tokens - 1, now), 0
+    return False, (tokens, now), (1 - tokens) / refill_rate
+
+
+def _consume_redis(cache, key, capacity, refill_rate, now):
+    """Take a token from a bucket in a Redis cache with one script call"""
+    global _script
+    client = cache._cache.get_client(key, write=True)
+    if _script is None:
+        _script = client.register_script(_TOKEN_BUCKET_LUA)
+    allowed, tokens = _script(keys=[cache.make_key(key)], args=[capacity, refill_rate, now], client=client)
+    return bool(allowed), 0 if allowed else (1 - float(tokens)) / refill_rate
+
+
+def consume(key, rate):
+    """
+    Take one token from the bucket stored under key.
+    Returns (allowed, seconds until the next token).
+
+    When the 'ratelimit' cache is Redis, buckets live there, shared across
+    workers and updated atomically by a Lua script. Otherwise, or while
+    Redis cannot be reached, each process keeps its own buckets, so a cache
+    outage never blocks payments outright.
+    """
+    capacity, refill_rate = parse_rate(rate)
+    now = time.time()
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    if isinstance(cache, RedisCache):
+        try:
+            return _consume_redis(cache, key, capacity, refill_rate, now)
+        except (redis.ConnectionError, redis.TimeoutError):
+            pass
+    with _local_lock:
+        allowed, _local_buckets[key], wait = _take(_local_buckets.get(key), capacity, refill_rate, now)
+        _local_buckets.move_to_end(key)
+        if len(_local_buckets) > LOCAL_BUCKET_LIMIT:
+            _local_buckets.popitem(last=False)
+    return allowed, wait
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle backed by a token bucket; rates come from settings.RATE_LIMITS[scope]"""
+    scope = None
+    kind = None
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        rate = settings.RATE_LIMITS.get(self.scope, {}).get(self.kind)
+        if not rate:
+            return True
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        allowed, self._wait = consume(f'rl:{self.scope}:{self.kind}:{ident}', rate)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    kind = 'user'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    kind = 'ip'
+
+    def get_ident_key(self, request):
+        # Payments made through the processor's /pay all arrive from its address;
+        # it has already applied the per-IP limit to the real client
+        if IsPaymentProcessor().has_permission(request, None):
+            return None
+        # Trusts only the X-Forwarded-For entries added by REST_FRAMEWORK['NUM_PROXIES'] proxies
+        return self.get_ident(request)
+
+
+class GlobalRateThrottle(TokenBucketThrottle):
+    kind = 'global'
+
+    def get_ident_key(self, request):
+        return 'all'
+
+
+def throttles_for(scope):
+    """Build the user, IP and global throttle classes for a scope"""
+    return [
+        type(f'{kind.__name__}_{scope}', (kind,), {'scope': scope})
+        for kind in (UserRateThrottle, IPRateThrottle, GlobalRateThrottle)
+    ]
@@ -14,13 +14,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
+from authentication.views import overview_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/auth/', include('authentication.urls')),
+    path('api/me/overview/', overview_view, name='overview'),
     path('api/cards/', include('cards.urls')),
     path('api/transactions/', include('transactions.urls')),
+    path('api/webhooks/', include('webhooks.urls')),
     path('api/admin-panel/', include('admin_panel.urls')),
 ]
+
+# The API-only profile (admin/settings_api.py) leaves the admin site out
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "admin.settings")
 
 application = get_wsgi_application()
+
+# Refuse to serve with a DB_SHARDS other than the one the data was sharded with
+from admin.sharding import check_shard_count  # noqa: E402
+
+check_shard_count()
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from admin_panel import timeseries
+from admin_panel.models import OutcomeRollup
+
+
+class Command(BaseCommand):
+    help = 'Fold old per-minute outcome rollups into hourly ones and drop rollups past retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minute-hours', type=float, default=48,
+                            help='Keep per-minute rows this many hours before folding them into hours')
+        parser.add_argument('--retention-days', type=float, default=400,
+                            help='Delete rollups older than this')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        hours = timeseries.compact(now - timedelta(hours=options['minute_hours']))
+        deleted, _ = OutcomeRollup.objects.filter(bucket__lt=now - timedelta(days=options['retention_days'])).delete()
+        self.stdout.write(f'Folded {hours} hours of minute rollups; deleted {deleted} rollups past retention')
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Apply migrations to the default database and every shard (see admin/sharding.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', action='append', dest='shards', choices=settings.SHARD_ALIASES,
+                            help='Only migrate this alias (repeatable)')
+
+    def handle(self, *args, **options):
+        for alias in options['shards'] or settings.SHARD_ALIASES:
+            self.stdout.write(f'Migrating {alias}')
+            connection = connections[alias]
+            if alias != 'default' and connection.vendor == 'mysql':
+                # The initial migrations reference the users table, which only default has;
+                # later migrations drop those foreign keys
+                with connection.cursor() as cursor:
+                    cursor.execute('SET SESSION foreign_key_checks = 0')
+            call_command('migrate', database=alias, interactive=False, verbosity=options['verbosity'])
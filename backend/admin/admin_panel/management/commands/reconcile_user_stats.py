@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from admin.sharding import group_by_shard, shard_for_user
+from admin_panel.models import UserSpend, UserStats
+from admin_panel.stats import compute_stats_bulk, replace_spend
+
+User = get_user_model()
+
+STAT_FIELDS = ('card_count', 'pending_count', 'success_count', 'failed_count',
+               'last_transaction_at')
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user stats from cards and transactions and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, action='append', dest='user_ids',
+                            help='Only reconcile this user (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        checked = repaired = created = 0
+
+        users = User.objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+
+        last_id = 0
+        while True:
+            user_ids = list(users.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+
+            for shard, shard_user_ids in group_by_shard(user_ids, shard_for_user).items():
+                with db_transaction.atomic(using=shard):
+                    # Lock the stats rows first so concurrent deltas queue behind the rewrite
+                    existing = UserStats.objects.using(shard).select_for_update().in_bulk(shard_user_ids)
+                    expected, spend = compute_stats_bulk(shard_user_ids)
+                    current_spend = {user_id: set() for user_id in shard_user_ids}
+                    for user_id, *group in (UserSpend.objects.using(shard).filter(user_id__in=shard_user_ids)
+                                            .values_list('user_id', 'currency', 'day', 'amount')):
+                        if group[2]:
+                            current_spend[user_id].add(tuple(group))
+                    for user_id in shard_user_ids:
+                        checked += 1
+                        values = expected[user_id]
+                        current = existing.get(user_id)
+                        if current is None:
+                            created += 1
+                            if not dry_run:
+                                UserStats.objects.using(shard).create(user_id=user_id, **values)
+                                replace_spend(shard, user_id, spend[user_id])
+                            continue
+                        spend_drift = current_spend[user_id] != set(spend[user_id])
+                        if spend_drift or any(getattr(current, field) != values[field] for field in STAT_FIELDS):
+                            repaired += 1
+                            self.stdout.write(f'Drift for user {user_id}')
+                            if not dry_run:
+                                UserStats.objects.using(shard).filter(user_id=user_id).update(**values)
+                                if spend_drift:
+                                    replace_spend(shard, user_id, spend[user_id])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} users: {repaired} repaired, {created} created'
+            + (' (dry run)' if dry_run else '')
+        ))
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from admin_panel import seeding
+
+
+class Command(BaseCommand):
+    help = 'Generate deterministic synthetic users, cards and transactions for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--transactions', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=365, help='Transactions span this many days up to now')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Parallel worker processes (forced to 1 on SQLite)')
+        parser.add_argument('--chunk-size', type=int, default=20000,
+                            help='Rows per unit of work; part of the output, so keep it fixed between runs')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT statement')
+        parser.add_argument('--method', choices=['auto', 'insert', 'load-data'], default='auto',
+                            help='insert: multi-row INSERTs; load-data: MySQL LOAD DATA LOCAL INFILE; '
+                                 'auto: load-data on MySQL, insert elsewhere')
+        parser.add_argument('--password', default='password123', help='Password shared by every seeded user')
+        parser.add_argument('--skip-stats', action='store_true', help='Leave user_stats to be built lazily')
+
+    def handle(self, *args, **options):
+        method = options['method']
+        if method == 'auto':
+            method = 'load-data' if connection.vendor == 'mysql' else 'insert'
+        if method == 'load-data' and connection.vendor != 'mysql':
+            raise CommandError('--method load-data needs MySQL')
+        workers = options['workers'] if connection.vendor != 'sqlite' else 1
+
+        started = time.monotonic()
+        plan = seeding.Plan(options['users'], options['transactions'], options['days'], options['seed'],
+                            options['chunk_size'], timezone.now())
+        seeding.set_plan(plan)
+        self.stdout.write(
+            f'Seeding {plan.users} users (ids after {plan.user_base}), {plan.cards} cards and '
+            f'{plan.transactions} transactions with {workers} workers via {method}'
+        )
+        # Hashing is deliberately slow, so every seeded user shares one hash
+        password_hash = make_password(options['password'])
+        batch_size = options['batch_size']
+
+        phases = [
+            ('users and cards', seeding.seed_users_and_cards,
+             [(chunk, method, batch_size, password_hash) for chunk in range(plan.user_chunks())]),
+            ('transactions', seeding.seed_transactions,
+             [(chunk, method, batch_size) for chunk in range(plan.transaction_chunks())]),
+        ]
+        if not options['skip_stats']:
+            phases.append(('user stats', seeding.seed_stats,
+                           [(chunk, method, batch_size) for chunk in range(plan.user_chunks())]))
+
+        for name, func, tasks in phases:
+            phase_started = time.monotonic()
+            self.run_phase(func, tasks, workers)
+            self.stdout.write(f'  {name}: {len(tasks)} chunks in {time.monotonic() - phase_started:.1f}s')
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.monotonic() - started:.1f}s'))
+
+    def run_phase(self, func, tasks, workers):
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                func(*task)
+            return
+        # Children inherit the plan through fork; they must not share the parent's DB connection
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers, initializer=connections.close_all) as pool:
+            pool.starmap(func, tasks, chunksize=1)
@@ -0,0 +1,66 @@
+import os
+import re
+import subprocess
+import sys
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before it can serve its first request: set up the apps,
+# build the middleware chain and import every view through the URLconf
+BOOT = (
+    'import django; django.setup(); '
+    'from django.core.handlers.wsgi import WSGIHandler; WSGIHandler(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def import_times(settings_module):
+    """{module: (self_us, cumulative_us, depth)} from one `python -X importtime` boot in a fresh process"""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise CommandError(f'Boot with {settings_module} failed:\n{result.stderr[-2000:]}')
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            times[module] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return times
+
+
+class Command(BaseCommand):
+    help = 'Report per-module import time of a cold worker boot (settings, apps, middleware, URLconf)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', dest='settings_module',
+                            help='Settings module to boot (default: the current one), e.g. admin.settings_api')
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Boots to measure; each module keeps its fastest time')
+        parser.add_argument('--top', type=int, default=25)
+        parser.add_argument('--sort', choices=('cumulative', 'self'), default='cumulative')
+        parser.add_argument('--budget-ms', type=float,
+                            help='Fail if the total import time exceeds this (for CI)')
+
+    def handle(self, *args, **options):
+        settings_module = options['settings_module'] or os.environ['DJANGO_SETTINGS_MODULE']
+        best = {}
+        for _ in range(max(options['runs'], 1)):
+            for module, (self_us, cumulative_us, depth) in import_times(settings_module).items():
+                if module not in best or cumulative_us < best[module][1]:
+                    best[module] = (self_us, cumulative_us, depth)
+
+        total_ms = sum(cumulative for _, cumulative, depth in best.values() if depth == 0) / 1000
+        column = 1 if options['sort'] == 'cumulative' else 0
+        ranked = sorted(best.items(), key=lambda item: item[1][column], reverse=True)
+
+        self.stdout.write(f'{settings_module}: {len(best)} modules, {total_ms:.1f} ms of imports')
+        self.stdout.write(f'{"self ms":>9} {"cumul ms":>9}  module')
+        for module, (self_us, cumulative_us, depth) in ranked[:options['top']]:
+            self.stdout.write(f'{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {"  " * depth}{module}')
+
+        budget = options['budget_ms']
+        if budget is not None and total_ms > budget:
+            raise CommandError(f'Import time {total_ms:.1f} ms exceeds the {budget:.1f} ms budget')
@@ -0,0 +1,108 @@
+"""
+Substring indexes for the admin search (admin_panel/search.py).
+
+MySQL gets InnoDB FULLTEXT indexes with the ngram parser. SQLite, used for
+tests and local runs, gets external-content FTS5 tables with the trigram
+tokenizer, kept in step with their source table by triggers, plus NOCASE
+indexes so its case-insensitive LIKE prefix matches can use an index (MySQL's
+default collation already does). Other databases get nothing and the search
+falls back to unindexed icontains.
+
+Tables the router keeps off a database (users on a shard) are skipped. The
+SQLite statements are idempotent so 0003 can re-run them after rebuilding
+tables, which drops their triggers and expression indexes.
+"""
+from django.db import migrations, router
+
+# table: columns searched by substring
+FULLTEXT = {
+    'users': ('username', 'email'),
+    'cards': ('card_holder_name',),
+    'transactions': ('description',),
+}
+
+# table: columns searched by prefix (SQLite only)
+NOCASE = {
+    'users': ('username', 'email'),
+    'cards': ('card_holder_name',),
+}
+
+
+def mysql_statements(table, columns):
+    return [f"ALTER TABLE {table} ADD FULLTEXT INDEX {table}_search_ft ({', '.join(columns)}) WITH PARSER ngram"]
+
+
+def sqlite_statements(table, columns):
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    fts = f'{table}_fts'
+    delete = f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});"
+    insert = f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, content='{table}', content_rowid='id', "
+        f"tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def migrated_tables(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    return {model._meta.db_table for model in apps.get_models() if router.allow_migrate_model(alias, model)}
+
+
+def create_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    tables = migrated_tables(apps, schema_editor)
+    for table, columns in FULLTEXT.items():
+        if table not in tables:
+            continue
+        if vendor == 'mysql':
+            statements = mysql_statements(table, columns)
+        elif vendor == 'sqlite':
+            statements = sqlite_statements(table, columns)
+        else:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    if vendor == 'sqlite':
+        for table, columns in NOCASE.items():
+            if table not in tables:
+                continue
+            for column in columns:
+                schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column}_nocase ON {table} ({column} COLLATE NOCASE)')
+
+
+def drop_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    tables = migrated_tables(apps, schema_editor)
+    for table in FULLTEXT:
+        if table not in tables:
+            continue
+        if vendor == 'mysql':
+            schema_editor.execute(f'ALTER TABLE {table} DROP INDEX {table}_search_ft')
+        elif vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+    if vendor == 'sqlite':
+        for table, columns in NOCASE.items():
+            for column in columns:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_nocase')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0001_initial'),
+        ('authentication', '0002_revokedtoken'),
+        ('cards', '0004_search_indexes'),
+        ('transactions', '0005_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext, drop_fulltext),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-19 10:10
+
+import importlib
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+search_fulltext = importlib.import_module('admin_panel.migrations.0002_search_fulltext')
+
+
+def restore_search_objects(apps, schema_editor):
+    """SQLite rebuilds a table to alter a column, dropping the search triggers and NOCASE indexes on it"""
+    if schema_editor.connection.vendor == 'sqlite':
+        search_fulltext.create_fulltext(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('admin_panel', '0002_search_fulltext'),
+        ('cards', '0005_user_db_constraint'),
+        ('transactions', '0006_user_db_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userstats',
+            name='user',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(restore_search_objects, migrations.RunPython.noop),
+    ]
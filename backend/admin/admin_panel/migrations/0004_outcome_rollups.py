@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-19 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0003_user_db_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutcomeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('resolution', models.PositiveIntegerField(default=60)),
+                ('status', models.CharField(max_length=20)),
+                ('currency', models.CharField(max_length=3)),
+                ('card_type', models.CharField(max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('timed_count', models.PositiveIntegerField(default=0)),
+                ('latency_ms_sum', models.FloatField(default=0)),
+                ('latency_ms_max', models.FloatField(default=0)),
+            ],
+            options={
+                'db_table': 'outcome_rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='outcomerollup',
+            constraint=models.UniqueConstraint(fields=('bucket', 'resolution', 'status', 'currency', 'card_type'), name='outcome_rollup_key'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2 on 2026-10-19 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+BACKFILL_BATCH = 5000
+
+
+def backfill_user_spend(apps, schema_editor):
+    """Group this database's SUCCESS transactions into per-user (currency, day) spend rows"""
+    using = schema_editor.connection.alias
+    if using not in settings.SHARD_ALIASES:
+        return
+    Transaction = apps.get_model('transactions', 'Transaction')
+    UserSpend = apps.get_model('admin_panel', 'UserSpend')
+    groups = (Transaction.objects.using(using).filter(status='SUCCESS')
+              .order_by()
+              .annotate(day=TruncDate('transaction_date'))
+              .values_list('user_id', 'currency', 'day')
+              .annotate(Sum('amount')))
+    batch = []
+    for user_id, currency, day, amount in groups.iterator(chunk_size=BACKFILL_BATCH):
+        batch.append(UserSpend(user_id=user_id, currency=currency, day=day, amount=amount))
+        if len(batch) == BACKFILL_BATCH:
+            UserSpend.objects.using(using).bulk_create(batch)
+            batch = []
+    UserSpend.objects.using(using).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('admin_panel', '0004_outcome_rollups'),
+        ('transactions', '0007_settlement_run'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userstats',
+            name='total_spent',
+        ),
+        migrations.CreateModel(
+            name='UserSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('day', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='spend', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'user_spend',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='userspend',
+            constraint=models.UniqueConstraint(fields=('user', 'currency', 'day'), name='user_spend_key'),
+        ),
+        migrations.RunPython(backfill_user_spend, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,83 @@
 from django.db import models
+from django.conf import settings
+from admin.sharding import ShardedManager
 
-# Create your models here.
+class UserStats(models.Model):
+    """Denormalized per-user counters, kept in step with cards and transactions"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='stats',
+                                db_constraint=False)
+    card_count = models.PositiveIntegerField(default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    last_transaction_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        db_table = 'user_stats'
+
+    def __str__(self):
+        return f"Stats for user {self.user_id}"
+
+    @property
+    def transaction_count(self):
+        return self.pending_count + self.success_count + self.failed_count
+
+class UserSpend(models.Model):
+    """
+    A user's SUCCESS total per currency and transaction day, kept with UserStats.
+
+    Amounts stay in their own currency; fx.convert_groups() turns a user's few
+    rows into one total at each day's rate.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='spend',
+                             db_constraint=False)
+    currency = models.CharField(max_length=3)
+    day = models.DateField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        db_table = 'user_spend'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'currency', 'day'], name='user_spend_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.amount} {self.currency} by user {self.user_id} on {self.day}"
+
+class OutcomeRollup(models.Model):
+    """
+    Payment outcomes per time bucket, status, currency and card type.
+
+    Written by admin_panel/timeseries.py and the processor, one additive upsert per
+    key and minute; minute rows are folded into hour rows once they age out.
+    """
+    MINUTE = 60
+    HOUR = 3600
+
+    bucket = models.DateTimeField()
+    resolution = models.PositiveIntegerField(default=MINUTE)
+    status = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3)
+    card_type = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # Outcomes with a processing latency (the processor's decisions, not sweeper expiries)
+    timed_count = models.PositiveIntegerField(default=0)
+    latency_ms_sum = models.FloatField(default=0)
+    latency_ms_max = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'outcome_rollups'
+        constraints = [
+            # Also the index for time range reads, which lead with bucket
+            models.UniqueConstraint(fields=['bucket', 'resolution', 'status', 'currency', 'card_type'],
+                                    name='outcome_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.count} {self.status} {self.currency}/{self.card_type} at {self.bucket}"
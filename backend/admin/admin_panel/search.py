@@ -0,0 +1,161 @@
+"""
+Admin search over users, cards and transactions.
+
+Every lookup is bounded by an index and a LIMIT so typeahead stays fast at
+any table size:
+  - prefix matches walk B-tree indexes (users.username/email,
+    cards.card_holder_name/last_four_digits), one query per column, each
+    ordered by its own index;
+  - substring matches use the full-text indexes from
+    admin_panel/migrations/0002_search_fulltext.py (MySQL ngram FULLTEXT,
+    SQLite FTS5 trigram) and need at least MIN_CONTAINS characters;
+  - numeric queries also match transaction ids and exact amounts.
+Prefix hits are listed first, then substring hits, without duplicates.
+Cards and transactions are searched on every shard at once and each kind of
+hit is interleaved across shards.
+"""
+from decimal import Decimal, InvalidOperation
+from itertools import chain, zip_longest
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Q
+from admin import sharding
+from admin.fastpath import FastSerializer
+from authentication.serializers import UserSerializer
+from cards.models import Card
+from transactions.models import Transaction
+from transactions.serializers import CARD_LISTING, TransactionSerializer
+
+User = get_user_model()
+
+MIN_CONTAINS = 3
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+TRANSACTION_FIELDS = ('id', 'user', 'amount', 'currency', 'status', 'description', 'transaction_date')
+
+# Compiled once, at import
+USER_ROWS = FastSerializer(UserSerializer)
+TRANSACTION_ROWS = FastSerializer(TransactionSerializer, fields=TRANSACTION_FIELDS)
+
+
+def contains_ids(model, columns, query, limit, using='default'):
+    """Ids of rows with query as a substring of any of columns, via the table's full-text index"""
+    table = model._meta.db_table
+    connection = connections[using]
+    vendor = connection.vendor
+    if vendor == 'mysql':
+        # A quoted phrase under the ngram parser matches consecutive n-grams, i.e. the substring
+        phrase = '"' + query.replace('"', ' ') + '"'
+        sql = f"SELECT id FROM {table} WHERE MATCH({', '.join(columns)}) AGAINST (%s IN BOOLEAN MODE) LIMIT %s"
+    elif vendor == 'sqlite':
+        phrase = '"' + query.replace('"', '""') + '"'
+        sql = f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s LIMIT %s"
+    else:
+        condition = Q()
+        for column in columns:
+            condition |= Q(**{f'{column}__icontains': query})
+        return list(model.objects.using(using).filter(condition).values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [phrase, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def prefix_ids(queryset, column, query, limit):
+    return list(queryset.filter(**{f'{column}__istartswith': query})
+                .order_by(column).values_list('id', flat=True)[:limit])
+
+
+def _merge(id_lists, limit):
+    seen = {}
+    for ids in id_lists:
+        for row_id in ids:
+            seen.setdefault(row_id, None)
+    return list(seen)[:limit]
+
+
+def _rows(serializer, queryset, ids):
+    """Serialized rows for ids, in the order of ids"""
+    if not ids:
+        return []
+    by_id = {row['id']: row for row in serializer.serialize(queryset.filter(id__in=ids))}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+
+def _sharded_rows(serializer, model, ids):
+    """_rows() for ids spread over shards (each id names its shard)"""
+    by_id = {}
+    for shard, shard_ids in sharding.group_by_shard(ids).items():
+        by_id.update((row['id'], row) for row in serializer.serialize(model.objects.using(shard).filter(id__in=shard_ids)))
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+
+def _gather(lookups, *args):
+    """Run lookups(alias, *args) -> [ids per kind of hit] on every shard; interleave each kind across shards"""
+    per_shard = sharding.scatter(lookups, *args)
+    return [
+        [row_id for row_id in chain.from_iterable(zip_longest(*kind)) if row_id is not None]
+        for kind in zip(*per_shard)
+    ]
+
+
+def search_users(query, limit, contains):
+    id_lists = [prefix_ids(User.objects, column, query, limit) for column in ('username', 'email')]
+    if contains:
+        id_lists.append(contains_ids(User, ('username', 'email'), query, limit))
+    return _rows(USER_ROWS, User.objects, _merge(id_lists, limit))
+
+
+def _card_ids(using, query, limit, contains):
+    cards = Card.objects.using(using)
+    id_lists = [prefix_ids(cards, 'card_holder_name', query, limit)]
+    if query.isdigit() and len(query) <= 4:
+        id_lists.insert(0, prefix_ids(cards, 'last_four_digits', query, limit))
+    if contains:
+        id_lists.append(contains_ids(Card, ('card_holder_name',), query, limit, using))
+    return id_lists
+
+
+def search_cards(query, limit, contains):
+    id_lists = _gather(_card_ids, query, limit, contains)
+    return _sharded_rows(CARD_LISTING, Card, _merge(id_lists, limit))
+
+
+def _transaction_ids(using, query, limit, contains, amount):
+    transactions = Transaction.objects.using(using)
+    id_lists = []
+    if amount is not None:
+        id_lists.append(list(transactions.filter(amount=amount).order_by().values_list('id', flat=True)[:limit]))
+    if contains:
+        id_lists.append(contains_ids(Transaction, ('description',), query, limit, using))
+    return id_lists
+
+
+def search_transactions(query, limit, contains):
+    id_lists = []
+    if query.isdigit() and len(query) <= 18:
+        # The id itself says which shard to look on
+        id_lists.append(list(Transaction.objects.for_id(int(query)).filter(id=int(query)).values_list('id', flat=True)))
+    try:
+        amount = Decimal(query)
+    except InvalidOperation:
+        amount = None
+    # Bounded by the column's 10 digits, 2 of them decimal
+    if amount is not None and not (amount.is_finite() and abs(amount) < 10 ** 8):
+        amount = None
+    if amount is not None or contains:
+        id_lists += _gather(_transaction_ids, query, limit, contains, amount)
+    return _sharded_rows(TRANSACTION_ROWS, Transaction, _merge(id_lists, limit))
+
+
+SEARCHES = {
+    'users': search_users,
+    'cards': search_cards,
+    'transactions': search_transactions,
+}
+
+
+def search(query, types, limit, mode='contains'):
+    """{type: rows} for each requested type; mode 'prefix' skips the substring lookups"""
+    contains = mode == 'contains' and len(query) >= MIN_CONTAINS
+    return {name: SEARCHES[name](query, limit, contains) for name in types}
@@ -0,0 +1,332 @@
+"""
+Synthetic users, cards and transactions for scale testing (see seed_scale).
+
+Everything is derived from the seed and row ids, never from worker order:
+card counts and card numbers come from a hash of the id, and each chunk of
+rows draws from its own Random(seed, phase, chunk). The same arguments
+therefore produce the same data whatever the number of workers.
+
+Rows are written with raw multi-row INSERTs (executemany) or, on MySQL,
+LOAD DATA LOCAL INFILE from a temporary TSV file, skipping model
+instantiation entirely.
+
+With sharding, cards and transactions are numbered as if there were one
+database and the n-th row owned by a user on shard i gets id
+shard_id(i, n), so every shard's rows stay inside its id range.
+"""
+import bisect
+import itertools
+import math
+import os
+import random
+import tempfile
+from array import array
+from datetime import datetime, timedelta
+from functools import lru_cache
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction as db_transaction
+from admin.sharding import aliases, local_id, shard_for_user, shard_id, shard_index_for_user
+from cards.models import Card
+from transactions.models import Transaction
+from .models import UserSpend, UserStats
+from .stats import compute_stats_bulk
+
+User = get_user_model()
+
+MASK64 = (1 << 64) - 1
+
+FIRST_NAMES = ['James', 'Mary', 'Aarav', 'Priya', 'Wei', 'Mei', 'Carlos', 'Sofia', 'Liam', 'Emma',
+               'Noah', 'Olivia', 'Mohammed', 'Fatima', 'Hiroshi', 'Yuki', 'Lucas', 'Chloe', 'Ivan', 'Anya']
+LAST_NAMES = ['Smith', 'Johnson', 'Patel', 'Sharma', 'Wang', 'Li', 'Garcia', 'Rossi', 'Brown', 'Martin',
+              'Khan', 'Ali', 'Tanaka', 'Sato', 'Silva', 'Dubois', 'Petrov', 'Novak', 'Kim', 'Nguyen']
+
+# Cards per user, as cumulative percentages for 0, 1, 2, 3, 4 cards
+CARD_COUNT_CUTOFFS = (8, 54, 82, 95, 100)
+# (cumulative percentage, IIN prefixes, length)
+BRANDS = (
+    (52, ('4',), 16),                                # Visa
+    (85, ('51', '52', '53', '54', '55', '2221'), 16),  # Mastercard
+    (95, ('34', '37'), 15),                          # Amex
+    (100, ('6011', '65'), 16),                       # Discover
+)
+CURRENCIES = ('USD', 'EUR', 'GBP', 'INR')
+CURRENCY_WEIGHTS = (60, 18, 12, 10)
+# Rough units per USD so amounts look plausible in each currency
+CURRENCY_SCALE = {'USD': 1.0, 'EUR': 0.92, 'GBP': 0.79, 'INR': 83.0}
+# Relative activity by hour of day (UTC)
+HOUR_WEIGHTS = (2, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 10, 11, 11, 10, 10, 10, 11, 12, 12, 11, 9, 6, 4)
+DESCRIPTIONS = ('', '', '', 'Online purchase', 'Subscription', 'Groceries', 'Travel booking', 'Utility bill')
+
+
+def _mix(x):
+    """splitmix64 finalizer: a cheap, well-distributed hash of an integer"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def luhn_check_digit(partial):
+    total = 0
+    for i, ch in enumerate(reversed(partial)):
+        digit = ord(ch) - 48
+        if i % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str(-total % 10)
+
+
+def card_count(user_id, seed):
+    roll = _mix(user_id ^ _mix(seed)) % 100
+    for count, cutoff in enumerate(CARD_COUNT_CUTOFFS):
+        if roll < cutoff:
+            return count
+    return 0
+
+
+@lru_cache(maxsize=1 << 18)
+def card_details(card_id, seed):
+    """(card_type, last four digits, full Luhn-valid number) for a card id"""
+    h = _mix(card_id ^ _mix(seed + 1))
+    roll = h % 100
+    for cutoff, prefixes, length in BRANDS:
+        if roll < cutoff:
+            break
+    prefix = prefixes[(h >> 8) % len(prefixes)]
+    body = str(_mix(h)).zfill(20) + str(h).zfill(20)
+    partial = prefix + body[:length - len(prefix) - 1]
+    number = partial + luhn_check_digit(partial)
+    return Card.detect_card_type(number), number[-4:], number
+
+
+class Plan:
+    """Id ranges and per-user card layout shared by all workers (inherited through fork)"""
+
+    def __init__(self, users, transactions, days, seed, chunk_size, end):
+        self.users = users
+        self.transactions = transactions
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.end = end
+        self.start = end - timedelta(days=days)
+        self.user_base = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+        self.card_base = max(self._last_local_id(Card, alias) for alias in aliases())
+        self.txn_base = max(self._last_local_id(Transaction, alias) for alias in aliases())
+
+        # first_card[i] is the id before user i's first card; user i owns first_card[i]+1 .. first_card[i+1]
+        self.first_card = array('q', [self.card_base])
+        self.active = array('q')
+        next_card = self.card_base
+        for index in range(users):
+            count = card_count(self.user_base + index + 1, seed)
+            if count:
+                self.active.append(index)
+            next_card += count
+            self.first_card.append(next_card)
+        self.cards = next_card - self.card_base
+
+    @staticmethod
+    def _last_local_id(model, using):
+        return local_id(model.objects.using(using).order_by('-id').values_list('id', flat=True).first() or 0)
+
+    def user_chunks(self):
+        return math.ceil(self.users / self.chunk_size)
+
+    def transaction_chunks(self):
+        return math.ceil(self.transactions / self.chunk_size) if self.active else 0
+
+
+_plan = None
+
+
+def set_plan(plan):
+    global _plan
+    _plan = plan
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _stamp(seconds):
+    """Epoch seconds as naive UTC text, accepted by both MySQL and SQLite datetime columns"""
+    return (EPOCH + timedelta(seconds=seconds)).isoformat(' ')
+
+
+USER_COLUMNS = ('id', 'password', 'last_login', 'is_superuser', 'username', 'email',
+                'first_name', 'last_name', 'is_active', 'is_staff', 'date_joined')
+CARD_COLUMNS = ('id', 'user_id', 'card_type', 'masked_number', 'last_four_digits',
+                'card_holder_name', 'expiry_month', 'expiry_year', 'expires_on', 'fingerprint', 'created_at')
+TRANSACTION_COLUMNS = ('id', 'user_id', 'card_id', 'amount', 'currency', 'status',
+                       'payment_method', 'description', 'transaction_date', 'updated_at')
+STATS_COLUMNS = ('user_id', 'card_count', 'pending_count', 'success_count', 'failed_count',
+                 'last_transaction_at', 'updated_at')
+SPEND_COLUMNS = ('user_id', 'currency', 'day', 'amount')
+
+
+def write_rows(model, columns, rows, method, batch_size, using='default'):
+    """Insert row tuples for `columns` into the model's table"""
+    if not rows:
+        return
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column_list = ', '.join(connection.ops.quote_name(column) for column in columns)
+    if method == 'load-data':
+        _load_data(connection, table, column_list, rows)
+        return
+    sql = f"INSERT INTO {table} ({column_list}) VALUES ({', '.join(['%s'] * len(columns))})"
+    with db_transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def _load_data(connection, table, column_list, rows):
+    """MySQL LOAD DATA LOCAL INFILE through a connection opened with local_infile enabled"""
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False) as f:
+        for row in rows:
+            f.write('\t'.join(r'\N' if value is None else str(value) for value in row))
+            f.write('\n')
+        path = f.name
+    try:
+        raw = connection.get_new_connection({**connection.get_connection_params(), 'local_infile': True})
+        try:
+            cursor = raw.cursor()
+            cursor.execute('SET SESSION foreign_key_checks = 0, unique_checks = 0')
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+                f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({column_list})",
+                (path,)
+            )
+            raw.commit()
+        finally:
+            raw.close()
+    finally:
+        os.unlink(path)
+
+
+def write_sharded_rows(model, columns, rows_by_shard, method, batch_size):
+    for using, rows in rows_by_shard.items():
+        write_rows(model, columns, rows, method, batch_size, using)
+
+
+def seed_users_and_cards(chunk, method, batch_size, password_hash):
+    """Write one chunk of users and their cards; returns (users, cards) written"""
+    plan = _plan
+    rng = random.Random(f'{plan.seed}:users:{chunk}')
+    first = chunk * plan.chunk_size
+    last = min(first + plan.chunk_size, plan.users)
+    span = (plan.start - timedelta(days=365)).timestamp(), plan.start.timestamp()
+    this_year = plan.end.year
+
+    users = []
+    cards = {}
+    for index in range(first, last):
+        user_id = plan.user_base + index + 1
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        joined = rng.uniform(*span)
+        # Booleans as 0/1 so they survive the TSV path too
+        users.append((user_id, password_hash, None, 0, f'user{user_id}', f'user{user_id}@example.com',
+                      first_name, last_name, 1, 0, _stamp(joined)))
+        holder = f'{first_name} {last_name}'.upper()
+        shard = shard_index_for_user(user_id)
+        user_cards = cards.setdefault(aliases()[shard], [])
+        for card_id in range(plan.first_card[index] + 1, plan.first_card[index + 1] + 1):
+            card_type, last_four, number = card_details(card_id, plan.seed)
+            created = joined + rng.uniform(60, 30 * 86400)
+            # Mostly valid cards, with some already expired for expiry scans
+            month, year = rng.randint(1, 12), this_year + rng.randint(-1, 5)
+            user_cards.append((shard_id(shard, card_id), user_id, card_type, Card.mask_card_number(number),
+                               last_four, holder, f'{month:02d}', str(year), Card.expiry_date(month, year).isoformat(),
+                               Card.fingerprint_for(number), _stamp(created)))
+
+    write_rows(User, USER_COLUMNS, users, method, batch_size)
+    write_sharded_rows(Card, CARD_COLUMNS, cards, method, batch_size)
+    return len(users), sum(len(rows) for rows in cards.values())
+
+
+def seed_transactions(chunk, method, batch_size):
+    """
+    Write one chunk of transactions. Chunk k covers the k-th slice of the time
+    range and its ids are assigned in time order, so ids grow with
+    transaction_date as they do in production.
+    """
+    plan = _plan
+    rng = random.Random(f'{plan.seed}:transactions:{chunk}')
+    first = chunk * plan.chunk_size
+    last = min(first + plan.chunk_size, plan.transactions)
+    total_seconds = (plan.end - plan.start).total_seconds()
+    slice_start = plan.start.timestamp() + total_seconds * first / plan.transactions
+    slice_end = plan.start.timestamp() + total_seconds * last / plan.transactions
+    now = plan.end.timestamp()
+    max_weight = max(HOUR_WEIGHTS)
+    currency_cutoffs = list(itertools.accumulate(w / sum(CURRENCY_WEIGHTS) for w in CURRENCY_WEIGHTS))[:-1]
+
+    times = []
+    while len(times) < last - first:
+        moment = rng.uniform(slice_start, slice_end)
+        # Thin out quiet hours so volume follows the daily cycle
+        if rng.random() * max_weight < HOUR_WEIGHTS[int(moment // 3600) % 24]:
+            times.append(moment)
+    times.sort()
+
+    active = plan.active
+    stride = 2654435761 % len(active) or 1
+    while math.gcd(stride, len(active)) != 1:
+        stride += 1
+
+    rows = {}
+    for offset, moment in enumerate(times):
+        # A few heavy users and a long tail: skew the rank, then scatter it over users
+        rank = int(len(active) * rng.random() ** 1.5)
+        index = active[(rank * stride) % len(active)]
+        user_id = plan.user_base + index + 1
+        first_card = plan.first_card[index]
+        card_id = first_card + 1 + int(rng.random() * (plan.first_card[index + 1] - first_card))
+        card_type, last_four, _ = card_details(card_id, plan.seed)
+
+        currency = CURRENCIES[bisect.bisect(currency_cutoffs, rng.random())]
+        amount = min(max(rng.lognormvariate(3.4, 1.1), 1.0), 5000.0) * CURRENCY_SCALE[currency]
+        age = now - moment
+        roll = rng.random()
+        if age < 600:
+            status = 'PENDING' if roll < 0.6 else ('SUCCESS' if roll < 0.9 else 'FAILED')
+        else:
+            status = 'SUCCESS' if roll < 0.86 else ('FAILED' if roll < 0.985 else 'PENDING')
+        updated = moment if status == 'PENDING' else moment + rng.uniform(0.5, 3)
+
+        shard = shard_index_for_user(user_id)
+        rows.setdefault(aliases()[shard], []).append((
+            shard_id(shard, plan.txn_base + first + offset + 1), user_id, shard_id(shard, card_id),
+            f'{amount:.2f}', currency, status, f'{card_type} - {last_four}', rng.choice(DESCRIPTIONS),
+            _stamp(moment), _stamp(updated)
+        ))
+
+    write_sharded_rows(Transaction, TRANSACTION_COLUMNS, rows, method, batch_size)
+    return sum(len(shard_rows) for shard_rows in rows.values())
+
+
+def seed_stats(chunk, method, batch_size):
+    """Build user_stats and user_spend rows for one chunk of seeded users from the written data"""
+    plan = _plan
+    first = plan.user_base + chunk * plan.chunk_size + 1
+    user_ids = list(range(first, first + min(plan.chunk_size, plan.users - chunk * plan.chunk_size)))
+    now = _stamp(plan.end.timestamp())
+    rows = {}
+    spend_rows = {}
+    for start in range(0, len(user_ids), 1000):
+        results, spend = compute_stats_bulk(user_ids[start:start + 1000])
+        for user_id, values in results.items():
+            last = values['last_transaction_at']
+            shard = shard_for_user(user_id)
+            rows.setdefault(shard, []).append((
+                user_id, values['card_count'], values['pending_count'], values['success_count'],
+                values['failed_count'], _stamp(last.timestamp()) if last else None, now
+            ))
+            spend_rows.setdefault(shard, []).extend(
+                (user_id, currency, day.isoformat(), str(amount)) for currency, day, amount in spend[user_id]
+            )
+    write_sharded_rows(UserStats, STATS_COLUMNS, rows, method, batch_size)
+    write_sharded_rows(UserSpend, SPEND_COLUMNS, spend_rows, method, batch_size)
+    return sum(len(shard_rows) for shard_rows in rows.values())
@@ -0,0 +1,178 @@
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from admin.sharding import group_by_shard, shard_for_user
+from cards.models import Card
+from transactions.models import Transaction
+from .models import UserSpend, UserStats
+
+STATUS_FIELDS = {
+    'PENDING': 'pending_count',
+    'SUCCESS': 'success_count',
+    'FAILED': 'failed_count',
+}
+
+
+def spend_day(transaction_date):
+    """The day a transaction's amount is counted under, as TruncDate('transaction_date') gives it"""
+    return timezone.localdate(transaction_date)
+
+
+def _compute_shard(results, spend, shard, user_ids):
+    """Fill in results and spend for users whose rows live on one shard"""
+    card_rows = (Card.objects.using(shard).filter(user_id__in=user_ids)
+                 .order_by()
+                 .values('user_id')
+                 .annotate(count=Count('id')))
+    for row in card_rows:
+        results[row['user_id']]['card_count'] = row['count']
+
+    txn_rows = (Transaction.objects.using(shard).filter(user_id__in=user_ids)
+                .order_by()
+                .values('user_id', 'status')
+                .annotate(count=Count('id'), last=Max('transaction_date')))
+    for row in txn_rows:
+        values = results[row['user_id']]
+        field = STATUS_FIELDS.get(row['status'])
+        if field:
+            values[field] = row['count']
+        if values['last_transaction_at'] is None or row['last'] > values['last_transaction_at']:
+            values['last_transaction_at'] = row['last']
+
+    spend_rows = (Transaction.objects.using(shard).filter(user_id__in=user_ids, status='SUCCESS')
+                  .order_by()
+                  .annotate(day=TruncDate('transaction_date'))
+                  .values_list('user_id', 'currency', 'day')
+                  .annotate(Sum('amount')))
+    for user_id, currency, day, amount in spend_rows:
+        spend[user_id].append((currency, day, amount))
+
+
+def compute_stats_bulk(user_ids):
+    """
+    Compute stats for several users from the source tables with grouped queries.
+    Returns ({user_id: UserStats values}, {user_id: [(currency, day, SUCCESS amount)]}).
+    """
+    results = {}
+    spend = {}
+    for user_id in user_ids:
+        values = {field: 0 for field in STATUS_FIELDS.values()}
+        values.update(card_count=0, last_transaction_at=None)
+        results[user_id] = values
+        spend[user_id] = []
+
+    for shard, shard_user_ids in group_by_shard(user_ids, shard_for_user).items():
+        _compute_shard(results, spend, shard, shard_user_ids)
+    return results, spend
+
+
+def compute_stats(user_id):
+    """Compute stats and spend for a user from the source tables"""
+    results, spend = compute_stats_bulk([user_id])
+    return results[user_id], spend[user_id]
+
+
+def replace_spend(using, user_id, groups):
+    """Make the user's spend rows exactly `groups`; call inside an atomic block on the user's shard"""
+    UserSpend.objects.using(using).filter(user_id=user_id).delete()
+    UserSpend.objects.using(using).bulk_create([
+        UserSpend(user_id=user_id, currency=currency, day=day, amount=amount) for currency, day, amount in groups
+    ])
+
+
+def rebuild(user_id):
+    """Recompute and store stats and spend for a user"""
+    shard = shard_for_user(user_id)
+    values, groups = compute_stats(user_id)
+    with db_transaction.atomic(using=shard):
+        stats, _ = UserStats.objects.using(shard).update_or_create(user_id=user_id, defaults=values)
+        replace_spend(shard, user_id, groups)
+    return stats
+
+
+def spend_groups(user_id):
+    """The user's SUCCESS totals as (currency, day, amount) groups, for fx.convert_groups()"""
+    return list(UserSpend.objects.for_user(user_id).filter(user_id=user_id).values_list('currency', 'day', 'amount'))
+
+
+def get_stats(user_id):
+    """Return the stats row for a user, building it on first access"""
+    try:
+        return UserStats.objects.for_user(user_id).get(user_id=user_id)
+    except UserStats.DoesNotExist:
+        return rebuild(user_id)
+
+
+def _add_spend(using, user_id, groups, sign):
+    """Add (or with sign=-1 take away) (currency, day, amount) groups to the user's spend rows"""
+    for currency, day, amount in groups:
+        if not amount:
+            continue
+        delta = sign * amount
+        rows = UserSpend.objects.using(using).filter(user_id=user_id, currency=currency, day=day)
+        if rows.update(amount=F('amount') + delta):
+            continue
+        try:
+            with db_transaction.atomic(using=using):
+                UserSpend.objects.using(using).create(user_id=user_id, currency=currency, day=day, amount=delta)
+        except IntegrityError:
+            # Another writer created the row first
+            rows.update(amount=F('amount') + delta)
+
+
+def _apply(user_id, spend=(), spend_sign=1, **changes):
+    """Apply F() deltas (and spend groups) in single UPDATEs, falling back to a full rebuild"""
+    shard = shard_for_user(user_id)
+    changes['updated_at'] = timezone.now()
+    with db_transaction.atomic(using=shard):
+        if UserStats.objects.using(shard).filter(user_id=user_id).update(**changes):
+            _add_spend(shard, user_id, spend, spend_sign)
+            return
+    # No row yet: the source tables already include this change
+    rebuild(user_id)
+
+
+def card_added(user_id):
+    _apply(user_id, card_count=F('card_count') + 1)
+
+
+def card_removed(user_id, status_counts, success_groups):
+    """Account for a deleted card and the transactions cascaded with it; success_groups as fx.currency_day_totals()"""
+    changes = {'card_count': F('card_count') - 1}
+    for txn_status, count in status_counts.items():
+        field = STATUS_FIELDS.get(txn_status)
+        if field and count:
+            changes[field] = F(field) - count
+    if any(status_counts.values()):
+        changes['last_transaction_at'] = (Transaction.objects.for_user(user_id).filter(user_id=user_id)
+                                          .order_by('-transaction_date')
+                                          .values_list('transaction_date', flat=True)
+                                          .first())
+    _apply(user_id, spend=success_groups, spend_sign=-1, **changes)
+
+
+def transaction_created(user_id, txn_status, amount, created_at, currency):
+    changes = {STATUS_FIELDS[txn_status]: F(STATUS_FIELDS[txn_status]) + 1}
+    changes['last_transaction_at'] = created_at
+    spend = [(currency, spend_day(created_at), amount)] if txn_status == 'SUCCESS' else ()
+    _apply(user_id, spend=spend, **changes)
+
+
+def status_changed(user_id, old_status, new_status, spend=(), count=1):
+    """
+    Move count transactions from one status to another. spend is their
+    (currency, spend_day(), amount) groups, needed when SUCCESS is either status.
+    """
+    if old_status == new_status or not count:
+        return
+    changes = {
+        STATUS_FIELDS[old_status]: F(STATUS_FIELDS[old_status]) - count,
+        STATUS_FIELDS[new_status]: F(STATUS_FIELDS[new_status]) + count,
+    }
+    if new_status == 'SUCCESS':
+        _apply(user_id, spend=spend, **changes)
+    elif old_status == 'SUCCESS':
+        _apply(user_id, spend=spend, spend_sign=-1, **changes)
+    else:
+        _apply(user_id, **changes)
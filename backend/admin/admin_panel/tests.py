@@ -1,3 +1,410 @@
-from django.test import TestCase
+import http.client
+import http.server
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from asgiref.sync import SyncToAsync, async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from admin import profiling, throttling
+from authentication.models import User
+from cards.models import Card
+from transactions.models import Transaction
+from . import search, stats, timeseries
+from .models import OutcomeRollup, UserSpend, UserStats
 
-# Create your tests here.
+
+@override_settings(PAYMENT_PROCESSOR_KEY='processor-key')
+class UserStatsTests(TestCase):
+    """The stats row moves with every card and transaction change and matches a recount"""
+    # Stats and spend rows live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gina', 'gina@example.com', 'pw12345!')
+
+    def setUp(self):
+        throttling._local_buckets.clear()
+        self.addCleanup(throttling._local_buckets.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_card(self):
+        response = self.client.post('/api/cards/add/', {
+            'card_number': '4242424242424242', 'cvv': '123', 'card_holder_name': 'Gina',
+            'expiry_month': '12', 'expiry_year': '2030'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['data']['id']
+
+    def pay(self, card_id, amount, currency):
+        response = self.client.post('/api/transactions/create/', {
+            'card_id': card_id, 'amount': amount, 'currency': currency}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['data']['id']
+
+    def settle(self, transaction_id, new_status):
+        response = APIClient().patch(f'/api/transactions/{transaction_id}/update-status/', {'status': new_status},
+                                     format='json', HTTP_X_PROCESSOR_KEY='processor-key')
+        self.assertEqual(response.status_code, 200)
+
+    def assertMatchesRecount(self):
+        expected, groups = stats.compute_stats(self.user.id)
+        row = stats.get_stats(self.user.id)
+        self.assertEqual({field: getattr(row, field) for field in expected}, expected)
+        self.assertEqual(sorted(self.spend()), sorted(groups))
+        return row
+
+    def spend(self):
+        # Taking spend away can leave a zeroed row behind; like the reconcile command, ignore it
+        return [group for group in stats.spend_groups(self.user.id) if group[2]]
+
+    def test_deltas_follow_cards_and_transactions(self):
+        card_id = self.add_card()
+        self.assertEqual(self.assertMatchesRecount().card_count, 1)
+        paid, declined, _ = [self.pay(card_id, amount, currency)
+                             for amount, currency in (('10.00', 'USD'), ('4.50', 'EUR'), ('7.25', 'USD'))]
+        self.settle(paid, 'SUCCESS')
+        self.settle(declined, 'FAILED')
+        row = self.assertMatchesRecount()
+        self.assertEqual((row.pending_count, row.success_count, row.failed_count), (1, 1, 1))
+        self.assertEqual([(currency, amount) for currency, _, amount in self.spend()],
+                         [('USD', Decimal('10.00'))])
+
+        self.assertEqual(self.client.delete(f'/api/cards/{card_id}/delete/').status_code, 200)
+        row = self.assertMatchesRecount()
+        self.assertEqual((row.card_count, row.transaction_count), (0, 0))
+        self.assertEqual(self.spend(), [])
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_user_stats', *args, user_ids=[self.user.id], stdout=out)
+        return out.getvalue()
+
+    def test_reconcile_repairs_drift(self):
+        card_id = self.add_card()
+        self.settle(self.pay(card_id, '10.00', 'USD'), 'SUCCESS')
+        UserStats.objects.for_user(self.user.id).filter(user_id=self.user.id).update(success_count=9)
+        UserSpend.objects.for_user(self.user.id).filter(user_id=self.user.id).delete()
+
+        output = self.reconcile('--dry-run')
+        self.assertIn(f'Drift for user {self.user.id}', output)
+        self.assertIn('1 repaired, 0 created (dry run)', output)
+        self.assertEqual(stats.get_stats(self.user.id).success_count, 9)
+
+        self.assertIn('1 repaired, 0 created', self.reconcile())
+        self.assertMatchesRecount()
+        self.assertIn('0 repaired, 0 created', self.reconcile())
+
+    def test_reconcile_creates_missing_rows(self):
+        self.pay(self.add_card(), '3.00', 'USD')
+        UserStats.objects.for_user(self.user.id).filter(user_id=self.user.id).delete()
+        self.assertIn('0 repaired, 1 created', self.reconcile())
+        self.assertEqual(self.assertMatchesRecount().pending_count, 1)
+
+
+class BulkUserStatusTests(TestCase):
+    """One UPDATE changes the chosen users, never staff accounts or the caller"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('pat', 'pat@example.com', 'pw12345!', is_staff=True)
+        cls.other_admin = User.objects.create_user('paula', 'paula@example.com', 'pw12345!', is_staff=True)
+        cls.users = [User.objects.create_user(name, f'{name}@example.com', 'pw12345!')
+                     for name in ('peter', 'piper', 'quinn')]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, body):
+        return self.client.post('/api/admin-panel/users/bulk-status/', body, format='json')
+
+    def active(self):
+        return dict(User.objects.values_list('username', 'is_active'))
+
+    def test_ids_skip_staff_and_the_caller(self):
+        ids = [user.id for user in self.users[:2]] + [self.admin.id, self.other_admin.id]
+        response = self.post({'is_active': False, 'user_ids': ids})
+        self.assertEqual((response.status_code, response.data['data']['updated']), (200, 2))
+        self.assertEqual(self.active(), {'pat': True, 'paula': True, 'peter': False, 'piper': False, 'quinn': True})
+        # Already inactive rows are not counted again
+        self.assertEqual(self.post({'is_active': 'false', 'user_ids': ids}).data['data']['updated'], 0)
+        self.assertEqual(self.post({'is_active': True, 'user_ids': ids}).data['data']['updated'], 2)
+
+    def test_filter_skips_staff_and_the_caller(self):
+        response = self.post({'is_active': False, 'filter': {'q': 'p'}})
+        self.assertEqual(response.data['data']['updated'], 2)
+        self.assertEqual(self.active(), {'pat': True, 'paula': True, 'peter': False, 'piper': False, 'quinn': True})
+
+    def test_deactivated_users_tokens_stop_working(self):
+        user = self.users[2]
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 200)
+        self.post({'is_active': False, 'user_ids': [user.id]})
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 401)
+
+    def test_requests_that_could_match_everyone_are_refused(self):
+        for body in ({'is_active': False, 'filter': {}},
+                     {'is_active': False, 'filter': {'is_staff': 'maybe', 'joined_from': 'soon'}},
+                     {'is_active': False},
+                     {'is_active': False, 'user_ids': []},
+                     {'is_active': False, 'user_ids': ['x']},
+                     {'is_active': 'maybe', 'user_ids': [self.users[0].id]}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        self.assertTrue(all(self.active().values()))
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.post({'is_active': False, 'user_ids': [self.users[1].id]}).status_code, 403)
+
+
+class Stop(Exception):
+    pass
+
+
+class OutcomeSeriesTests(TestCase):
+    def setUp(self):
+        self.ring = timeseries.MinuteRing()
+        patch = mock.patch.object(timeseries, '_ring', self.ring)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.minute = int(time.time() // 60)
+
+    def test_ring_sums_per_minute_and_key(self):
+        key = ('SUCCESS', 'USD', 'VISA')
+        self.ring.add(self.minute, key, Decimal('10.00'), latency_ms=40.0)
+        self.ring.add(self.minute, key, Decimal('2.50'), latency_ms=90.0)
+        self.ring.add(self.minute, ('PENDING', 'USD', 'VISA'), Decimal('1.00'))
+        self.assertEqual(sorted(self.ring.take()), [
+            (self.minute, ('PENDING', 'USD', 'VISA'), [1, Decimal('1.00'), 0, 0.0, 0.0]),
+            (self.minute, key, [2, Decimal('12.50'), 2, 130.0, 90.0]),
+        ])
+        self.assertEqual(self.ring.take(), [])
+
+    def test_wrapped_slots_and_stale_restores_count_as_dropped(self):
+        key = ('PENDING', 'USD', 'VISA')
+        self.ring.add(self.minute - timeseries.RING_MINUTES, key, Decimal('1.00'))
+        self.ring.add(self.minute, key, Decimal('1.00'))
+        self.assertEqual(self.ring.dropped, 1)
+        entries = self.ring.take()
+        self.ring.restore(entries + [(self.minute - timeseries.RING_MINUTES, key, [3, Decimal('3.00'), 0, 0.0, 0.0])])
+        self.assertEqual(self.ring.dropped, 4)
+        self.assertEqual(self.ring.take(), entries)
+
+    def test_flusher_writes_the_ring_each_interval(self):
+        timeseries.record('SUCCESS', 'USD', 'VISA', Decimal('5.00'), latency_ms=20.0)
+        with mock.patch.object(timeseries.time, 'sleep', side_effect=[None, Stop]), \
+                mock.patch.object(timeseries, '_start_flusher'):
+            with self.assertRaises(Stop):
+                timeseries.Flusher(10).run()
+        row = OutcomeRollup.objects.get()
+        self.assertEqual((row.status, row.count, row.amount, row.timed_count), ('SUCCESS', 1, Decimal('5.00'), 1))
+        self.assertEqual(self.ring.take(), [])
+
+    def test_failed_flush_keeps_the_counters(self):
+        self.ring.add(self.minute, ('FAILED', 'EUR', 'AMEX'), Decimal('7.00'))
+        with mock.patch.object(timeseries, 'add_rollups', side_effect=DatabaseError('gone')), \
+                self.assertLogs(timeseries.logger, 'WARNING'):
+            self.assertEqual(timeseries.flush(), 0)
+        self.assertEqual(timeseries.flush(), 1)
+        self.assertEqual(OutcomeRollup.objects.get().count, 1)
+
+    def test_series_merges_stored_and_unflushed_rows(self):
+        start = timeseries.minute_start(self.minute - 2)
+        end = timeseries.minute_start(self.minute + 1)
+        # Flushed earlier, by this process or another one
+        self.ring.add(self.minute - 2, ('SUCCESS', 'USD', 'VISA'), Decimal('10.00'), latency_ms=100.0)
+        self.ring.add(self.minute, ('SUCCESS', 'USD', 'VISA'), Decimal('4.00'), latency_ms=50.0)
+        timeseries.flush()
+        # Still in the ring: merged with the stored row for the same minute and key
+        self.ring.add(self.minute, ('SUCCESS', 'USD', 'VISA'), Decimal('6.00'), latency_ms=150.0)
+        self.ring.add(self.minute, ('FAILED', 'USD', 'VISA'), Decimal('1.00'), latency_ms=10.0)
+        self.ring.add(self.minute, ('SUCCESS', 'EUR', 'VISA'), Decimal('100.00'))
+
+        def convert(groups):
+            return sum(amount for _, _, amount in groups)
+
+        buckets = timeseries.series(start, end, 60, convert, currency='USD')
+        self.assertEqual([(b['success'], b['failed'], b['volume']) for b in buckets],
+                         [(1, 0, 10.0), (0, 0, 0.0), (2, 1, 10.0)])
+        self.assertEqual((buckets[2]['approval_rate'], buckets[2]['latency_ms_avg'], buckets[2]['latency_ms_max']),
+                         (0.6667, 70.0, 150.0))
+        self.assertEqual([b['volume'] for b in timeseries.series(start, end, 180, convert)], [120.0])
+
+    def test_compacted_hours_still_add_up(self):
+        # The first two minutes of the hour before last
+        hour = (self.minute // 60 - 2) * 60
+        self.ring.add(hour, ('SUCCESS', 'USD', 'VISA'), Decimal('3.00'), latency_ms=30.0)
+        self.ring.add(hour + 1, ('SUCCESS', 'USD', 'VISA'), Decimal('4.00'), latency_ms=60.0)
+        timeseries.flush()
+        self.assertEqual(timeseries.compact(timeseries.minute_start(hour) + timedelta(hours=1)), 1)
+        row = OutcomeRollup.objects.get()
+        self.assertEqual((row.resolution, row.count, row.amount, row.latency_ms_max),
+                         (OutcomeRollup.HOUR, 2, Decimal('7.00'), 60.0))
+
+
+class AdminSearchTests(TransactionTestCase):
+    """Prefix hits from the B-tree indexes, then substring hits from the FTS5 trigram tables"""
+    # Cards and transactions are searched on every shard from worker threads,
+    # which cannot see rows inside a TestCase transaction
+    databases = '__all__'
+
+    def setUp(self):
+        self.staff = User.objects.create_user('olga', 'olga@example.com', 'pw12345!', is_staff=True)
+        self.malcolm = User.objects.create_user('malcolm', 'mc@example.com', 'pw12345!')
+        self.jamal = User.objects.create_user('jamal', 'jamal@example.com', 'pw12345!')
+        self.card = Card.objects.create(user=self.jamal, card_type='VISA', masked_number='**** **** **** 7788',
+                                   last_four_digits='7788', card_holder_name='JAMAL MALIK',
+                                   expiry_month='12', expiry_year='2030')
+        self.coffee = Transaction.objects.create(user=self.jamal, card=self.card, amount=Decimal('4.75'),
+                                                 description='Coffee at the Marketplace')
+        Transaction.objects.create(user=self.jamal, card=self.card, amount=Decimal('60.00'), description='Rent')
+
+    def ids(self, rows):
+        return [row['id'] for row in rows]
+
+    def test_prefix_hits_come_before_substring_hits_once_each(self):
+        found = search.search('mal', ['users'], 10)
+        self.assertEqual(self.ids(found['users']), [self.malcolm.id, self.jamal.id])
+        self.assertEqual(self.ids(search.search('mal', ['users'], 10, mode='prefix')['users']), [self.malcolm.id])
+
+    def test_substrings_use_the_full_text_tables(self):
+        found = search.search('ketpla', ['cards', 'transactions'], 10)
+        self.assertEqual((found['cards'], self.ids(found['transactions'])), ([], [self.coffee.id]))
+        cards = search.search('MALIK', ['cards'], 10)['cards']
+        self.assertEqual([card['last_four_digits'] for card in cards], ['7788'])
+        # Too short for a trigram
+        self.assertEqual(search.search('ke', ['transactions'], 10)['transactions'], [])
+
+    def test_numbers_match_card_digits_ids_and_amounts(self):
+        self.assertEqual(len(search.search('77', ['cards'], 10)['cards']), 1)
+        self.assertEqual(self.ids(search.search(str(self.coffee.id), ['transactions'], 10)['transactions'])[0],
+                         self.coffee.id)
+        self.assertEqual(self.ids(search.search('4.75', ['transactions'], 10)['transactions']), [self.coffee.id])
+
+    def test_serializers_are_compiled_once(self):
+        with mock.patch.object(search, 'FastSerializer', side_effect=AssertionError('recompiled')):
+            found = search.search('mal', list(search.SEARCHES), 10)
+        self.assertEqual(len(found['users']), 2)
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.get('/api/admin-panel/search/', {'q': 'jam', 'types': 'users,cards', 'mode': 'prefix'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response.data['data']['users']), [self.jamal.id])
+        self.assertEqual(self.ids(response.data['data']['cards']), [self.card.id])
+        self.assertNotIn('transactions', response.data['data'])
+        self.assertEqual(client.get('/api/admin-panel/search/').status_code, 400)
+
+
+class QuietHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = http.server.HTTPServer(('127.0.0.1', 0), QuietHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(PROFILE_DIR=directory, PROFILE_INTERVAL_MS=1)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.putrequest = http.client.HTTPConnection.putrequest
+        self.sync_to_async_call = SyncToAsync.__call__
+
+    def call_upstream(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        connection.request('GET', '/status?token=secret')
+        connection.getresponse().read()
+        connection.close()
+
+    def view(self, request):
+        self.seen = http.client.HTTPConnection.putrequest
+        User.objects.count()
+        self.call_upstream()
+        return HttpResponse('ok')
+
+    def test_unprofiled_requests_run_without_the_http_hooks(self):
+        middleware = profiling.ProfilingMiddleware(self.view)
+        with override_settings(PROFILE_SAMPLE_RATE=0):
+            response = middleware(RequestFactory().get('/api/cards/'))
+        self.assertIs(self.seen, self.putrequest)
+        self.assertNotIn('X-Profile-Id', response)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0)
+    def test_profiled_request_records_queries_and_calls_then_unpatches(self):
+        middleware = profiling.ProfilingMiddleware(self.view)
+        self.assertIs(http.client.HTTPConnection.putrequest, self.putrequest)
+        response = middleware(RequestFactory().get('/api/cards/'))
+        self.assertIsNot(self.seen, self.putrequest)
+        self.assertIs(http.client.HTTPConnection.putrequest, self.putrequest)
+        self.assertIs(SyncToAsync.__call__, self.sync_to_async_call)
+
+        profiling.writer().flush()
+        document = profiling.load(response['X-Profile-Id'])
+        self.assertEqual((document['trigger'], document['status']), ('sample', 200))
+        self.assertTrue(any('"users"' in query['sql'] for query in document['queries']))
+        self.assertEqual([(call['url'], call['status']) for call in document['http_calls']],
+                         [(f'http://127.0.0.1:{self.server.server_port}/status', 204)])
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0)
+    def test_async_request_tracks_its_sync_to_async_workers(self):
+        workers = []
+
+        def blocking():
+            workers.append(threading.get_ident() in profiling._active.get().workers)
+
+        async def view(request):
+            await sync_to_async(blocking)()
+            return HttpResponse('ok')
+
+        response = async_to_sync(profiling.ProfilingMiddleware(view))(RequestFactory().get('/api/cards/'))
+        self.assertEqual(workers, [True])
+        self.assertIn('X-Profile-Id', response)
+        self.assertIs(SyncToAsync.__call__, self.sync_to_async_call)
+
+    def test_hooks_stay_until_the_last_running_profile_finishes(self):
+        profiling._patch_in()
+        profiling._patch_in()
+        profiling._patch_out()
+        self.assertIsNot(http.client.HTTPConnection.putrequest, self.putrequest)
+        profiling._patch_out()
+        self.assertIs(http.client.HTTPConnection.putrequest, self.putrequest)
+
+    def test_writer_prunes_without_listing_the_directory_again(self):
+        writer = profiling.ProfileWriter()
+        writer.start()
+        with override_settings(PROFILE_KEEP=2), mock.patch.object(profiling, 'stored_ids',
+                                                                   wraps=profiling.stored_ids) as listing:
+            for n in range(4):
+                profile = profiling.Profile('GET', '/api/cards/', 'sample')
+                profile.id = f'20260101T00000{n}-abcd1234'
+                writer.submit(profile)
+            writer.flush()
+        self.assertEqual(listing.call_count, 1)
+        self.assertEqual(profiling.stored_ids(), ['20260101T000003-abcd1234', '20260101T000002-abcd1234'])
@@ -0,0 +1,284 @@
+"""
+Per-minute payment outcome counters.
+
+Each process counts the outcomes it causes in a ring of per-minute slots
+keyed by (status, currency, card type). Django counts the payments created
+(PENDING) and the abandoned ones the sweeper fails. The processor counts
+its SUCCESS/FAILED decisions with their processing latency and sends its
+minutes through add_rollups(). A background thread folds the slots into
+OutcomeRollup rows every TIMESERIES_FLUSH_SECONDS with one additive upsert
+per key and minute, so the table costs a few writes per minute however
+busy the gateway is. Slots the database could not take are kept and
+retried until the ring wraps, an hour later.
+
+series() answers a time range from the rollup rows plus this process's
+unflushed slots: the last hour is at most 60 minutes x keys rows, read by
+bucket from the index, and never touches transactions. compact() folds
+old minute rows into hour rows so longer ranges stay as cheap.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction as db_transaction
+from django.db.models import F, FloatField, Max, Sum, Value
+from django.db.models.functions import Greatest
+from .models import OutcomeRollup
+
+logger = logging.getLogger(__name__)
+
+RING_MINUTES = 60
+
+# Per key and minute: count, amount, timed count, latency sum (ms), latency max (ms)
+COUNTERS = ('count', 'amount', 'timed_count', 'latency_ms_sum', 'latency_ms_max')
+
+
+def _empty():
+    return [0, Decimal('0'), 0, 0.0, 0.0]
+
+
+def _merge(counters, other):
+    counters[0] += other[0]
+    counters[1] += other[1]
+    counters[2] += other[2]
+    counters[3] += other[3]
+    counters[4] = max(counters[4], other[4])
+
+
+class MinuteRing:
+    """Unflushed counters for the last `size` minutes; a slot still holding an older minute is dropped"""
+
+    def __init__(self, size=RING_MINUTES):
+        self.size = size
+        self.slots = [None] * size
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def _slot(self, minute):
+        # Called with the lock held
+        slot = self.slots[minute % self.size]
+        if slot is None or slot[0] != minute:
+            if slot is not None:
+                self.dropped += sum(counters[0] for counters in slot[1].values())
+            slot = self.slots[minute % self.size] = (minute, {})
+        return slot[1]
+
+    def add(self, minute, key, amount, latency_ms=None):
+        with self.lock:
+            keys = self._slot(minute)
+            counters = keys.get(key)
+            if counters is None:
+                counters = keys[key] = _empty()
+            counters[0] += 1
+            counters[1] += amount
+            if latency_ms is not None:
+                counters[2] += 1
+                counters[3] += latency_ms
+                counters[4] = max(counters[4], latency_ms)
+
+    def take(self):
+        """Empty the ring; [(minute, key, counters)]"""
+        with self.lock:
+            slots, self.slots = self.slots, [None] * self.size
+        return [(minute, key, counters) for minute, keys in filter(None, slots) for key, counters in keys.items()]
+
+    def restore(self, entries):
+        """Put back what take() returned, e.g. after a failed flush"""
+        newest = int(time.time() // 60)
+        with self.lock:
+            for minute, key, counters in entries:
+                if minute <= newest - self.size:
+                    self.dropped += counters[0]
+                    continue
+                _merge(self._slot(minute).setdefault(key, _empty()), counters)
+
+    def snapshot(self, since_minute):
+        with self.lock:
+            return [(minute, key, list(counters))
+                    for minute, keys in filter(None, self.slots) if minute >= since_minute
+                    for key, counters in keys.items()]
+
+
+_ring = MinuteRing()
+
+
+def minute_start(minute):
+    return datetime.fromtimestamp(minute * 60, dt_timezone.utc)
+
+
+def record(txn_status, currency, card_type, amount, latency_ms=None):
+    """Count one outcome in this process's current minute"""
+    _ring.add(int(time.time() // 60), (txn_status, currency or '', card_type or ''), amount, latency_ms)
+    _start_flusher()
+
+
+def card_type_of(payment_method):
+    """The card type in a transaction's payment_method ("Visa - 1234")"""
+    return payment_method.split(' - ')[0] if payment_method else ''
+
+
+# Rollup table
+
+def add_rollups(rows):
+    """Add {bucket, resolution, status, currency, card_type, *COUNTERS} rows to their stored rows"""
+    with db_transaction.atomic():
+        for row in rows:
+            key = {field: row[field] for field in ('bucket', 'resolution', 'status', 'currency', 'card_type')}
+            changes = {
+                'count': F('count') + row['count'],
+                'amount': F('amount') + row['amount'],
+                'timed_count': F('timed_count') + row['timed_count'],
+                'latency_ms_sum': F('latency_ms_sum') + row['latency_ms_sum'],
+                'latency_ms_max': Greatest('latency_ms_max', Value(row['latency_ms_max'], output_field=FloatField())),
+            }
+            if OutcomeRollup.objects.filter(**key).update(**changes):
+                continue
+            try:
+                with db_transaction.atomic():
+                    OutcomeRollup.objects.create(**row)
+            except IntegrityError:
+                # Another writer created the row first
+                OutcomeRollup.objects.filter(**key).update(**changes)
+
+
+def minute_rows(entries):
+    """Rollup rows for (minute, key, counters) entries"""
+    return [
+        {
+            'bucket': minute_start(minute), 'resolution': OutcomeRollup.MINUTE,
+            'status': key[0], 'currency': key[1], 'card_type': key[2],
+            **dict(zip(COUNTERS, counters)),
+        }
+        for minute, key, counters in entries
+    ]
+
+
+def flush():
+    """Write this process's counters to the rollup table; returns the rows written"""
+    entries = _ring.take()
+    if not entries:
+        return 0
+    try:
+        add_rollups(minute_rows(entries))
+    except DatabaseError as e:
+        _ring.restore(entries)
+        logger.warning("Outcome rollup flush failed, keeping %s rows for the next one: %s", len(entries), e)
+        return 0
+    return len(entries)
+
+
+class Flusher(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name='outcome-rollup-flusher', daemon=True)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            flush()
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _start_flusher():
+    # Started by the first outcome, so it runs in each worker rather than a pre-fork parent
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = Flusher(settings.TIMESERIES_FLUSH_SECONDS)
+            _flusher.start()
+            atexit.register(flush)
+
+
+def compact(before):
+    """Fold minute rows older than `before` into hour rows, an hour at a time; returns hours folded"""
+    before = before.replace(minute=0, second=0, microsecond=0)
+    hours = 0
+    while True:
+        oldest = (OutcomeRollup.objects.filter(resolution=OutcomeRollup.MINUTE, bucket__lt=before)
+                  .order_by('bucket').values_list('bucket', flat=True).first())
+        if oldest is None:
+            return hours
+        hour = oldest.replace(minute=0, second=0, microsecond=0)
+        minutes = OutcomeRollup.objects.filter(resolution=OutcomeRollup.MINUTE,
+                                               bucket__gte=hour, bucket__lt=hour + timedelta(hours=1))
+        groups = (minutes.order_by().values('status', 'currency', 'card_type')
+                  .annotate(count=Sum('count'), amount=Sum('amount'), timed_count=Sum('timed_count'),
+                            latency_ms_sum=Sum('latency_ms_sum'), latency_ms_max=Max('latency_ms_max')))
+        with db_transaction.atomic():
+            add_rollups([{**group, 'bucket': hour, 'resolution': OutcomeRollup.HOUR} for group in groups])
+            minutes.delete()
+        hours += 1
+
+
+# Reading
+
+def _bucket(totals, index):
+    bucket = totals.get(index)
+    if bucket is None:
+        bucket = totals[index] = {'statuses': {}, 'volume': [], 'timed': 0, 'latency_sum': 0.0, 'latency_max': 0.0}
+    return bucket
+
+
+def _add(bucket, txn_status, currency, day, counters):
+    count, amount, timed, latency_sum, latency_max = counters
+    bucket['statuses'][txn_status] = bucket['statuses'].get(txn_status, 0) + count
+    if txn_status == 'SUCCESS':
+        bucket['volume'].append((currency, day, amount))
+    bucket['timed'] += timed
+    bucket['latency_sum'] += latency_sum
+    bucket['latency_max'] = max(bucket['latency_max'], latency_max)
+
+
+def series(start, end, step, convert, currency=None, card_type=None):
+    """
+    Per-step buckets over [start, end): outcome counts by status, approval
+    rate, SUCCESS volume summed by convert([(currency, day, amount)]) and
+    processing latency. Rows in the range come from the rollup table and
+    this process's unflushed minutes, filtered by currency and card_type.
+    """
+    origin = start.timestamp()
+    totals = {}
+
+    rows = OutcomeRollup.objects.filter(bucket__gte=start, bucket__lt=end)
+    if currency:
+        rows = rows.filter(currency=currency)
+    if card_type:
+        rows = rows.filter(card_type=card_type)
+    grouped = (rows.order_by().values_list('bucket', 'status', 'currency')
+               .annotate(Sum('count'), Sum('amount'), Sum('timed_count'), Sum('latency_ms_sum'),
+                         Max('latency_ms_max')))
+    for bucket, txn_status, row_currency, *counters in grouped:
+        index = int((bucket.timestamp() - origin) // step)
+        _add(_bucket(totals, index), txn_status, row_currency, bucket.date(), counters)
+
+    for minute, (txn_status, row_currency, row_card_type), counters in _ring.snapshot(int(origin // 60)):
+        at = minute_start(minute)
+        if at >= end or (currency and row_currency != currency) or (card_type and row_card_type != card_type):
+            continue
+        _add(_bucket(totals, int((at.timestamp() - origin) // step)), txn_status, row_currency, at.date(), counters)
+
+    buckets = []
+    for index in range(int((end.timestamp() - origin + step - 1) // step)):
+        bucket = totals.get(index) or _bucket({}, index)
+        statuses = bucket['statuses']
+        decided = statuses.get('SUCCESS', 0) + statuses.get('FAILED', 0)
+        buckets.append({
+            'start': datetime.fromtimestamp(origin + index * step, dt_timezone.utc).isoformat(),
+            'created': statuses.get('PENDING', 0),
+            'success': statuses.get('SUCCESS', 0),
+            'failed': statuses.get('FAILED', 0),
+            'approval_rate': round(statuses.get('SUCCESS', 0) / decided, 4) if decided else None,
+            'volume': float(convert(bucket['volume'])),
+            'latency_ms_avg': round(bucket['latency_sum'] / bucket['timed'], 1) if bucket['timed'] else None,
+            'latency_ms_max': round(bucket['latency_max'], 1) if bucket['timed'] else None,
+        })
+    return buckets
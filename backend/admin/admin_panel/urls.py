@@ -4,10 +4,16 @@ from . import views
 urlpatterns = [
     path('dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('users/', views.manage_users, name='manage_users'),
+    path('users/bulk-status/', views.bulk_user_status, name='bulk_user_status'),
     path('users/<int:user_id>/', views.get_user_details, name='get_user_details'),
     path('users/<int:user_id>/toggle-status/', views.toggle_user_status, name='toggle_user_status'),
     path('cards/', views.view_all_cards, name='view_all_cards'),
+    path('cards/find/', views.find_card, name='find_card'),
     path('transactions/', views.view_all_transactions, name='view_all_transactions'),
+    path('search/', views.admin_search, name='admin_search'),
     path('daily-summary/', views.daily_payment_summary, name='daily_payment_summary'),
+    path('timeseries/', views.outcome_timeseries, name='outcome_timeseries'),
     path('export-transactions/', views.export_transactions_csv, name='export_transactions_csv'),
+    path('profiles/', views.list_profiles, name='list_profiles'),
+    path('profiles/<str:profile_id>/', views.download_profile, name='download_profile'),
 ]
\ No newline at end of file
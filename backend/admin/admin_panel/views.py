@@ -2,81 +2,247 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum, Count, Q
-from django.http import HttpResponse
-from datetime import datetime, timedelta
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 from cards.models import Card
 from transactions.models import Transaction
+from authentication.revocation import RevocableJWTAuthentication
 from authentication.serializers import UserSerializer
 from cards.serializers import CardListSerializer
-from transactions.serializers import TransactionSerializer
+from transactions.serializers import TransactionSerializer, serialize_transactions
+from admin import fx, profiling, sharding
+from admin.caching import Freshness, conditional
+from admin.fastpath import FastSerializer
+from admin.serializers import parse_fields
+from . import search, stats, timeseries
 import csv
+import heapq
 
 User = get_user_model()
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def get_page_params(request):
+    """Read page/page_size query params, clamped to sane bounds"""
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    try:
+        page_size = min(max(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+    return page, page_size
+
+def combine(parts):
+    """Add up per-shard results key by key: counts sum, lists (e.g. FX groups) concatenate"""
+    combined = dict(parts[0])
+    for part in parts[1:]:
+        for key, value in part.items():
+            combined[key] += value
+    return combined
+
+def sharded_count(queryset):
+    return sum(sharding.scatter(lambda using: queryset.using(using).count()))
+
+def newest_first(row_lists, key):
+    """Merge per-shard lists that are each sorted newest first"""
+    return list(heapq.merge(*row_lists, key=key, reverse=True))
+
+def user_summaries(user_ids):
+    """{id: {id, username, email}} for card owners, read from default where the users live"""
+    return {
+        row['id']: row
+        for row in User.objects.filter(id__in=set(user_ids)).values('id', 'username', 'email')
+    }
+
+SUMMARY_CACHE = {'private': True, 'max_age': 30}
+PAST_SUMMARY_CACHE = {'private': True, 'max_age': 300}
+
+def summary_freshness(request):
+    # Summaries are too costly to validate up front; let them be reused briefly
+    # and rely on ConditionalGetMiddleware's content ETag for cheap revalidation
+    today = datetime.now().date().isoformat()
+    if request.GET.get('date', today) < today:
+        return Freshness(cache_control=PAST_SUMMARY_CACHE)
+    return Freshness(cache_control=SUMMARY_CACHE)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
+@conditional(summary_freshness)
 def admin_dashboard(request):
     """Get admin dashboard statistics"""
     total_users = User.objects.count()
-    total_cards = Card.objects.count()
-    total_transactions = Transaction.objects.count()
-    
-    successful_transactions = Transaction.objects.filter(status='SUCCESS')
-    total_revenue = successful_transactions.aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    # Today's statistics
     today = datetime.now().date()
-    today_transactions = Transaction.objects.filter(transaction_date__date=today)
-    today_revenue = today_transactions.filter(status='SUCCESS').aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    # Last 7 days statistics
     week_ago = datetime.now() - timedelta(days=7)
-    week_transactions = Transaction.objects.filter(transaction_date__gte=week_ago)
+    totals = combine(sharding.scatter(dashboard_totals, today, week_ago))
     
-    # Status breakdown
-    status_breakdown = {
-        'pending': Transaction.objects.filter(status='PENDING').count(),
-        'success': Transaction.objects.filter(status='SUCCESS').count(),
-        'failed': Transaction.objects.filter(status='FAILED').count(),
-    }
+    # Revenue is converted per (currency, day) group into the reporting currency
+    currency = fx.reporting_currency(request)
     
     return Response({
         'status': 'success',
         'data': {
             'total_users': total_users,
-            'total_cards': total_cards,
-            'total_transactions': total_transactions,
-            'total_revenue': float(total_revenue),
-            'today_transactions': today_transactions.count(),
-            'today_revenue': float(today_revenue),
-            'week_transactions': week_transactions.count(),
-            'status_breakdown': status_breakdown
+            'total_cards': totals['total_cards'],
+            'total_transactions': totals['total_transactions'],
+            'currency': currency,
+            'total_revenue': float(fx.convert_groups(totals['revenue'], currency)),
+            'today_transactions': totals['today_transactions'],
+            'today_revenue': float(fx.convert_groups(totals['today_revenue'], currency)),
+            'week_transactions': totals['week_transactions'],
+            'status_breakdown': {
+                'pending': totals['pending'],
+                'success': totals['success'],
+                'failed': totals['failed'],
+            }
         }
     }, status=status.HTTP_200_OK)
 
+def dashboard_totals(using, today, week_ago):
+    """One shard's share of the dashboard; revenue as FX groups so shards can be added up"""
+    transactions = Transaction.objects.using(using)
+    successful_transactions = transactions.filter(status='SUCCESS')
+    today_transactions = transactions.filter(transaction_date__date=today)
+    return {
+        'total_cards': Card.objects.using(using).count(),
+        'total_transactions': transactions.count(),
+        'revenue': fx.currency_day_totals(successful_transactions),
+        'today_transactions': today_transactions.count(),
+        'today_revenue': fx.currency_day_totals(today_transactions.filter(status='SUCCESS')),
+        'week_transactions': transactions.filter(transaction_date__gte=week_ago).count(),
+        'pending': transactions.filter(status='PENDING').count(),
+        'success': successful_transactions.count(),
+        'failed': transactions.filter(status='FAILED').count(),
+    }
+
+USER_LISTING = FastSerializer(UserSerializer)
+MAX_BULK_USERS = 10000
+
+def parse_flag(value):
+    """True/False for a query or body flag, None when absent or unrecognised"""
+    if isinstance(value, bool):
+        return value
+    if value in ('1', 'true', 'True'):
+        return True
+    if value in ('0', 'false', 'False'):
+        return False
+    return None
+
+def filter_users(params):
+    """
+    Users matching is_active, is_staff, q (username/email prefix) and
+    joined_from/joined_to (YYYY-MM-DD, UTC) in params; absent or invalid ones are ignored.
+    """
+    users = User.objects.all()
+    for name in ('is_active', 'is_staff'):
+        flag = parse_flag(params.get(name))
+        if flag is not None:
+            users = users.filter(**{name: flag})
+    query = (params.get('q') or '').strip()
+    if query:
+        users = users.filter(Q(username__istartswith=query) | Q(email__istartswith=query))
+    for name, lookup, days in (('joined_from', 'date_joined__gte', 0), ('joined_to', 'date_joined__lt', 1)):
+        if params.get(name):
+            try:
+                day = datetime.strptime(params[name], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+                users = users.filter(**{lookup: day + timedelta(days=days)})
+            except (TypeError, ValueError):
+                pass
+    return users
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def manage_users(request):
-    """Get all users"""
-    users = User.objects.all().order_by('-date_joined')
-    serializer = UserSerializer(users, many=True)
+    """One page of users, newest first, filtered as in filter_users()"""
+    users = filter_users(request.GET)
+    page, page_size = get_page_params(request)
+    offset = (page - 1) * page_size
+    # Walks user_joined_idx backwards; id breaks ties so pages never overlap
+    rows = USER_LISTING.serialize(users.order_by('-date_joined', '-id')[offset:offset + page_size])
     
     return Response({
         'status': 'success',
-        'data': serializer.data,
-        'count': users.count()
+        'data': rows,
+        'pagination': {
+            'page': page,
+            'page_size': page_size,
+            'total': users.count(),
+        }
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def bulk_user_status(request):
+    """
+    Activate or deactivate many users with one UPDATE:
+    {"is_active": false, "user_ids": [...]} or {"is_active": false, "filter": {...}}
+    with filter_users() filters. Staff accounts and the caller are never changed.
+    """
+    is_active = parse_flag(request.data.get('is_active'))
+    user_ids = request.data.get('user_ids')
+    user_filter = request.data.get('filter')
+    users = None
+    if is_active is None:
+        return Response({
+            'status': 'error',
+            'message': 'is_active must be true or false'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if user_ids is not None:
+        if not isinstance(user_ids, list) or not user_ids or len(user_ids) > MAX_BULK_USERS:
+            return Response({
+                'status': 'error',
+                'message': f'user_ids must be a list of 1 to {MAX_BULK_USERS} ids'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            users = User.objects.filter(id__in={int(user_id) for user_id in user_ids})
+        except (TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': 'user_ids must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    elif isinstance(user_filter, dict):
+        users = filter_users(user_filter)
+    if users is None or not users.query.has_filters():
+        # An empty (or entirely invalid) filter would match everyone
+        return Response({
+            'status': 'error',
+            'message': 'user_ids or a non-empty filter is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Nothing caches users for authentication: Django and the processor's database
+    # store both read is_active per request, so the change applies to the next one
+    updated = (users.exclude(is_staff=True).exclude(id=request.user.id)
+               .exclude(is_active=is_active).update(is_active=is_active))
+    
+    return Response({
+        'status': 'success',
+        'message': f"{updated} users {'activated' if is_active else 'deactivated'}",
+        'data': {'updated': updated}
     }, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def get_user_details(request, user_id):
-    """Get specific user details with their cards and transactions"""
+    """Get specific user details with their cards, stats and recent transactions"""
     try:
         user = User.objects.get(id=user_id)
-        cards = Card.objects.filter(user=user)
-        transactions = Transaction.objects.filter(user=user)
+        cards = Card.objects.for_user(user.id).filter(user=user)
+        user_stats = stats.get_stats(user.id)
+        currency = fx.reporting_currency(request)
+        total_spent = fx.convert_groups(stats.spend_groups(user.id), currency)
+        
+        page, page_size = get_page_params(request)
+        offset = (page - 1) * page_size
+        # The user row is on default, so it is prefetched rather than joined
+        transactions = (Transaction.objects.for_user(user.id).filter(user=user)
+                        .select_related('card').prefetch_related('user')[offset:offset + page_size])
         
         return Response({
             'status': 'success',
@@ -84,10 +250,20 @@ def get_user_details(request, user_id):
                 'user': UserSerializer(user).data,
                 'cards': CardListSerializer(cards, many=True).data,
                 'transactions': TransactionSerializer(transactions, many=True).data,
+                'pagination': {
+                    'page': page,
+                    'page_size': page_size,
+                    'total': user_stats.transaction_count,
+                },
                 'stats': {
-                    'total_cards': cards.count(),
-                    'total_transactions': transactions.count(),
-                    'total_spent': transactions.filter(status='SUCCESS').aggregate(Sum('amount'))['amount__sum'] or 0
+                    'total_cards': user_stats.card_count,
+                    'total_transactions': user_stats.transaction_count,
+                    'pending_transactions': user_stats.pending_count,
+                    'successful_transactions': user_stats.success_count,
+                    'failed_transactions': user_stats.failed_count,
+                    'total_spent': total_spent,
+                    'currency': currency,
+                    'last_transaction_at': user_stats.last_transaction_at,
                 }
             }
         }, status=status.HTTP_200_OK)
@@ -104,7 +280,7 @@ def toggle_user_status(request, user_id):
     try:
         user = User.objects.get(id=user_id)
         user.is_active = not user.is_active
-        user.save()
+        user.save(update_fields=['is_active'])
         
         return Response({
             'status': 'success',
@@ -121,29 +297,54 @@ def toggle_user_status(request, user_id):
 @permission_classes([IsAuthenticated, IsAdminUser])
 def view_all_cards(request):
     """View all cards in the system"""
-    cards = Card.objects.select_related('user').all()
+    cards = newest_first(sharding.scatter(lambda using: list(Card.objects.using(using))),
+                         key=lambda card: card.created_at)
+    users = user_summaries(card.user_id for card in cards)
     
     data = []
     for card in cards:
         card_data = CardListSerializer(card).data
-        card_data['user'] = {
-            'id': card.user.id,
-            'username': card.user.username,
-            'email': card.user.email
-        }
+        card_data['user'] = users.get(card.user_id)
         data.append(card_data)
     
     return Response({
         'status': 'success',
         'data': data,
-        'count': cards.count()
+        'count': len(cards)
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def find_card(request):
+    """Every user's copy of one card, by card_number or fingerprint (POST so the number stays out of URLs and logs)"""
+    card_number = request.data.get('card_number')
+    fingerprint = Card.fingerprint_for(str(card_number)) if card_number else request.data.get('fingerprint')
+    if not fingerprint:
+        return Response({
+            'status': 'error',
+            'message': 'card_number or fingerprint is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    cards = newest_first(sharding.scatter(lambda using: list(Card.objects.using(using).filter(fingerprint=fingerprint))),
+                         key=lambda card: card.created_at)
+    users = user_summaries(card.user_id for card in cards)
+    data = []
+    for card in cards:
+        card_data = CardListSerializer(card).data
+        card_data['user'] = users.get(card.user_id)
+        data.append(card_data)
+    
+    return Response({
+        'status': 'success',
+        'data': {'fingerprint': fingerprint, 'cards': data},
+        'count': len(data)
     }, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def view_all_transactions(request):
     """View all transactions with filters"""
-    transactions = Transaction.objects.select_related('user', 'card').all()
+    transactions = Transaction.objects.all()
     
     # Filters
     status_filter = request.GET.get('status')
@@ -167,16 +368,66 @@ def view_all_transactions(request):
         except ValueError:
             pass
     
-    serializer = TransactionSerializer(transactions, many=True)
+    rows, side_tables = serialize_all_transactions(
+        transactions,
+        fields=parse_fields(request),
+        compact=request.GET.get('compact') in ('1', 'true')
+    )
     
     return Response({
         'status': 'success',
-        'data': serializer.data,
-        'count': transactions.count()
+        'data': rows,
+        'count': sharded_count(transactions),
+        **side_tables
     }, status=status.HTTP_200_OK)
 
+def serialize_all_transactions(transactions, fields=None, compact=False):
+    """serialize_transactions() run on every shard, rows merged newest first"""
+    if not sharding.enabled():
+        return serialize_transactions(transactions, fields=fields, compact=compact)
+    # The merge needs each row's date, even when the fieldset leaves it out
+    hidden_date = fields is not None and 'transaction_date' not in fields
+    shard_fields = fields + ('transaction_date',) if hidden_date else fields
+    parts = sharding.scatter(
+        lambda using: serialize_transactions(transactions.using(using), fields=shard_fields, compact=compact)
+    )
+    rows = newest_first([shard_rows for shard_rows, _ in parts],
+                        key=lambda row: parse_datetime(row['transaction_date']))
+    if hidden_date:
+        for row in rows:
+            del row['transaction_date']
+    side_tables = {}
+    for _, shard_tables in parts:
+        for name, table in shard_tables.items():
+            side_tables.setdefault(name, {}).update(table)
+    return rows, side_tables
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
+def admin_search(request):
+    """Typeahead search: ?q=...&types=users,cards,transactions&mode=prefix|contains&limit=N"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return Response({
+            'status': 'error',
+            'message': 'q is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    types = [name for name in request.GET.get('types', '').split(',') if name in search.SEARCHES]
+    mode = 'prefix' if request.GET.get('mode') == 'prefix' else 'contains'
+    try:
+        limit = min(max(int(request.GET.get('limit', search.DEFAULT_LIMIT)), 1), search.MAX_LIMIT)
+    except ValueError:
+        limit = search.DEFAULT_LIMIT
+    
+    return Response({
+        'status': 'success',
+        'data': search.search(query, types or list(search.SEARCHES), limit, mode)
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+@conditional(summary_freshness)
 def daily_payment_summary(request):
     """Get daily payment summary"""
     date_str = request.GET.get('date')
@@ -192,30 +443,94 @@ def daily_payment_summary(request):
     else:
         target_date = datetime.now().date()
     
-    transactions = Transaction.objects.filter(transaction_date__date=target_date)
+    totals = combine(sharding.scatter(daily_totals, target_date))
+    currency = fx.reporting_currency(request)
     
     summary = {
         'date': target_date.isoformat(),
+        'currency': currency,
+        'total_transactions': totals['total_transactions'],
+        'successful': totals['successful'],
+        'failed': totals['failed'],
+        'pending': totals['pending'],
+        'total_amount': float(fx.convert_groups(totals['total_amount'], currency)),
+        'successful_amount': float(fx.convert_groups(totals['successful_amount'], currency)),
+    }
+    
+    return Response({
+        'status': 'success',
+        'data': summary
+    }, status=status.HTTP_200_OK)
+
+def daily_totals(using, target_date):
+    """One shard's share of the daily summary, amounts as FX groups"""
+    transactions = Transaction.objects.using(using).filter(transaction_date__date=target_date)
+    return {
         'total_transactions': transactions.count(),
         'successful': transactions.filter(status='SUCCESS').count(),
         'failed': transactions.filter(status='FAILED').count(),
         'pending': transactions.filter(status='PENDING').count(),
-        'total_amount': float(transactions.aggregate(Sum('amount'))['amount__sum'] or 0),
-        'successful_amount': float(transactions.filter(status='SUCCESS').aggregate(Sum('amount'))['amount__sum'] or 0),
+        'total_amount': fx.currency_day_totals(transactions),
+        'successful_amount': fx.currency_day_totals(transactions.filter(status='SUCCESS')),
     }
+
+# Bucket widths the time series may use; the narrowest that fits MAX_TIMESERIES_BUCKETS is picked
+TIMESERIES_STEPS = (60, 300, 900, 3600, 21600, 86400)
+MAX_TIMESERIES_BUCKETS = 360
+MAX_TIMESERIES_MINUTES = 90 * 24 * 60
+
+def timeseries_freshness(request):
+    # Rollups move every flush interval; let polling dashboards share one response until then
+    return Freshness(cache_control={'private': True, 'max_age': int(settings.TIMESERIES_FLUSH_SECONDS)})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+@conditional(timeseries_freshness)
+def outcome_timeseries(request):
+    """
+    Payment outcomes per time bucket over the last `minutes` (default 60):
+    payments created, approved and failed, approval rate, approved volume
+    in the reporting currency and processing latency. Optional filters:
+    payment_currency, card_type. Served from the outcome rollups
+    (admin_panel/timeseries.py), never from the transactions table.
+    """
+    try:
+        minutes = min(max(int(request.GET.get('minutes', 60)), 1), MAX_TIMESERIES_MINUTES)
+    except ValueError:
+        return Response({
+            'status': 'error',
+            'message': 'minutes must be an integer'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    step = next((step for step in TIMESERIES_STEPS if minutes * 60 / step <= MAX_TIMESERIES_BUCKETS),
+                TIMESERIES_STEPS[-1])
+    
+    # Buckets line up on whole steps, and the last one holds the current, partial one
+    now = datetime.now(dt_timezone.utc).timestamp()
+    end = datetime.fromtimestamp((now // step + 1) * step, dt_timezone.utc)
+    start = end - timedelta(seconds=-(-minutes * 60 // step) * step)
+    currency = fx.reporting_currency(request)
     
+    buckets = timeseries.series(
+        start, end, step,
+        convert=lambda groups: fx.convert_groups(groups, currency),
+        currency=(request.GET.get('payment_currency') or '').upper() or None,
+        card_type=request.GET.get('card_type') or None,
+    )
     return Response({
         'status': 'success',
-        'data': summary
+        'data': {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'step': step,
+            'currency': currency,
+            'buckets': buckets,
+        }
     }, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 def export_transactions_csv(request):
     """Export transactions to CSV"""
     # Check if user is authenticated via header or URL token
-    from rest_framework_simplejwt.authentication import JWTAuthentication
-    from rest_framework.exceptions import AuthenticationFailed
-    
     user = None
     
     # Try to authenticate from Authorization header first
@@ -226,7 +541,7 @@ def export_transactions_csv(request):
         token = request.GET.get('token')
         if token:
             try:
-                jwt_auth = JWTAuthentication()
+                jwt_auth = RevocableJWTAuthentication()
                 validated_token = jwt_auth.get_validated_token(token)
                 user = jwt_auth.get_user(validated_token)
             except:
@@ -245,12 +560,18 @@ def export_transactions_csv(request):
     writer = csv.writer(response)
     writer.writerow(['ID', 'User', 'Card Type', 'Amount', 'Currency', 'Status', 'Date', 'Description'])
     
-    transactions = Transaction.objects.select_related('user', 'card').all()
+    # Gathered from every shard; usernames come from default in one query
+    transactions = newest_first(
+        sharding.scatter(lambda using: list(Transaction.objects.using(using).select_related('card'))),
+        key=lambda txn: txn.transaction_date
+    )
+    usernames = dict(User.objects.filter(id__in={txn.user_id for txn in transactions})
+                     .values_list('id', 'username'))
     
     for txn in transactions:
         writer.writerow([
             txn.id,
-            txn.user.username,
+            usernames.get(txn.user_id),
             txn.card.card_type,
             txn.amount,
             txn.currency,
@@ -259,4 +580,39 @@ def export_transactions_csv(request):
             txn.description
         ])
     
-    return response
\ No newline at end of file
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def list_profiles(request):
+    """Stored request profiles (see admin/profiling.py), newest first, without their queries and calls"""
+    page, page_size = get_page_params(request)
+    ids = profiling.stored_ids()
+    data = []
+    for profile_id in ids[(page - 1) * page_size:page * page_size]:
+        document = profiling.load(profile_id)
+        if document is not None:
+            document.pop('queries', None)
+            document.pop('http_calls', None)
+            data.append(document)
+    
+    return Response({
+        'status': 'success',
+        'data': data,
+        'count': len(ids)
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def download_profile(request, profile_id):
+    """One profile: ?format=folded (default) for flame graph tools, or json for its queries and HTTP calls"""
+    suffix = '.json' if request.GET.get('format') == 'json' else '.folded'
+    path = profiling.stored_path(profile_id, suffix)
+    if path is None:
+        return Response({
+            'status': 'error',
+            'message': 'Profile not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    content_type = 'application/json' if suffix == '.json' else 'text/plain; charset=utf-8'
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=profile_id + suffix, content_type=content_type)
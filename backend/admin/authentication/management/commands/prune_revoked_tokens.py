@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from authentication import revocation
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked-token rows whose tokens have expired anyway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, default=100,
+                            help='Upper bound on batches per run so one run stays short')
+        parser.add_argument('--loop', action='store_true', help='Keep pruning every --interval seconds')
+        parser.add_argument('--interval', type=int, default=3600)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            deleted = revocation.prune(options['batch_size'], options['max_batches'])
+            self.stdout.write(f'Pruned {deleted} expired revoked tokens in {time.monotonic() - started:.2f}s')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -44,6 +44,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     class Meta:
         db_table = 'users'
+        indexes = [
+            # Admin user listing, newest first
+            models.Index(fields=['date_joined', 'id'], name='user_joined_idx'),
+        ]
     
     def __str__(self):
         return self.username
@@ -52,4 +56,16 @@ class User(AbstractBaseUser, PermissionsMixin):
         return f"{self.first_name} {self.last_name}".strip()
     
     def get_short_name(self):
-        return self.first_name
\ No newline at end of file
+        return self.first_name
+
+class RevokedToken(models.Model):
+    """JWT ids revoked before they expire; rows can be pruned once expires_at has passed"""
+    id = models.BigAutoField(primary_key=True)
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        db_table = 'revoked_tokens'
+    
+    def __str__(self):
+        return self.jti
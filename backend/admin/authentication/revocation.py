@@ -0,0 +1,140 @@
+"""
+Revocation of JWTs before they expire.
+
+Revoked token ids (jti) are stored in the revoked_tokens table and mirrored
+in a per-process Bloom filter, so the usual answer for a token check ("not
+revoked") costs a few hashes and no query. Only filter hits, i.e. revoked
+tokens and the occasional false positive, go to the database.
+
+The filter is built from the table on the first check in each process and
+picks up revocations made by other workers every REVOCATION_SYNC_SECONDS
+with one indexed query. Rows are only needed until the token would have
+expired anyway; prune_revoked_tokens deletes them in bounded batches.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .models import RevokedToken
+
+# Rows re-read on every sync, to catch inserts that committed after a higher id was seen
+SYNC_OVERLAP = 100
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """The process-wide filter and its sync position in the revoked_tokens table"""
+
+    def __init__(self):
+        self.filter = None
+        self.last_id = 0
+        self.synced_at = 0.0
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        live = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        capacity = max(settings.REVOCATION_FILTER_CAPACITY, 2 * live.count())
+        new_filter = BloomFilter(capacity, settings.REVOCATION_FILTER_ERROR_RATE)
+        last_id = 0
+        for row_id, jti in live.order_by().values_list('id', 'jti').iterator(chunk_size=10000):
+            new_filter.add(jti)
+            last_id = max(last_id, row_id)
+        self.filter, self.last_id, self.synced_at = new_filter, last_id, time.monotonic()
+
+    def sync(self):
+        now = time.monotonic()
+        if self.filter is not None and now - self.synced_at < settings.REVOCATION_SYNC_SECONDS:
+            return
+        with self.lock:
+            if self.filter is None or self.filter.count > self.filter.capacity:
+                self.rebuild()
+                return
+            if now - self.synced_at < settings.REVOCATION_SYNC_SECONDS:
+                return
+            rows = RevokedToken.objects.filter(id__gt=self.last_id - SYNC_OVERLAP).values_list('id', 'jti')
+            for row_id, jti in rows:
+                if row_id > self.last_id:
+                    self.filter.add(jti)
+                    self.last_id = row_id
+                elif jti not in self.filter:
+                    self.filter.add(jti)
+            self.synced_at = now
+
+    def add(self, jti):
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(jti)
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self.filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+
+revocations = RevocationList()
+
+
+def revoke(token):
+    """Revoke a validated simplejwt token until it expires"""
+    jti = token[settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti')]
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.bulk_create([RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+    revocations.add(jti)
+
+
+def is_revoked(jti):
+    return revocations.is_revoked(jti)
+
+
+def prune(batch_size, max_batches):
+    """Delete expired rows, at most batch_size per statement; returns the count"""
+    deleted = 0
+    for _ in range(max_batches):
+        ids = list(RevokedToken.objects.filter(expires_at__lte=timezone.now())
+                   .order_by('expires_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += RevokedToken.objects.filter(id__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+class RevocableJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that also rejects tokens revoked at logout"""
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token.get(settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti'), '')):
+            raise InvalidToken({'detail': 'Token has been revoked', 'code': 'token_revoked'})
+        return token
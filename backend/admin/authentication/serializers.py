@@ -44,5 +44,5 @@ class UserLoginSerializer(serializers.Serializer):
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'is_staff', 'date_joined')
-        read_only_fields = ('id', 'date_joined')
\ No newline at end of file
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'date_joined')
+        read_only_fields = ('id', 'is_active', 'date_joined')
\ No newline at end of file
@@ -1,3 +1,184 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from admin import throttling
+from . import revocation
+from .models import RevokedToken, User
 
-# Create your tests here.
+
+class ThrottleStateMixin:
+    def setUp(self):
+        super().setUp()
+        throttling._local_buckets.clear()
+        self.addCleanup(throttling._local_buckets.clear)
+
+
+class TokenBucketTests(ThrottleStateMixin, SimpleTestCase):
+    def consume(self, key, rate, now):
+        with mock.patch('time.time', return_value=now):
+            return throttling.consume(key, rate)
+
+    def test_bucket_empties_then_refills_at_the_rate(self):
+        self.assertEqual([self.consume('k', '2/min', 1000.0)[0] for _ in range(3)], [True, True, False])
+        allowed, wait = self.consume('k', '2/min', 1000.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30.0)
+        self.assertTrue(self.consume('k', '2/min', 1030.0)[0])
+        self.assertFalse(self.consume('k', '2/min', 1030.0)[0])
+
+    def test_full_table_evicts_the_least_recently_used_bucket(self):
+        with mock.patch.object(throttling, 'LOCAL_BUCKET_LIMIT', 2):
+            self.consume('a', '1/min', 1000.0)
+            self.consume('b', '1/min', 1000.0)
+            self.consume('a', '1/min', 1001.0)
+            self.consume('c', '1/min', 1002.0)
+        self.assertEqual(list(throttling._local_buckets), ['a', 'c'])
+        # a keeps its (empty) bucket; only the idle b was reset
+        self.assertFalse(self.consume('a', '1/min', 1003.0)[0])
+        self.assertTrue(self.consume('b', '1/min', 1003.0)[0])
+
+    def redis_down(self, error):
+        """Patch consume() to see a Redis cache whose script call raises error"""
+        redis = SimpleNamespace(ConnectionError=type('ConnectionError', (Exception,), {}),
+                                TimeoutError=type('TimeoutError', (Exception,), {}))
+        fake_cache = type('FakeRedisCache', (), {})
+        patches = [
+            mock.patch.object(throttling, 'redis', redis),
+            mock.patch.object(throttling, 'RedisCache', fake_cache),
+            mock.patch.object(throttling, 'caches', {settings.RATE_LIMIT_CACHE: fake_cache()}),
+            mock.patch.object(throttling, '_consume_redis', side_effect=error(redis)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return throttling._consume_redis
+
+    def test_unreachable_redis_falls_back_to_local_buckets(self):
+        script = self.redis_down(lambda redis: redis.TimeoutError())
+        self.assertEqual([self.consume('k', '1/min', 1000.0)[0] for _ in range(2)], [True, False])
+        self.assertEqual(script.call_count, 2)
+
+    def test_other_redis_errors_are_not_swallowed(self):
+        self.redis_down(lambda redis: ValueError('bad script'))
+        with self.assertRaises(ValueError):
+            self.consume('k', '1/min', 1000.0)
+        self.assertEqual(len(throttling._local_buckets), 0)
+
+
+@override_settings(RATE_LIMITS={'auth': {'user': None, 'ip': '2/min', 'global': None}})
+class LoginThrottleTests(ThrottleStateMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('erin', 'erin@example.com', 'pw12345!')
+
+    def login(self, **headers):
+        return APIClient().post('/api/auth/login/', {'username': 'erin', 'password': 'wrong'},
+                                format='json', **headers)
+
+    def test_limited_login_is_429_with_retry_after(self):
+        self.assertEqual([self.login().status_code for _ in range(2)], [401, 401])
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_forwarded_for_cannot_pick_a_fresh_bucket(self):
+        codes = [self.login(HTTP_X_FORWARDED_FOR=f'203.0.113.{n}').status_code for n in range(3)]
+        self.assertEqual(codes, [401, 401, 429])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_behind_a_proxy_only_its_entry_is_trusted(self):
+        # The client may prepend anything; the proxy's own entry comes last
+        codes = [self.login(HTTP_X_FORWARDED_FOR=f'10.9.9.{n}, 198.51.100.7').status_code for n in range(3)]
+        self.assertEqual(codes, [401, 401, 429])
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='198.51.100.8').status_code, 401)
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_added_keys_are_always_found(self):
+        bloom = revocation.BloomFilter(1000, 0.01)
+        keys = [f'jti-{n}' for n in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positives_stay_near_the_error_rate(self):
+        bloom = revocation.BloomFilter(1000, 0.01)
+        for n in range(1000):
+            bloom.add(f'jti-{n}')
+        false_positives = sum(f'other-{n}' in bloom for n in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class RevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('frank', 'frank@example.com', 'pw12345!')
+
+    def setUp(self):
+        # A fresh process-wide filter for each test
+        patch = mock.patch.object(revocation, 'revocations', revocation.RevocationList())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def client_for(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        refresh = RefreshToken.for_user(self.user)
+        access = str(refresh.access_token)
+        client = self.client_for(access)
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 200)
+        response = client.post('/api/auth/logout/', {'refresh_token': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 401)
+        self.assertTrue(revocation.is_revoked(refresh['jti']))
+
+    def test_bad_refresh_token_still_revokes_the_access_token(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        client = self.client_for(access)
+        response = client.post('/api/auth/logout/', {'refresh_token': 'not-a-token'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 401)
+
+    def test_other_tokens_keep_working(self):
+        kept = str(RefreshToken.for_user(self.user).access_token)
+        self.client_for(str(RefreshToken.for_user(self.user).access_token)).post('/api/auth/logout/')
+        self.assertEqual(self.client_for(kept).get('/api/auth/profile/').status_code, 200)
+
+    def test_revocation_by_another_worker_is_picked_up_at_the_next_sync(self):
+        self.assertFalse(revocation.is_revoked('seen-early'))
+        # Written by another process: only the table has it
+        RevokedToken.objects.create(jti='elsewhere', expires_at=timezone.now() + timedelta(hours=1))
+        with override_settings(REVOCATION_SYNC_SECONDS=3600):
+            self.assertFalse(revocation.is_revoked('elsewhere'))
+        with override_settings(REVOCATION_SYNC_SECONDS=0):
+            self.assertTrue(revocation.is_revoked('elsewhere'))
+
+    def test_filter_is_rebuilt_larger_when_over_capacity(self):
+        with override_settings(REVOCATION_FILTER_CAPACITY=2, REVOCATION_SYNC_SECONDS=0):
+            revocation.is_revoked('warm-up')
+            for n in range(3):
+                revocation.revoke({'jti': f'jti-{n}', 'exp': (timezone.now() + timedelta(hours=1)).timestamp()})
+            self.assertTrue(revocation.is_revoked('jti-0'))
+            self.assertGreaterEqual(revocation.revocations.filter.capacity, 6)
+            self.assertTrue(all(revocation.is_revoked(f'jti-{n}') for n in range(3)))
+
+    def test_prune_deletes_only_expired_rows_in_bounded_batches(self):
+        now = timezone.now()
+        for n in range(5):
+            RevokedToken.objects.create(jti=f'old-{n}', expires_at=now - timedelta(minutes=n + 1))
+        RevokedToken.objects.create(jti='live', expires_at=now + timedelta(hours=1))
+        self.assertEqual(revocation.prune(batch_size=2, max_batches=1), 2)
+        out = StringIO()
+        call_command('prune_revoked_tokens', batch_size=2, stdout=out)
+        self.assertIn('Pruned 3', out.getvalue())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
@@ -1,14 +1,28 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.utils import timezone
+from admin import fx
+from admin.asyncviews import async_api_view
+from admin.caching import Freshness, conditional
+from admin.throttling import throttles_for
+from admin_panel import stats
+from cards.models import Card
+from cards.serializers import CardListSerializer
+from transactions.models import Transaction
+from transactions.serializers import TransactionSerializer
+from . import revocation
 from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer
 
+OVERVIEW_RECENT_DEFAULT = 5
+OVERVIEW_RECENT_MAX = 50
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(throttles_for('auth'))
 def register_view(request):
     serializer = UserRegistrationSerializer(data=request.data)
     
@@ -37,6 +51,7 @@ def register_view(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(throttles_for('auth'))
 def login_view(request):
     serializer = UserLoginSerializer(data=request.data)
     
@@ -84,27 +99,82 @@ def login_view(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
+    # The access token used for this request stops working first, whatever the refresh token turns out to be
+    revocation.revoke(request.auth)
     try:
         refresh_token = request.data.get('refresh_token')
         if refresh_token:
-            token = RefreshToken(refresh_token)
-            token.blacklist()
-        
+            revocation.revoke(RefreshToken(refresh_token))
+
         return Response({
             'status': 'success',
             'message': 'Logout successful'
         }, status=status.HTTP_200_OK)
-    except Exception as e:
+    except Exception:
         return Response({
             'status': 'error',
             'message': 'Logout failed'
         }, status=status.HTTP_400_BAD_REQUEST)
 
+def profile_freshness(request):
+    # The user row is already loaded by authentication, so this costs no query
+    user = request.user
+    fields = UserSerializer.Meta.fields
+    return Freshness(etag='profile:' + '|'.join(str(getattr(user, name)) for name in fields))
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(profile_freshness)
 def profile_view(request):
     serializer = UserSerializer(request.user)
     return Response({
         'status': 'success',
         'data': serializer.data
+    }, status=status.HTTP_200_OK)
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional(profile_freshness)
+async def aprofile_view(request):
+    """profile_view for ASGI: authentication loads the user, after that no query is needed"""
+    serializer = UserSerializer(request.user)
+    return Response({
+        'status': 'success',
+        'data': serializer.data
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def overview_view(request):
+    """Everything the home screen needs in one round trip"""
+    try:
+        recent = min(max(int(request.GET.get('recent', OVERVIEW_RECENT_DEFAULT)), 0), OVERVIEW_RECENT_MAX)
+    except ValueError:
+        recent = OVERVIEW_RECENT_DEFAULT
+    
+    user = request.user
+    cards = Card.objects.for_user(user.id).filter(user=user)
+    # The user row is on default, not the user's shard, so it is prefetched rather than joined
+    transactions = (Transaction.objects.for_user(user.id).filter(user=user)
+                    .select_related('card').prefetch_related('user')[:recent])
+    user_stats = stats.get_stats(user.id)
+    currency = fx.reporting_currency(request)
+    
+    return Response({
+        'status': 'success',
+        'data': {
+            'user': UserSerializer(user).data,
+            'cards': CardListSerializer(cards, many=True).data,
+            'recent_transactions': TransactionSerializer(transactions, many=True).data,
+            'totals': {
+                'total_cards': user_stats.card_count,
+                'total_transactions': user_stats.transaction_count,
+                'pending': user_stats.pending_count,
+                'success': user_stats.success_count,
+                'failed': user_stats.failed_count,
+                'total_spent': fx.convert_groups(stats.spend_groups(user.id), currency),
+                'currency': currency,
+                'last_transaction_at': user_stats.last_transaction_at,
+            }
+        }
     }, status=status.HTTP_200_OK)
\ No newline at end of file
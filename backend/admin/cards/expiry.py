@@ -0,0 +1,43 @@
+import heapq
+from itertools import islice
+from django.contrib.auth import get_user_model
+from admin import sharding
+from .models import Card
+
+SCAN_COLUMNS = ('id', 'user_id', 'user__email', 'card_type', 'last_four_digits', 'expires_on')
+# What a shard can read itself: users (for the email) live on default
+SHARD_COLUMNS = tuple(column for column in SCAN_COLUMNS if column != 'user__email')
+
+
+def _scan_shard(using, start, end, batch_size):
+    """SHARD_COLUMNS tuples for one shard's cards in the window, in (expires_on, id) order"""
+    queryset = Card.objects.using(using).filter(expires_on__lt=end).order_by('expires_on', 'id')
+    first = queryset.filter(expires_on__gte=start) if start is not None else queryset
+    batch = list(first.values_list(*SHARD_COLUMNS)[:batch_size])
+    while batch:
+        yield from batch
+        if len(batch) < batch_size:
+            break
+        last_id, last_date = batch[-1][0], batch[-1][-1]
+        batch = list(
+            queryset.filter(expires_on__gte=last_date)
+            .exclude(expires_on=last_date, id__lte=last_id)
+            .values_list(*SHARD_COLUMNS)[:batch_size]
+        )
+
+
+def expiring_cards(start, end, batch_size=5000):
+    """
+    Yield SCAN_COLUMNS tuples for cards with start <= expires_on < end (no
+    lower bound when start is None), in
+    (expires_on, id) order. Each batch resumes after the last row of the
+    previous one, so the scan walks card_expiry_idx once however large the window.
+    Shards are scanned side by side and merged; emails are looked up a batch at a time.
+    """
+    streams = [_scan_shard(alias, start, end, batch_size) for alias in sharding.aliases()]
+    merged = heapq.merge(*streams, key=lambda row: (row[-1], row[0]))
+    users = get_user_model().objects
+    while batch := list(islice(merged, batch_size)):
+        emails = dict(users.filter(id__in={row[1] for row in batch}).values_list('id', 'email'))
+        for row in batch:
+            yield (row[0], row[1], emails.get(row[1])) + row[2:]
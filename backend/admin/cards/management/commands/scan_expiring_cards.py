@@ -0,0 +1,40 @@
+import csv
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from cards.expiry import SCAN_COLUMNS, expiring_cards
+
+
+class Command(BaseCommand):
+    help = 'Stream cards whose expiry falls in a date window as CSV, e.g. for expiry reminders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--within-days', type=int, default=30,
+                            help='Window from today; ignored when --start/--end are given')
+        parser.add_argument('--expired', action='store_true', help='Cards already past their expiry instead')
+        parser.add_argument('--start', type=date.fromisoformat, help='First expiry date (YYYY-MM-DD), inclusive')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last expiry date (YYYY-MM-DD), exclusive')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--output', help='Write CSV here instead of stdout')
+
+    def handle(self, *args, **options):
+        today = date.today()
+        if options['expired']:
+            start, end = None, today
+        else:
+            start = options['start'] or today
+            end = options['end'] or today + timedelta(days=options['within_days'])
+        if start is not None and start >= end:
+            raise CommandError('The window is empty: start must be before end')
+
+        out = open(options['output'], 'w', newline='') if options['output'] else self.stdout
+        try:
+            writer = csv.writer(out)
+            writer.writerow(column.replace('__', '_') for column in SCAN_COLUMNS)
+            count = 0
+            for row in expiring_cards(start, end, options['batch_size']):
+                writer.writerow(row)
+                count += 1
+        finally:
+            if out is not self.stdout:
+                out.close()
+        self.stderr.write(f'{count} cards expiring from {start or "the start"} to {end}')
@@ -0,0 +1,48 @@
+import calendar
+from datetime import date
+
+from django.db import migrations, models
+
+BACKFILL_BATCH = 5000
+
+
+def backfill_expires_on(apps, schema_editor):
+    """Derive expires_on from the text columns, a batch of cards at a time in id order"""
+    Card = apps.get_model('cards', 'Card')
+    last_id = 0
+    while True:
+        rows = list(Card.objects.filter(id__gt=last_id, expires_on__isnull=True).order_by('id')
+                    .values_list('id', 'expiry_month', 'expiry_year')[:BACKFILL_BATCH])
+        if not rows:
+            break
+        cards = []
+        for card_id, expiry_month, expiry_year in rows:
+            year, month = int(expiry_year), int(expiry_month)
+            cards.append(Card(id=card_id, expires_on=date(year, month, calendar.monthrange(year, month)[1])))
+        Card.objects.bulk_update(cards, ['expires_on'], batch_size=1000)
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='expires_on',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(backfill_expires_on, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='card',
+            name='expires_on',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['expires_on', 'id'], name='card_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-19 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0002_card_expires_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='card',
+            constraint=models.UniqueConstraint(fields=('fingerprint', 'user'), name='card_fingerprint_user_uniq'),
+        ),
+    ]
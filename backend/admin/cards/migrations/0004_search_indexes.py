@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0003_card_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['card_holder_name'], name='card_holder_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['last_four_digits'], name='card_last_four_idx'),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import calendar
+import hashlib
+import hmac
+from datetime import date
 from django.db import models
 from django.conf import settings
+from admin.sharding import ShardedManager
 
 class Card(models.Model):
     CARD_TYPES = [
@@ -9,22 +14,57 @@ class Card(models.Model):
         ('DISCOVER', 'Discover'),
     ]
     
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cards')
+    # No FK constraint: with sharding the user row lives in another database
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cards',
+                             db_constraint=False)
     card_type = models.CharField(max_length=20, choices=CARD_TYPES)
     masked_number = models.CharField(max_length=19)
     last_four_digits = models.CharField(max_length=4)
     card_holder_name = models.CharField(max_length=100)
     expiry_month = models.CharField(max_length=2)
     expiry_year = models.CharField(max_length=4)
+    # Last day the card is valid, derived from expiry_month/expiry_year on save
+    expires_on = models.DateField()
+    # Keyed hash of the full card number; null for cards added before fingerprints existed
+    fingerprint = models.CharField(max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = ShardedManager()
+    
     class Meta:
         db_table = 'cards'
         ordering = ['-created_at']
+        indexes = [
+            # Expired/expiring sweeps are a range scan, paged by (expires_on, id)
+            models.Index(fields=['expires_on', 'id'], name='card_expiry_idx'),
+            # Prefix search in the admin panel (admin_panel/search.py)
+            models.Index(fields=['card_holder_name'], name='card_holder_name_idx'),
+            models.Index(fields=['last_four_digits'], name='card_last_four_idx'),
+        ]
+        constraints = [
+            # One card per user; fingerprint leads so the same index finds a card across users
+            models.UniqueConstraint(fields=['fingerprint', 'user'], name='card_fingerprint_user_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.card_type} - {self.masked_number}"
     
+    def save(self, *args, **kwargs):
+        self.expires_on = Card.expiry_date(self.expiry_month, self.expiry_year)
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def expiry_date(expiry_month, expiry_year):
+        """Last day of the expiry month, the final day a card is valid"""
+        year, month = int(expiry_year), int(expiry_month)
+        return date(year, month, calendar.monthrange(year, month)[1])
+    
+    @staticmethod
+    def fingerprint_for(card_number):
+        """HMAC-SHA256 of the digits under CARD_FINGERPRINT_KEY: stable per card, useless without the key"""
+        digits = ''.join(ch for ch in card_number if ch.isdigit())
+        return hmac.new(settings.CARD_FINGERPRINT_KEY.encode(), digits.encode(), hashlib.sha256).hexdigest()
+    
     @staticmethod
     def mask_card_number(card_number):
         """Mask card number showing only last 4 digits"""
@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from admin.serializers import DynamicFieldsMixin
 from .models import Card
 import re
-from datetime import datetime
+from datetime import date
 
 class CardSerializer(serializers.ModelSerializer):
     card_number = serializers.CharField(write_only=True, required=True)
@@ -10,9 +11,9 @@ class CardSerializer(serializers.ModelSerializer):
     class Meta:
         model = Card
         fields = ('id', 'card_type', 'masked_number', 'last_four_digits', 
-                  'card_holder_name', 'expiry_month', 'expiry_year', 'created_at',
+                  'card_holder_name', 'expiry_month', 'expiry_year', 'expires_on', 'created_at',
                   'card_number', 'cvv')
-        read_only_fields = ('id', 'card_type', 'masked_number', 'last_four_digits', 'created_at')
+        read_only_fields = ('id', 'card_type', 'masked_number', 'last_four_digits', 'expires_on', 'created_at')
     
     def validate_card_number(self, value):
         """Validate card number"""
@@ -66,10 +67,7 @@ class CardSerializer(serializers.ModelSerializer):
         if len(expiry_year) != 4:
             raise serializers.ValidationError({"expiry_year": "Year must be 4 digits"})
         
-        current_date = datetime.now()
-        expiry_date = datetime(int(expiry_year), int(expiry_month), 1)
-        
-        if expiry_date < datetime(current_date.year, current_date.month, 1):
+        if Card.expiry_date(expiry_month, expiry_year) < date.today():
             raise serializers.ValidationError({"expiry_date": "Card has expired"})
         
         return attrs
@@ -81,11 +79,12 @@ class CardSerializer(serializers.ModelSerializer):
         validated_data['card_type'] = Card.detect_card_type(card_number)
         validated_data['masked_number'] = Card.mask_card_number(card_number)
         validated_data['last_four_digits'] = card_number[-4:]
+        validated_data['fingerprint'] = Card.fingerprint_for(card_number)
         
         return super().create(validated_data)
 
-class CardListSerializer(serializers.ModelSerializer):
+class CardListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Card
         fields = ('id', 'card_type', 'masked_number', 'last_four_digits', 
-                  'card_holder_name', 'expiry_month', 'expiry_year', 'created_at')
\ No newline at end of file
+                  'card_holder_name', 'expiry_month', 'expiry_year', 'expires_on', 'created_at')
\ No newline at end of file
@@ -1,3 +1,111 @@
-from django.test import TestCase
+import csv
+from datetime import date
+from io import StringIO
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from authentication.models import User
+from .expiry import expiring_cards
+from .models import Card
 
-# Create your tests here.
+
+class ExpiryScanTests(TestCase):
+    """The keyset scan returns each card in the window once, in (expires_on, id) order, at any batch size"""
+    # Cards live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        # Several users, so with DB_SHARDS > 1 the scan merges more than one shard
+        users = [User.objects.create_user(f'ivan{n}', f'ivan{n}@example.com', 'pw12345!') for n in range(3)]
+        cls.cards = []
+        for index, (month, year) in enumerate([('01', '2030'), ('02', '2030'), ('02', '2030'), ('02', '2030'),
+                                               ('03', '2030'), ('04', '2030'), ('02', '2030'), ('06', '2029')]):
+            user = users[index % len(users)]
+            cls.cards.append(Card.objects.create(
+                user=user, card_type='VISA', masked_number=f'**** **** **** 10{index:02}',
+                last_four_digits=f'10{index:02}', card_holder_name='IVAN', expiry_month=month, expiry_year=year))
+
+    def expected(self, start, end):
+        cards = [card for card in self.cards if (start is None or start <= card.expires_on) and card.expires_on < end]
+        return [(card.id, card.user_id, card.user.email, 'VISA', card.last_four_digits, card.expires_on)
+                for card in sorted(cards, key=lambda card: (card.expires_on, card.id))]
+
+    def test_pages_through_ties_at_any_batch_size(self):
+        start, end = date(2030, 2, 1), date(2030, 4, 1)
+        for batch_size in (1, 2, 3, 100):
+            with self.subTest(batch_size=batch_size):
+                rows = list(expiring_cards(start, end, batch_size))
+                self.assertEqual(rows, self.expected(start, end))
+        # Four cards share 2030-02-28; a page boundary inside them must neither skip nor repeat one
+        self.assertEqual(len(rows), 5)
+
+    def test_open_start_includes_everything_before_the_end(self):
+        rows = list(expiring_cards(None, date(2030, 2, 28), batch_size=2))
+        self.assertEqual(rows, self.expected(None, date(2030, 2, 28)))
+        self.assertEqual([row[-1] for row in rows], [date(2029, 6, 30), date(2030, 1, 31)])
+
+    def test_command_writes_csv(self):
+        out, err = StringIO(), StringIO()
+        call_command('scan_expiring_cards', start=date(2030, 1, 1), end=date(2030, 3, 1), batch_size=2,
+                     stdout=out, stderr=err)
+        header, *rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(header, ['id', 'user_id', 'user_email', 'card_type', 'last_four_digits', 'expires_on'])
+        self.assertEqual([int(row[0]) for row in rows],
+                         [row[0] for row in self.expected(date(2030, 1, 1), date(2030, 3, 1))])
+        self.assertIn('5 cards expiring', err.getvalue())
+
+    def test_command_refuses_an_empty_window(self):
+        with self.assertRaises(CommandError):
+            call_command('scan_expiring_cards', start=date(2030, 3, 1), end=date(2030, 3, 1), stdout=StringIO())
+
+
+class DuplicateCardTests(TransactionTestCase):
+    """A user holds a card number once; admins find every user's copy of a number by its fingerprint"""
+    # Cards live on their user's shard when DB_SHARDS > 1, and find_card reads the shards from
+    # worker threads, which cannot see rows inside a TestCase transaction
+    databases = '__all__'
+    number = '4242 4242 4242 4242'
+
+    def setUp(self):
+        self.judy = User.objects.create_user('judy', 'judy@example.com', 'pw12345!')
+        self.karl = User.objects.create_user('karl', 'karl@example.com', 'pw12345!')
+        self.staff = User.objects.create_user('lena', 'lena@example.com', 'pw12345!', is_staff=True)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def add(self, user, number=None):
+        return self.client_for(user).post('/api/cards/add/', {
+            'card_number': number or self.number, 'cvv': '123', 'card_holder_name': user.username,
+            'expiry_month': '12', 'expiry_year': '2030'}, format='json')
+
+    def find(self, user, **body):
+        return self.client_for(user).post('/api/admin-panel/cards/find/', body, format='json')
+
+    def test_same_number_twice_is_a_conflict(self):
+        self.assertEqual(self.add(self.judy).status_code, 201)
+        response = self.add(self.judy, self.number.replace(' ', ''))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('card_number', response.data['errors'])
+        self.assertEqual(Card.objects.for_user(self.judy.id).filter(user=self.judy).count(), 1)
+        # Another user may hold the same card
+        self.assertEqual(self.add(self.karl).status_code, 201)
+
+    def test_find_card_by_number_or_fingerprint(self):
+        self.add(self.judy)
+        self.add(self.karl)
+        self.add(self.karl, '5555555555554444')
+        response = self.find(self.staff, card_number=self.number)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(card['user']['username'] for card in response.data['data']['cards']),
+                         ['judy', 'karl'])
+        fingerprint = response.data['data']['fingerprint']
+        self.assertEqual(fingerprint, Card.fingerprint_for(self.number))
+        self.assertEqual(self.find(self.staff, fingerprint=fingerprint).data['count'], 2)
+        self.assertEqual(self.find(self.staff).status_code, 400)
+
+    def test_find_card_is_for_staff_only(self):
+        self.assertEqual(self.find(self.judy, card_number=self.number).status_code, 403)
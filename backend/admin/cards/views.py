@@ -2,6 +2,13 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count
+from admin import fx
+from admin.caching import Freshness, conditional
+from admin.serializers import parse_fields
+from admin.sharding import shard_for_user
+from admin_panel import stats
 from .models import Card
 from .serializers import CardSerializer, CardListSerializer
 
@@ -12,7 +19,17 @@ def add_card(request):
     serializer = CardSerializer(data=request.data)
     
     if serializer.is_valid():
-        serializer.save(user=request.user)
+        try:
+            with db_transaction.atomic(using=shard_for_user(request.user.id)):
+                serializer.save(user=request.user)
+                stats.card_added(request.user.id)
+        except IntegrityError:
+            # The (fingerprint, user) unique index already holds this card number
+            return Response({
+                'status': 'error',
+                'message': 'Card already added',
+                'errors': {'card_number': ['This card is already on file']}
+            }, status=status.HTTP_409_CONFLICT)
         return Response({
             'status': 'success',
             'message': 'Card added successfully',
@@ -25,12 +42,21 @@ def add_card(request):
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
+def card_list_freshness(request):
+    # The stats row is touched on every card add/delete, so it doubles as a version counter
+    user_stats = stats.get_stats(request.user.id)
+    return Freshness(
+        etag=f'cards:{user_stats.card_count}:{user_stats.updated_at.isoformat()}',
+        last_modified=user_stats.updated_at
+    )
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(card_list_freshness)
 def list_cards(request):
     """List all cards for the authenticated user"""
-    cards = Card.objects.filter(user=request.user)
-    serializer = CardListSerializer(cards, many=True)
+    cards = Card.objects.for_user(request.user.id).filter(user=request.user)
+    serializer = CardListSerializer(cards, many=True, fields=parse_fields(request))
     
     return Response({
         'status': 'success',
@@ -38,12 +64,21 @@ def list_cards(request):
         'count': cards.count()
     }, status=status.HTTP_200_OK)
 
+def card_freshness(request, card_id):
+    created_at = (Card.objects.for_user(request.user.id).filter(id=card_id, user=request.user)
+                  .values_list('created_at', flat=True).first())
+    if created_at is None:
+        return None
+    # Cards are never edited, only deleted, so the creation time identifies the version
+    return Freshness(etag=f'card:{card_id}:{created_at.isoformat()}', last_modified=created_at)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(card_freshness)
 def get_card(request, card_id):
     """Get a specific card"""
     try:
-        card = Card.objects.get(id=card_id, user=request.user)
+        card = Card.objects.for_user(request.user.id).get(id=card_id, user=request.user)
         serializer = CardListSerializer(card)
         
         return Response({
@@ -61,9 +96,18 @@ def get_card(request, card_id):
 def delete_card(request, card_id):
     """Delete a card"""
     try:
-        card = Card.objects.get(id=card_id, user=request.user)
+        card = Card.objects.for_user(request.user.id).get(id=card_id, user=request.user)
         card_info = f"{card.card_type} - {card.masked_number}"
-        card.delete()
+        
+        with db_transaction.atomic(using=card._state.db):
+            # Transactions cascade with the card, so take them out of the stats too
+            breakdown = {
+                row['status']: row['count']
+                for row in card.transactions.order_by().values('status').annotate(count=Count('id'))
+            }
+            success_groups = fx.currency_day_totals(card.transactions.filter(status='SUCCESS'))
+            card.delete()
+            stats.card_removed(request.user.id, breakdown, success_groups)
         
         return Response({
             'status': 'success',
@@ -0,0 +1,188 @@
+"""
+Settlement of successful payments, one cutoff at a time.
+
+A run settles every SUCCESS transaction whose outcome (updated_at) is
+before its cutoff and that no earlier run settled, so a payment that
+missed one run is picked up by the next. Merchants are the transactions'
+owners, the accounts webhooks are delivered to. Each shard gets one file,
+produced in two phases that resume from their checkpoints on
+SettlementFile:
+
+1. Mark: keyset reads of unsettled SUCCESS rows (plain SELECTs, no locks),
+   each batch tagged with the run id by one UPDATE that re-checks status
+   and settlement_run. Only those rows are locked, for the length of that
+   statement, and they are cold: live payments write PENDING rows and
+   their outcome, after the cutoff the run lags behind.
+2. Write: keyset reads of every row tagged with the run (SUCCESS is
+   final, so they cannot have changed since) into a fixed-width file, fsynced
+   and checkpointed (last id, bytes written) after every batch. A resumed
+   write truncates the file back to the checkpoint. Per (merchant,
+   currency, card brand) totals come from one grouped query at the end,
+   then a trailer with the counts and the SHA-256 of everything before it.
+   The file is renamed into place next to a sha256sum-style sidecar.
+
+Memory holds one batch however many rows the window has.
+
+Records are RECORD_WIDTH ASCII characters plus a newline. Amounts are in
+minor units of the record's currency; times are UTC.
+
+    H  "SETTLEMENT" run id(12) cutoff(14) shard(12)
+    D  transaction id(20) merchant(12) currency(3) brand(12) amount(15) succeeded at(14)
+    G  merchant(12) currency(3) brand(12) count(10) amount(18)
+    T  details(12) groups(10) sha256 of the preceding bytes(64)
+"""
+import hashlib
+import os
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+from admin import sharding
+from transactions.models import Transaction
+from .models import SettlementFile, SettlementRun
+
+RECORD_WIDTH = 100
+
+
+def _record(*fields):
+    return (''.join(fields).ljust(RECORD_WIDTH) + '\n').encode('ascii', 'replace')
+
+
+def _text(value, width):
+    return (value or '')[:width].ljust(width)
+
+
+def _minor(amount):
+    return int((amount * 100).to_integral_value())
+
+
+def header_record(run, shard):
+    return _record('H', 'SETTLEMENT', f'{run.id:012d}', f'{run.cutoff:%Y%m%d%H%M%S}', _text(shard, 12))
+
+
+def detail_record(txn_id, merchant_id, currency, brand, amount, succeeded_at):
+    return _record('D', f'{txn_id:020d}', f'{merchant_id:012d}', _text(currency, 3), _text(brand, 12),
+                   f'{_minor(amount):015d}', f'{succeeded_at:%Y%m%d%H%M%S}')
+
+
+def group_record(merchant_id, currency, brand, count, amount):
+    return _record('G', f'{merchant_id:012d}', _text(currency, 3), _text(brand, 12),
+                   f'{count:010d}', f'{_minor(amount):018d}')
+
+
+def trailer_record(details, groups, digest):
+    return _record('T', f'{details:012d}', f'{groups:010d}', digest)
+
+
+def file_path(run, shard):
+    return os.path.join(settings.SETTLEMENT_DIR, f'settlement_{run.cutoff:%Y%m%dT%H%M%S}_{shard}.dat')
+
+
+def settle(cutoff, batch_size=2000, log=lambda message: None):
+    """Run (or resume) the settlement for `cutoff` on every shard; returns the SettlementRun"""
+    run, _ = SettlementRun.objects.get_or_create(cutoff=cutoff)
+    if run.status == 'COMPLETE':
+        return run
+    for shard in sharding.aliases():
+        settlement_file, _ = SettlementFile.objects.get_or_create(
+            run=run, shard=shard, defaults={'path': file_path(run, shard)}
+        )
+        if settlement_file.status == 'MARKING':
+            mark(run, settlement_file, batch_size)
+            log(f'{shard}: marked through id {settlement_file.marked_through}')
+        if settlement_file.status == 'WRITING':
+            write(run, settlement_file, batch_size)
+            log(f'{shard}: wrote {settlement_file.record_count} transactions to {settlement_file.path}')
+    run.status = 'COMPLETE'
+    run.completed_at = timezone.now()
+    run.save(update_fields=['status', 'completed_at'])
+    return run
+
+
+def mark(run, settlement_file, batch_size):
+    """Tag the shard's unsettled SUCCESS rows before the cutoff with the run id, a batch per UPDATE"""
+    transactions = Transaction.objects.using(settlement_file.shard)
+    while True:
+        ids = list(transactions.filter(settlement_run__isnull=True, status='SUCCESS', updated_at__lt=run.cutoff,
+                                       id__gt=settlement_file.marked_through)
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        # A row that changed since the read stays unsettled for a later run. update() leaves
+        # updated_at alone, so it still says when the payment succeeded
+        transactions.filter(id__in=ids, status='SUCCESS', settlement_run__isnull=True).update(settlement_run=run.id)
+        # Only a starting point: re-marking from an older one finds nothing left to tag
+        settlement_file.marked_through = ids[-1]
+        settlement_file.save(update_fields=['marked_through'])
+    settlement_file.status = 'WRITING'
+    settlement_file.save(update_fields=['status'])
+
+
+def write(run, settlement_file, batch_size):
+    """Stream the run's rows on the shard into its file, resuming from the last checkpoint"""
+    path = settlement_file.path
+    part = path + '.part'
+    if os.path.exists(path) and not os.path.exists(part):
+        # Renamed into place before DONE was recorded
+        return _finish(settlement_file)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # No status filter: SUCCESS is final (transactions.views.set_transaction_status), so every row
+    # the mark phase tagged belongs in the file, and one missing from it would be settled unpaid
+    transactions = Transaction.objects.using(settlement_file.shard).filter(settlement_run=run.id)
+    digest = hashlib.sha256()
+    with open(part, 'a+b') as f:
+        # Anything past the checkpoint was written but never recorded: drop it and write it again
+        f.truncate(settlement_file.bytes_written)
+        f.seek(0)
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+        def append(data):
+            f.write(data)
+            digest.update(data)
+
+        if settlement_file.bytes_written == 0:
+            append(header_record(run, settlement_file.shard))
+        while True:
+            rows = list(transactions.filter(id__gt=settlement_file.written_through).order_by('id')
+                        .values_list('id', 'user_id', 'currency', 'card__card_type', 'amount', 'updated_at')
+                        [:batch_size])
+            if not rows:
+                break
+            append(b''.join(detail_record(*row) for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+            settlement_file.written_through = rows[-1][0]
+            settlement_file.bytes_written = f.tell()
+            settlement_file.record_count += len(rows)
+            settlement_file.save(update_fields=['written_through', 'bytes_written', 'record_count'])
+
+        groups = 0
+        for row in (transactions.order_by('user_id', 'currency', 'card__card_type')
+                    .values_list('user_id', 'currency', 'card__card_type')
+                    .annotate(Count('id'), Sum('amount')).iterator()):
+            append(group_record(*row))
+            groups += 1
+        checksum = digest.hexdigest()
+        # Not part of the trailer's own checksum; the sidecar covers the whole file
+        f.write(trailer_record(settlement_file.record_count, groups, checksum))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(part, path)
+    _finish(settlement_file)
+
+
+def _finish(settlement_file):
+    """Write the sidecar checksum of a complete file and record the file as done"""
+    path = settlement_file.path
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    with open(path + '.sha256', 'w') as f:
+        f.write(f'{digest.hexdigest()}  {os.path.basename(path)}\n')
+    settlement_file.status = 'DONE'
+    settlement_file.checksum = digest.hexdigest()
+    settlement_file.completed_at = timezone.now()
+    settlement_file.save(update_fields=['status', 'checksum', 'completed_at'])
@@ -0,0 +1,63 @@
+import fcntl
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from settlements import engine
+from settlements.models import SettlementRun
+
+
+class Command(BaseCommand):
+    help = 'Write the settlement files for every SUCCESS transaction before a cutoff, resuming unfinished runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cutoff', help='ISO 8601 time to settle up to (default: the last closed window)')
+        parser.add_argument('--window-hours', type=int, default=24,
+                            help='Length of a settlement window; default cutoffs fall on multiples of it (UTC)')
+        parser.add_argument('--delay-minutes', type=int, default=60,
+                            help='How long after a window closes before it is settled, so late outcomes land in it')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        cutoff = self.cutoff(options)
+        os.makedirs(settings.SETTLEMENT_DIR, exist_ok=True)
+        with open(os.path.join(settings.SETTLEMENT_DIR, '.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise CommandError('Another settlement run is in progress')
+
+            latest = SettlementRun.objects.filter(status='COMPLETE').order_by('-cutoff').first()
+            if latest is not None and cutoff < latest.cutoff:
+                raise CommandError(f'Cutoff {cutoff.isoformat()} is before the last completed run ({latest.cutoff.isoformat()})')
+
+            # Earlier runs first, so each transaction lands in the window it belongs to
+            for run in SettlementRun.objects.filter(status='RUNNING', cutoff__lt=cutoff).order_by('cutoff'):
+                self.stdout.write(f'Resuming settlement through {run.cutoff.isoformat()}')
+                self.report(engine.settle(run.cutoff, options['batch_size'], log=self.stdout.write))
+            self.report(engine.settle(cutoff, options['batch_size'], log=self.stdout.write))
+
+    def cutoff(self, options):
+        if options['cutoff']:
+            cutoff = parse_datetime(options['cutoff'])
+            if cutoff is None:
+                raise CommandError(f"Invalid --cutoff: {options['cutoff']}")
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff, dt_timezone.utc)
+            if cutoff > timezone.now():
+                raise CommandError('--cutoff is in the future')
+            return cutoff
+        window = options['window_hours'] * 3600
+        latest = (timezone.now() - timedelta(minutes=options['delay_minutes'])).timestamp()
+        return datetime.fromtimestamp(latest // window * window, dt_timezone.utc)
+
+    def report(self, run):
+        self.stdout.write(f'Settlement through {run.cutoff.isoformat()}: {run.status}')
+        for settlement_file in run.files.order_by('shard'):
+            self.stdout.write(
+                f'  {settlement_file.shard}: {settlement_file.record_count} transactions, '
+                f'{settlement_file.bytes_written} bytes of detail, sha256 {settlement_file.checksum} '
+                f'-> {settlement_file.path}'
+            )
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-19 10:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cutoff', models.DateTimeField(unique=True)),
+                ('status', models.CharField(choices=[('RUNNING', 'Running'), ('COMPLETE', 'Complete')], default='RUNNING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'settlement_runs',
+                'ordering': ['cutoff'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SettlementFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('MARKING', 'Marking'), ('WRITING', 'Writing'), ('DONE', 'Done')], default='MARKING', max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('marked_through', models.BigIntegerField(default=0)),
+                ('written_through', models.BigIntegerField(default=0)),
+                ('bytes_written', models.BigIntegerField(default=0)),
+                ('record_count', models.BigIntegerField(default=0)),
+                ('checksum', models.CharField(blank=True, max_length=64)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='settlements.settlementrun')),
+            ],
+            options={
+                'db_table': 'settlement_files',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='settlementfile',
+            constraint=models.UniqueConstraint(fields=('run', 'shard'), name='settlement_file_run_shard_uniq'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import models
+
+
+class SettlementRun(models.Model):
+    """Settlement of every SUCCESS transaction before `cutoff` not settled by an earlier run"""
+    STATUS_CHOICES = [
+        ('RUNNING', 'Running'),
+        ('COMPLETE', 'Complete'),
+    ]
+
+    cutoff = models.DateTimeField(unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='RUNNING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'settlement_runs'
+        ordering = ['cutoff']
+
+    def __str__(self):
+        return f"Settlement through {self.cutoff} ({self.status})"
+
+
+class SettlementFile(models.Model):
+    """A run's file for one shard, with the checkpoints its mark and write phases resume from"""
+    STATUS_CHOICES = [
+        ('MARKING', 'Marking'),
+        ('WRITING', 'Writing'),
+        ('DONE', 'Done'),
+    ]
+
+    run = models.ForeignKey(SettlementRun, on_delete=models.CASCADE, related_name='files')
+    shard = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='MARKING')
+    path = models.CharField(max_length=500)
+    # Keyset positions: last transaction id tagged with the run, and last one written out
+    marked_through = models.BigIntegerField(default=0)
+    written_through = models.BigIntegerField(default=0)
+    # Size of the file at the last fsync; a resumed write truncates back to it
+    bytes_written = models.BigIntegerField(default=0)
+    record_count = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'settlement_files'
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'shard'], name='settlement_file_run_shard_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.status})"
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from admin import sharding
+from authentication.models import User
+from cards.models import Card
+from transactions.models import Transaction
+from . import engine
+from .models import SettlementFile, SettlementRun
+
+
+class Crash(Exception):
+    pass
+
+
+class SettlementResumeTests(TestCase):
+    """A write phase resumed after a crash must produce the file a clean run produces"""
+    # Cards and transactions live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        merchants = []
+        for name, brands in (('merchant1', ('VISA', 'AMEX')), ('merchant2', ('MASTERCARD',))):
+            # In one bucket, so with DB_SHARDS > 1 all their rows land in the same shard's file
+            extra = {'id': merchants[0].id + sharding.BUCKETS} if merchants else {}
+            user = User.objects.create_user(name, f'{name}@example.com', 'pw12345!', **extra)
+            merchants.append(user)
+            for index, brand in enumerate(brands):
+                card = Card.objects.create(user=user, card_type=brand, masked_number=f'**** **** **** 000{index}',
+                                           last_four_digits=f'000{index}', card_holder_name=name.upper(),
+                                           expiry_month='12', expiry_year='2030')
+                for number, currency in enumerate(('USD', 'EUR', 'USD', 'INR', 'GBP')):
+                    Transaction.objects.create(user=user, card=card, amount=Decimal(f'{number + 1}.{index}5'),
+                                               currency=currency, status='SUCCESS')
+                Transaction.objects.create(user=user, card=card, amount=Decimal('7.00'), status='FAILED')
+                Transaction.objects.create(user=user, card=card, amount=Decimal('8.00'), status='PENDING')
+        cls.cutoff = timezone.now() + timedelta(minutes=1)
+        cls.shard = sharding.shard_for_user(merchants[0].id)
+        cls.transactions = Transaction.objects.using(cls.shard)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(SETTLEMENT_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def settle(self):
+        run = engine.settle(self.cutoff, batch_size=4)
+        settlement_file = run.files.get(shard=self.shard)
+        with open(settlement_file.path, 'rb') as f:
+            return settlement_file, f.read()
+
+    def reset(self, run):
+        """Put the run back to before it started, keeping its id so the header is the same"""
+        for settlement_file in run.files.all():
+            for path in (settlement_file.path, settlement_file.path + '.sha256', settlement_file.path + '.part'):
+                if os.path.exists(path):
+                    os.remove(path)
+        run.files.all().delete()
+        self.transactions.update(settlement_run=None)
+        SettlementRun.objects.filter(id=run.id).update(status='RUNNING', completed_at=None)
+
+    def groups(self, data):
+        lines = data.decode('ascii').splitlines()
+        return [line for line in lines if line.startswith('G')]
+
+    def test_crash_between_fsync_and_checkpoint_resumes_to_the_same_file(self):
+        clean_file, clean = self.settle()
+        self.reset(clean_file.run)
+
+        save = SettlementFile.save
+        checkpoints = []
+
+        def crash_on_second_checkpoint(settlement_file, *args, **kwargs):
+            if 'written_through' in kwargs.get('update_fields', ()):
+                checkpoints.append(settlement_file.written_through)
+                if len(checkpoints) == 2:
+                    raise Crash
+            return save(settlement_file, *args, **kwargs)
+
+        with mock.patch.object(SettlementFile, 'save', autospec=True, side_effect=crash_on_second_checkpoint):
+            with self.assertRaises(Crash):
+                engine.settle(self.cutoff, batch_size=4)
+
+        crashed = SettlementFile.objects.get(shard=self.shard)
+        part = crashed.path + '.part'
+        # The second batch reached the disk but not the checkpoint
+        self.assertEqual(crashed.status, 'WRITING')
+        self.assertGreater(os.path.getsize(part), crashed.bytes_written)
+
+        resumed_file, resumed = self.settle()
+        self.assertEqual(resumed, clean)
+        self.assertEqual(self.groups(resumed), self.groups(clean))
+        self.assertFalse(os.path.exists(part))
+        self.assertEqual(resumed_file.checksum, clean_file.checksum)
+        self.assertEqual(resumed_file.checksum, hashlib.sha256(resumed).hexdigest())
+        self.assertEqual(resumed_file.record_count, clean_file.record_count)
+        with open(resumed_file.path + '.sha256') as f:
+            self.assertEqual(f.read().split()[0], resumed_file.checksum)
+
+    def test_file_covers_every_success_transaction_once(self):
+        settlement_file, data = self.settle()
+        details = [line for line in data.decode('ascii').splitlines() if line.startswith('D')]
+        expected = self.transactions.filter(status='SUCCESS').order_by('id')
+        self.assertEqual([int(line[1:21]) for line in details], list(expected.values_list('id', flat=True)))
+        self.assertEqual(settlement_file.record_count, len(details))
+
+        totals = defaultdict(int)
+        for txn in expected.select_related('card'):
+            totals[(txn.user_id, txn.currency, txn.card.card_type)] += int(txn.amount * 100)
+        self.assertEqual({(int(line[1:13]), line[13:16], line[16:28].strip()): int(line[38:56])
+                          for line in self.groups(data)}, totals)
+
+    def test_later_run_does_not_settle_them_again(self):
+        run = engine.settle(self.cutoff, batch_size=4)
+        self.assertEqual(self.transactions.filter(settlement_run=run.id).count(),
+                         self.transactions.filter(status='SUCCESS').count())
+        later = engine.settle(self.cutoff + timedelta(minutes=1), batch_size=4)
+        self.assertEqual(later.files.get(shard=self.shard).record_count, 0)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class TransactionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "transactions"
+
+    def ready(self):
+        from admin.sharding import record_shard_count, reserve_id_ranges
+        post_migrate.connect(reserve_id_ranges, sender=self)
+        post_migrate.connect(record_shard_count, sender=self)
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.db.models import Max
+from rest_framework_simplejwt.tokens import RefreshToken
+from admin import sharding
+from transactions.models import Transaction
+
+# (label, handler, ASYNC_VIEWS) per setup; the URLconf picks the views at startup, so each runs in its own process
+MODES = {
+    'wsgi': ('WSGI, sync views', 'wsgi', False),
+    'asgi-sync': ('ASGI, sync views', 'asgi', False),
+    'asgi-async': ('ASGI, async views', 'asgi', True),
+}
+ENDPOINTS = {
+    'profile': lambda txn_id: '/api/auth/profile/',
+    'get': lambda txn_id: f'/api/transactions/{txn_id}/',
+    'list': lambda txn_id: '/api/transactions/list/',
+}
+
+
+def _latest_per_user(using, limit):
+    return list(Transaction.objects.using(using).values('user_id').annotate(latest=Max('id'))
+                .values_list('user_id', 'latest')[:limit])
+
+
+def workload(total, users, endpoints):
+    """(path, token) for each request, cycling endpoints and users"""
+    rows = [row for shard in sharding.scatter(_latest_per_user, users) for row in shard][:users]
+    if not rows:
+        raise CommandError('No transactions to request; run seed_scale first')
+    tokens = {user.id: str(RefreshToken.for_user(user).access_token)
+              for user in get_user_model().objects.filter(id__in=[user_id for user_id, _ in rows])}
+    return [
+        (ENDPOINTS[endpoints[i % len(endpoints)]](rows[i % len(rows)][1]), tokens[rows[i % len(rows)][0]])
+        for i in range(total)
+    ]
+
+
+def wsgi_caller(threads):
+    from django.core.handlers.wsgi import WSGIHandler
+    handler = WSGIHandler()
+    pool = ThreadPoolExecutor(max_workers=threads)
+
+    def call(path, token):
+        statuses = []
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80', 'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http',
+            'HTTP_AUTHORIZATION': f'Bearer {token}', 'HTTP_ACCEPT': 'application/json',
+        }
+        response = handler(environ, lambda status, headers: statuses.append(int(status[:3])))
+        b''.join(response)
+        response.close()
+        return statuses[0]
+
+    async def caller(path, token):
+        # Waiting for a free worker thread is part of the latency, as behind gunicorn --threads
+        return await asyncio.get_running_loop().run_in_executor(pool, call, path, token)
+    return caller
+
+
+def asgi_caller():
+    from django.core.handlers.asgi import ASGIHandler
+    handler = ASGIHandler()
+
+    async def caller(path, token):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode()),
+                        (b'accept', b'application/json')],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        requested = False
+        statuses = []
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await handler(scope, receive, send)
+        return statuses[0]
+    return caller
+
+
+async def drive(caller, requests, concurrency):
+    """Run requests through caller with `concurrency` clients; (seconds, latencies, errors)"""
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(path, token):
+        nonlocal errors
+        async with slots:
+            started = time.perf_counter()
+            status = await caller(path, token)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(path, token) for path, token in requests))
+    return time.perf_counter() - started, latencies, errors
+
+
+class Command(BaseCommand):
+    help = ('Compare request throughput and latency of the async endpoints (admin/asyncviews.py) with the same '
+            'endpoints served synchronously under WSGI and ASGI, on existing data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--endpoints', default='profile,get,list',
+                            help=f'Comma-separated, from {", ".join(ENDPOINTS)}')
+        parser.add_argument('--latency-ms', type=float, default=2.0,
+                            help='Delay added to every query, standing in for a networked database')
+        parser.add_argument('--modes', default=','.join(MODES), help=f'Comma-separated, from {", ".join(MODES)}')
+        parser.add_argument('--run-mode', choices=list(MODES), help='Internal: measure one mode in this process')
+
+    def handle(self, *args, **options):
+        if options['run_mode']:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+
+        results = []
+        for mode in options['modes'].split(','):
+            if mode not in MODES:
+                raise CommandError(f'Unknown mode {mode}')
+            argv = [sys.executable, '-m', 'django', 'bench_async_views', '--run-mode', mode]
+            for name in ('requests', 'concurrency', 'threads', 'users', 'endpoints', 'latency_ms'):
+                argv += [f'--{name.replace("_", "-")}', str(options[name])]
+            env = {**os.environ, 'ASYNC_VIEWS': str(MODES[mode][2])}
+            child = subprocess.run(argv, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if child.returncode != 0:
+                raise CommandError(f'{mode} failed:\n{child.stderr[-2000:]}')
+            results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(
+            f"{options['requests']} requests ({options['endpoints']}), concurrency {options['concurrency']}, "
+            f"{options['latency_ms']}ms per query, {options['threads']} WSGI threads"
+        )
+        self.stdout.write(f'{"":>18} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"threads":>8} {"errors":>7}')
+        for result in results:
+            self.stdout.write(
+                f"{result['label']:>18} {result['throughput']:>8.0f} {result['p50_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['peak_threads']:>8} {result['errors']:>7}"
+            )
+
+    def measure(self, options):
+        label, handler, _ = MODES[options['run_mode']]
+        latency = options['latency_ms'] / 1000
+
+        def delayed(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        requests = workload(options['requests'], options['users'], options['endpoints'].split(','))
+        def add_latency(sender, connection, **kwargs):
+            # Fired on every reconnect of a thread's connection; add the delay once
+            if delayed not in connection.execute_wrappers:
+                connection.execute_wrappers.append(delayed)
+
+        if latency:
+            connection_created.connect(add_latency, weak=False)
+        caller = wsgi_caller(options['threads']) if handler == 'wsgi' else asgi_caller()
+
+        peak_threads = threading.active_count()
+        done = threading.Event()
+
+        def watch():
+            nonlocal peak_threads
+            while not done.wait(0.005):
+                peak_threads = max(peak_threads, threading.active_count())
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+
+        # One pass to warm up (URL resolution, revocation filter, serializer compiles), then the measured one
+        asyncio.run(drive(caller, requests[:options['concurrency']], options['concurrency']))
+        seconds, latencies, errors = asyncio.run(drive(caller, requests, options['concurrency']))
+        done.set()
+        watcher.join()
+
+        cuts = statistics.quantiles(latencies, n=100)
+        return {
+            'label': label,
+            'throughput': len(latencies) / seconds,
+            'p50_ms': cuts[49] * 1000,
+            'p99_ms': cuts[98] * 1000,
+            'peak_threads': peak_threads - 1,
+            'errors': errors,
+        }
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from admin.renderers import FastJSONRenderer
+from transactions.models import Transaction
+from transactions.serializers import TransactionSerializer, serialize_transactions
+
+
+class Command(BaseCommand):
+    help = 'Compare rows serialized per second by TransactionSerializer and the fast read path on existing data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per page, like a list endpoint')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        queryset = Transaction.objects.order_by('-transaction_date')[:rows]
+        count = queryset.count()
+        if not count:
+            raise CommandError('No transactions to serialize; run seed_scale first')
+
+        renderer = FastJSONRenderer()
+        slow = lambda: TransactionSerializer(queryset.select_related('card', 'user'), many=True).data
+        fast = lambda: serialize_transactions(queryset)[0]
+        if renderer.render(slow()) != renderer.render(fast()):
+            raise CommandError('Fast path output differs from TransactionSerializer')
+
+        results = {}
+        for name, func in [('TransactionSerializer', slow), ('fast path', fast)]:
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                best = min(best, time.perf_counter() - started)
+            results[name] = count / best
+            self.stdout.write(f'{name:>22}: {count / best:>10.0f} rows/s ({best * 1000:.1f}ms per {count} rows)')
+        speedup = results['fast path'] / results['TransactionSerializer']
+        self.stdout.write(self.style.SUCCESS(f'Fast path is {speedup:.1f}x faster, including the query'))
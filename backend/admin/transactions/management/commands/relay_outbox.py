@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from admin import sharding
+from transactions import outbox
+
+
+class Command(BaseCommand):
+    help = 'Publish queued transaction events from the outbox table to the configured sinks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=100,
+                            help='Upper bound on batches per pass so one run stays short')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep relaying, polling every --interval seconds when the outbox is empty')
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--retry-delay', type=float, default=5.0,
+                            help='Seconds to wait after a sink fails before retrying the batch')
+
+    def handle(self, *args, **options):
+        sinks = outbox.load_sinks()
+        if not sinks:
+            raise CommandError('No outbox sinks configured (OUTBOX_SINKS is empty)')
+
+        while True:
+            try:
+                relayed = self.relay(sinks, options)
+            except Exception as e:
+                if not options['loop']:
+                    raise CommandError(f'Sink failed: {e}')
+                self.stderr.write(f'Sink failed, retrying in {options["retry_delay"]}s: {e}')
+                time.sleep(options['retry_delay'])
+                continue
+            if not options['loop']:
+                break
+            if relayed < options['batch_size']:
+                time.sleep(options['interval'])
+
+    def relay(self, sinks, options):
+        started = time.monotonic()
+        relayed = 0
+        for shard in sharding.aliases():
+            for _ in range(options['max_batches']):
+                count = outbox.relay_batch(sinks, options['batch_size'], using=shard)
+                relayed += count
+                if count < options['batch_size']:
+                    break
+        if relayed:
+            self.stdout.write(f'Relayed {relayed} events in {time.monotonic() - started:.2f}s')
+        return relayed
@@ -0,0 +1,64 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from admin import sharding
+from transactions import sweeper
+
+
+class Command(BaseCommand):
+    help = 'Re-drive or expire PENDING transactions the payment processor never finished'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Seconds since last update before a PENDING row counts as stuck')
+        parser.add_argument('--expire-after', type=int, default=3600,
+                            help='Seconds since creation after which a stuck row is marked FAILED instead of re-driven')
+        parser.add_argument('--expire-only', action='store_true', help='Never re-drive, only expire')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Maximum concurrent calls to the payment processor')
+        parser.add_argument('--max-batches', type=int, default=50,
+                            help='Upper bound on batches per sweep so one run stays short')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every --interval seconds')
+        parser.add_argument('--interval', type=int, default=60)
+
+    def handle(self, *args, **options):
+        if not options['expire_only'] and not settings.PAYMENT_PROCESSOR_KEY:
+            self.stderr.write('PAYMENT_PROCESSOR_KEY is not set: re-drives will be rate limited like client payments')
+        while True:
+            self.sweep(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def sweep(self, options):
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=options['stale_after'])
+        expire_before = now - timedelta(seconds=options['expire_after'])
+        started = time.monotonic()
+        expired = claimed = redriven = 0
+
+        for shard in sharding.aliases():
+            for _ in range(options['max_batches']):
+                count = sweeper.expire_stale(stale_before, expire_before, options['batch_size'], using=shard)
+                expired += count
+                if count < options['batch_size']:
+                    break
+
+            if not options['expire_only']:
+                for _ in range(options['max_batches']):
+                    rows = sweeper.claim_for_redrive(stale_before, expire_before, options['batch_size'], using=shard)
+                    if not rows:
+                        break
+                    claimed += len(rows)
+                    redriven += sweeper.redrive(rows, options['concurrency'])
+                    if len(rows) < options['batch_size']:
+                        break
+
+        self.stdout.write(
+            f'Swept pending transactions in {time.monotonic() - started:.2f}s: '
+            f'expired={expired} redrive_attempted={claimed} '
+            f'redrive_succeeded={redriven} redrive_failed={claimed - redriven}'
+        )
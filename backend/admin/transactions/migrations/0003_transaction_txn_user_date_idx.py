@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_transaction_txn_status_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-transaction_date'], name='txn_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['amount'], name='txn_amount_idx'),
+        ),
+    ]
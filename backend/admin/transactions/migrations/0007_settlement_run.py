@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-19 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_user_db_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='settlement_run',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['settlement_run', 'status', 'id'], name='txn_settlement_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_settlement_run'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['settlement_run', 'id'], name='txn_settlement_run_idx'),
+        ),
+    ]
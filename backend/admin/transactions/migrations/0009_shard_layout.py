@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_settlement_run_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shards', models.PositiveSmallIntegerField()),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'shard_layout',
+            },
+        ),
+    ]
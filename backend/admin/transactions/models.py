@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from admin.sharding import ShardedManager
 from cards.models import Card
 
 class Transaction(models.Model):
@@ -16,7 +17,8 @@ class Transaction(models.Model):
         ('INR', 'Indian Rupee'),
     ]
     
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transactions')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transactions',
+                             db_constraint=False)
     card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='transactions')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default='USD')
@@ -25,10 +27,55 @@ class Transaction(models.Model):
     description = models.TextField(blank=True)
     transaction_date = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Id of the SettlementRun that paid this transaction out; not a foreign key, runs live on default
+    settlement_run = models.BigIntegerField(null=True, blank=True)
+    
+    objects = ShardedManager()
     
     class Meta:
         db_table = 'transactions'
         ordering = ['-transaction_date']
+        indexes = [
+            # Serves "latest N transactions for a user" straight from the index
+            models.Index(fields=['user', '-transaction_date'], name='txn_user_date_idx'),
+            # Lets the pending sweeper find stale rows without scanning the table
+            models.Index(fields=['status', 'updated_at'], name='txn_status_updated_idx'),
+            # Exact-amount lookups in the admin search
+            models.Index(fields=['amount'], name='txn_amount_idx'),
+            # Settlement walks unsettled SUCCESS rows, then one run's rows, by id (settlements/engine.py)
+            models.Index(fields=['settlement_run', 'status', 'id'], name='txn_settlement_idx'),
+            models.Index(fields=['settlement_run', 'id'], name='txn_settlement_run_idx'),
+        ]
     
     def __str__(self):
-        return f"Transaction {self.id} - {self.amount} {self.currency} - {self.status}"
\ No newline at end of file
+        return f"Transaction {self.id} - {self.amount} {self.currency} - {self.status}"
+
+class OutboxEvent(models.Model):
+    """Transaction events written alongside the change that caused them, drained by relay_outbox"""
+    CREATED = 'transaction.created'
+    STATUS_CHANGED = 'transaction.status_changed'
+    
+    id = models.BigAutoField(primary_key=True)
+    # Not a foreign key: events must outlive the transaction row and never block its deletion
+    transaction_id = models.BigIntegerField()
+    event_type = models.CharField(max_length=40)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Stored on the shard of its transaction
+    objects = ShardedManager()
+    
+    class Meta:
+        db_table = 'outbox_events'
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.event_type} for transaction {self.transaction_id}"
+
+class ShardLayout(models.Model):
+    """The DB_SHARDS the data was written with, one row on default (see admin/sharding.py)"""
+    shards = models.PositiveSmallIntegerField()
+    recorded_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'shard_layout'
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import threading
+import urllib.request
+from django.conf import settings
+from django.utils.module_loading import import_string
+from admin import sharding
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+
+def _payload(transaction_id, user_id, card_id, amount, currency, status, previous_status=None):
+    return {
+        'transaction_id': transaction_id,
+        'user_id': user_id,
+        'card_id': card_id,
+        'amount': str(amount),
+        'currency': currency,
+        'status': status,
+        'previous_status': previous_status,
+    }
+
+
+def record_created(transaction):
+    """Queue a transaction.created event; call inside the atomic block that created the row"""
+    OutboxEvent.objects.create(
+        transaction_id=transaction.id,
+        event_type=OutboxEvent.CREATED,
+        payload=_payload(transaction.id, transaction.user_id, transaction.card_id,
+                         transaction.amount, transaction.currency, transaction.status),
+    )
+
+
+def record_status_changes(rows):
+    """
+    Queue transaction.status_changed events for
+    (transaction_id, user_id, card_id, amount, currency, old_status, new_status) rows
+    inside the atomic block that changed them. Rows whose status did not change are skipped.
+    Each event is written to the shard of its transaction.
+    """
+    events = {}
+    for txn_id, user_id, card_id, amount, currency, old_status, new_status in rows:
+        if old_status != new_status:
+            events.setdefault(sharding.shard_for_id(txn_id), []).append(OutboxEvent(
+                transaction_id=txn_id,
+                event_type=OutboxEvent.STATUS_CHANGED,
+                payload=_payload(txn_id, user_id, card_id, amount, currency, new_status, old_status),
+            ))
+    for shard, shard_events in events.items():
+        OutboxEvent.objects.using(shard).bulk_create(shard_events)
+
+
+def as_message(event):
+    return {
+        'id': event.id,
+        'type': event.event_type,
+        'occurred_at': event.created_at.isoformat(),
+        'data': event.payload,
+    }
+
+
+class FileSink:
+    """Appends events as JSON lines to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def publish(self, messages):
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(message) + '\n' for message in messages))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class WebhookSink:
+    """POSTs each batch as {"events": [...]} to a URL; any non-2xx answer fails the batch"""
+
+    def __init__(self, url, timeout=10, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def publish(self, messages):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({'events': messages}).encode(),
+            headers={'Content-Type': 'application/json', **self.headers},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise OSError(f'{self.url} answered {response.status}')
+
+
+class InProcessBus:
+    """Delivers events to subscribers in this process (tests and local tooling)"""
+    subscribers = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def subscribe(cls, callback):
+        with cls._lock:
+            cls.subscribers.append(callback)
+
+    @classmethod
+    def unsubscribe(cls, callback):
+        with cls._lock:
+            cls.subscribers.remove(callback)
+
+    def publish(self, messages):
+        for callback in list(self.subscribers):
+            callback(messages)
+
+
+def load_sinks():
+    """Instantiate settings.OUTBOX_SINKS: [{'class': dotted path, **kwargs}, ...]"""
+    sinks = []
+    for config in settings.OUTBOX_SINKS:
+        options = dict(config)
+        sinks.append(import_string(options.pop('class'))(**options))
+    return sinks
+
+
+def relay_batch(sinks, batch_size, using='default'):
+    """
+    Publish the oldest batch of events on one shard to every sink, in id order, then delete them.
+
+    Delivery is at least once: if a sink fails the batch stays put and is sent
+    again next time, including to sinks that already took it, so consumers
+    should de-duplicate on the event id. Events for one transaction are
+    published in the order they were written as long as a single relay runs
+    (a transaction's events all live on its shard).
+    Returns the number of events relayed.
+    """
+    events = list(OutboxEvent.objects.using(using).order_by('id')[:batch_size])
+    if not events:
+        return 0
+    messages = [as_message(event) for event in events]
+    for sink in sinks:
+        sink.publish(messages)
+    OutboxEvent.objects.using(using).filter(id__in=[event.id for event in events]).delete()
+    return len(events)
@@ -0,0 +1,12 @@
+import hmac
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class IsPaymentProcessor(BasePermission):
+    """Allows requests carrying the shared payment processor key in X-Processor-Key"""
+
+    def has_permission(self, request, view):
+        expected = settings.PAYMENT_PROCESSOR_KEY
+        provided = request.META.get('HTTP_X_PROCESSOR_KEY', '')
+        return bool(expected) and hmac.compare_digest(provided.encode(), expected.encode())
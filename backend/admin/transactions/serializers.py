@@ -1,8 +1,14 @@
+from functools import lru_cache
 from rest_framework import serializers
+from django.contrib.auth import get_user_model
+from admin import sharding
+from admin.fastpath import FastSerializer
+from admin.serializers import DynamicFieldsMixin
+from cards.models import Card
 from .models import Transaction
 from cards.serializers import CardListSerializer
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     card_details = CardListSerializer(source='card', read_only=True)
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     
@@ -31,4 +37,67 @@ class TransactionCreateSerializer(serializers.Serializer):
             raise serializers.ValidationError("Amount must be greater than 0")
         if value > 100000:
             raise serializers.ValidationError("Amount cannot exceed 100,000")
-        return value
\ No newline at end of file
+        return value
+
+def full_name(first_name, last_name):
+    """User.get_full_name() from its columns"""
+    return f"{first_name} {last_name}".strip()
+
+TRANSACTION_COMPUTED = {
+    'user_name': (('user__first_name', 'user__last_name'), full_name),
+}
+
+# Shards have no users table to join: carry the user id in user_name and fill the names in afterwards
+SHARDED_TRANSACTION_COMPUTED = {
+    'user_name': (('user',), lambda user_id: user_id),
+}
+
+def _fill_user_names(rows):
+    user_ids = {row['user_name'] for row in rows}
+    names = {
+        user_id: full_name(first_name, last_name)
+        for user_id, first_name, last_name in get_user_model().objects.filter(id__in=user_ids)
+        .values_list('id', 'first_name', 'last_name')
+    }
+    for row in rows:
+        row['user_name'] = names.get(row['user_name'], '')
+
+@lru_cache(maxsize=128)
+def transaction_listing(fields, sharded):
+    """The compiled FastSerializer for a field tuple, built on first use and then reused"""
+    computed = SHARDED_TRANSACTION_COMPUTED if sharded else TRANSACTION_COMPUTED
+    return FastSerializer(TransactionSerializer, fields=fields, computed=computed)
+
+CARD_LISTING = FastSerializer(CardListSerializer)
+
+def serialize_transactions(transactions, fields=None, compact=False):
+    """
+    Serialize a transaction queryset for list endpoints.
+
+    fields limits each row to a sparse fieldset. In compact mode the nested
+    card_details and user_name are left off the rows and each referenced
+    card is sent once in a side table keyed by id.
+    Rows are built by FastSerializer straight from .values_list(), matching
+    TransactionSerializer's output exactly.
+    Returns (rows, side_tables).
+    """
+    all_fields = TransactionSerializer.Meta.fields
+    fields = tuple(name for name in (fields or all_fields) if name in all_fields)
+    if compact:
+        fields = tuple(name for name in fields if name not in ('card_details', 'user_name'))
+        if 'card' not in fields:
+            fields += ('card',)
+
+    sharded = sharding.enabled()
+    rows = transaction_listing(fields, sharded).serialize(transactions)
+    if sharded and 'user_name' in fields:
+        _fill_user_names(rows)
+    side_tables = {}
+    if compact:
+        card_ids = {row['card'] for row in rows if row.get('card') is not None}
+        side_tables['cards'] = {
+            card['id']: card
+            for shard, ids in sharding.group_by_shard(card_ids).items()
+            for card in CARD_LISTING.serialize(Card.objects.using(shard).filter(id__in=ids))
+        }
+    return rows, side_tables
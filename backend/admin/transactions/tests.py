@@ -1,3 +1,403 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from admin import sharding, throttling
+from admin.fastpath import FastSerializer
+from admin.renderers import FastJSONRenderer
+from admin_panel import stats
+from authentication import views as auth_views
+from authentication.models import User
+from cards.models import Card
+from cards.serializers import CardListSerializer
+from . import sweeper, views
+from .models import OutboxEvent, Transaction
+from .serializers import TRANSACTION_COMPUTED, TransactionSerializer, serialize_transactions
 
-# Create your tests here.
+
+class FastSerializerContractTests(TestCase):
+    """The fast read path must render byte-for-byte what TransactionSerializer renders"""
+    # Cards and transactions live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'pw12345!',
+                                            first_name='Alice', last_name='Ng')
+        # Same bucket, so both users' rows are on one shard and one queryset reads them all
+        cls.nameless = User.objects.create_user('bob', 'bob@example.com', 'pw12345!', id=cls.user.id + sharding.BUCKETS)
+        cls.card = Card.objects.create(user=cls.user, card_type='VISA', masked_number='**** **** **** 0366',
+                                       last_four_digits='0366', card_holder_name='ALICE NG',
+                                       expiry_month='12', expiry_year='2030')
+        cls.other_card = Card.objects.create(user=cls.nameless, card_type='AMEX', masked_number='**** **** **** 0126',
+                                             last_four_digits='0126', card_holder_name='BOB',
+                                             expiry_month='01', expiry_year='2027')
+        for user, card, amount, currency, txn_status, description in [
+            (cls.user, cls.card, '10.50', 'USD', 'SUCCESS', 'Groceries'),
+            (cls.user, cls.card, '0.01', 'EUR', 'FAILED', ''),
+            (cls.user, cls.card, '99999.99', 'INR', 'PENDING', 'Café ☕ "quoted"\n'),
+            (cls.nameless, cls.other_card, '100', 'GBP', 'SUCCESS', 'Flight'),
+        ]:
+            Transaction.objects.create(user=user, card=card, amount=Decimal(amount), currency=currency,
+                                       status=txn_status, description=description,
+                                       payment_method=f'{card.card_type} - {card.last_four_digits}')
+
+    def all(self):
+        return Transaction.objects.for_user(self.user.id).all()
+
+    def assertSameBytes(self, fast, slow):
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def reference(self, queryset, fields=None):
+        serializer = TransactionSerializer(queryset, many=True, **({'fields': fields} if fields else {}))
+        return serializer.data
+
+    def test_full_rows_match(self):
+        rows, _ = serialize_transactions(self.all())
+        self.assertEqual(len(rows), 4)
+        self.assertSameBytes(rows, self.reference(self.all()))
+
+    def test_sparse_fieldsets_match(self):
+        for fields in [('id',), ('amount', 'status'), ('card_details',), ('user_name', 'transaction_date'),
+                       ('updated_at', 'id', 'currency')]:
+            with self.subTest(fields=fields):
+                rows, _ = serialize_transactions(self.all(), fields=fields)
+                self.assertSameBytes(rows, self.reference(self.all(), fields))
+
+    def test_compact_side_table_matches(self):
+        rows, side_tables = serialize_transactions(self.all(), compact=True)
+        expected_fields = tuple(name for name in TransactionSerializer.Meta.fields
+                                if name not in ('card_details', 'user_name'))
+        self.assertSameBytes(rows, self.reference(self.all(), expected_fields))
+        cards = Card.objects.for_user(self.user.id).filter(id__in=[self.card.id, self.other_card.id])
+        self.assertSameBytes(side_tables['cards'],
+                             {card['id']: card for card in CardListSerializer(cards, many=True).data})
+
+    def test_filtered_queryset_matches(self):
+        queryset = self.all().filter(user=self.user, amount__gte=1)
+        rows, _ = serialize_transactions(queryset)
+        self.assertSameBytes(rows, self.reference(queryset))
+
+    def test_non_utc_timezone_matches(self):
+        for zone in ('Asia/Kolkata', 'America/New_York'):
+            with self.subTest(zone=zone), timezone.override(zone):
+                rows, _ = serialize_transactions(self.all())
+                self.assertSameBytes(rows, self.reference(self.all()))
+
+    def test_list_endpoint_matches(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/transactions/list/')
+        queryset = self.all().filter(user=self.user)
+        expected = FastJSONRenderer().render({
+            'status': 'success',
+            'data': self.reference(queryset),
+            'count': queryset.count(),
+        })
+        self.assertEqual(response.content, expected)
+
+    def test_listing_is_compiled_once(self):
+        serialize_transactions(self.all(), fields=('id', 'amount'))
+        with mock.patch.object(TransactionSerializer, '__init__', side_effect=AssertionError('recompiled')):
+            rows, _ = serialize_transactions(self.all(), fields=('id', 'amount'))
+        self.assertEqual(len(rows), 4)
+
+    def test_method_sources_must_be_computed(self):
+        with self.assertRaises(ImproperlyConfigured):
+            FastSerializer(TransactionSerializer)
+        FastSerializer(TransactionSerializer, computed=TRANSACTION_COMPUTED)
+
+
+@override_settings(PAYMENT_PROCESSOR_KEY='processor-key')
+class FinalStatusTests(TestCase):
+    """SUCCESS and FAILED are final: only PENDING transactions change status"""
+    # Cards and transactions live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('carol', 'carol@example.com', 'pw12345!')
+        card = Card.objects.create(user=cls.user, card_type='VISA', masked_number='**** **** **** 4242',
+                                   last_four_digits='4242', card_holder_name='CAROL',
+                                   expiry_month='12', expiry_year='2030')
+        cls.pending, cls.succeeded = [
+            Transaction.objects.create(user=cls.user, card=card, amount=Decimal('25.00'), status=txn_status)
+            for txn_status in ('PENDING', 'SUCCESS')
+        ]
+
+    def patch(self, transaction, new_status, **headers):
+        headers.setdefault('HTTP_X_PROCESSOR_KEY', 'processor-key')
+        return APIClient().patch(f'/api/transactions/{transaction.id}/update-status/', {'status': new_status},
+                                 format='json', **headers)
+
+    def test_only_the_processor_sets_a_status(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(f'/api/transactions/{self.pending.id}/update-status/', {'status': 'SUCCESS'},
+                                format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.patch(self.pending, 'SUCCESS', HTTP_X_PROCESSOR_KEY='wrong').status_code, 403)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'PENDING')
+
+    def test_pending_transaction_moves_once(self):
+        self.assertEqual(self.patch(self.pending, 'SUCCESS').status_code, 200)
+        self.assertEqual(self.patch(self.pending, 'SUCCESS').status_code, 200)
+        self.assertEqual(OutboxEvent.objects.for_id(self.pending.id).filter(
+            transaction_id=self.pending.id, event_type=OutboxEvent.STATUS_CHANGED).count(), 1)
+
+    def test_final_status_change_is_a_conflict(self):
+        before = stats.get_stats(self.user.id).success_count
+        response = self.patch(self.succeeded, 'FAILED')
+        self.assertEqual(response.status_code, 409)
+        self.succeeded.refresh_from_db()
+        self.assertEqual(self.succeeded.status, 'SUCCESS')
+        self.assertEqual(stats.get_stats(self.user.id).success_count, before)
+
+    def test_bulk_update_leaves_final_rows_and_reports_them(self):
+        response = APIClient().post('/api/transactions/bulk-update-status/', {'updates': [
+            {'id': self.pending.id, 'status': 'FAILED'},
+            {'id': self.succeeded.id, 'status': 'FAILED'},
+        ]}, format='json', HTTP_X_PROCESSOR_KEY='processor-key')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['conflicts'], [self.succeeded.id])
+        self.assertEqual(dict(Transaction.objects.for_user(self.user.id).values_list('id', 'status')),
+                         {self.pending.id: 'FAILED', self.succeeded.id: 'SUCCESS'})
+
+
+@override_settings(PAYMENT_PROCESSOR_KEY='processor-key')
+class AsyncViewParityTests(TestCase):
+    """With ASYNC_VIEWS on, each a* view answers exactly what its sync counterpart answers"""
+    # Cards and transactions live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('mia', 'mia@example.com', 'pw12345!', first_name='Mia', last_name='Ro')
+        cls.other = User.objects.create_user('ned', 'ned@example.com', 'pw12345!')
+        card = Card.objects.create(user=cls.user, card_type='VISA', masked_number='**** **** **** 4242',
+                                   last_four_digits='4242', card_holder_name='MIA RO',
+                                   expiry_month='12', expiry_year='2030')
+        cls.succeeded, cls.pending, _ = [
+            Transaction.objects.create(user=cls.user, card=card, amount=Decimal(amount), currency=currency,
+                                       status=txn_status, description=description, payment_method='VISA - 4242')
+            for amount, currency, txn_status, description in (('12.00', 'USD', 'SUCCESS', 'Books'),
+                                                              ('3.40', 'EUR', 'PENDING', ''),
+                                                              ('99.99', 'USD', 'FAILED', 'Shoes'))
+        ]
+
+    def call(self, view, method, path, args=(), user=None, data=None, **headers):
+        factory = APIRequestFactory()
+        if method == 'patch':
+            request = factory.patch(path, data, format='json', **headers)
+        else:
+            request = factory.get(path, **headers)
+        if user is not None:
+            force_authenticate(request, user)
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        response = view(request, *args)
+        if hasattr(response, 'render'):
+            response.render()
+        return response.status_code, response.content, response.get('ETag')
+
+    def assertSameResponse(self, views_pair, method, path, **kwargs):
+        sync_view, async_view = views_pair
+        expected = self.call(sync_view, method, path, **kwargs)
+        self.assertEqual(self.call(async_view, method, path, **kwargs), expected)
+        return expected
+
+    def test_list(self):
+        pair = (views.list_transactions, views.alist_transactions)
+        for query in ('', '?status=SUCCESS', '?min_amount=5&fields=id,amount', '?compact=1'):
+            with self.subTest(query=query):
+                code, _, _ = self.assertSameResponse(pair, 'get', f'/api/transactions/list/{query}', user=self.user)
+                self.assertEqual(code, 200)
+
+    def test_detail_and_conditional_get(self):
+        pair = (views.get_transaction, views.aget_transaction)
+        path = f'/api/transactions/{self.succeeded.id}/'
+        args = (self.succeeded.id,)
+        code, _, etag = self.assertSameResponse(pair, 'get', path, args=args, user=self.user)
+        self.assertEqual(code, 200)
+        code, _, _ = self.assertSameResponse(pair, 'get', path, args=args, user=self.user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(code, 304)
+        # Another user's transaction is not found either way
+        code, _, _ = self.assertSameResponse(pair, 'get', path, args=args, user=self.other)
+        self.assertEqual(code, 404)
+
+    def test_status_update(self):
+        pair = (views.update_transaction_status, views.aupdate_transaction_status)
+        for txn_id, new_status, key, expected_code in ((self.pending.id, 'BOGUS', 'processor-key', 400),
+                                                       (self.succeeded.id, 'FAILED', 'processor-key', 409),
+                                                       (self.succeeded.id + 1000, 'FAILED', 'processor-key', 404),
+                                                       (self.succeeded.id, 'SUCCESS', 'processor-key', 200),
+                                                       (self.pending.id, 'SUCCESS', 'wrong', 403)):
+            with self.subTest(status=new_status, code=expected_code):
+                code, _, _ = self.assertSameResponse(pair, 'patch', f'/api/transactions/{txn_id}/update-status/',
+                                                     args=(txn_id,), data={'status': new_status},
+                                                     HTTP_X_PROCESSOR_KEY=key)
+                self.assertEqual(code, expected_code)
+
+    def test_profile(self):
+        pair = (auth_views.profile_view, auth_views.aprofile_view)
+        code, _, etag = self.assertSameResponse(pair, 'get', '/api/auth/profile/', user=self.user)
+        self.assertEqual((code, bool(etag)), (200, True))
+        code, _, _ = self.assertSameResponse(pair, 'get', '/api/auth/profile/')
+        self.assertEqual(code, 401)
+
+
+class SweeperTests(TestCase):
+    """Stuck PENDING rows are expired when old and leased out for re-drive otherwise"""
+    # Cards and transactions live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('heidi', 'heidi@example.com', 'pw12345!')
+        card = Card.objects.create(user=cls.user, card_type='VISA', masked_number='**** **** **** 4242',
+                                   last_four_digits='4242', card_holder_name='HEIDI',
+                                   expiry_month='12', expiry_year='2030')
+        cls.shard = card._state.db
+        now = timezone.now()
+        cls.rows = {}
+        for name, created, updated in (('abandoned', 120, 100), ('stuck', 20, 10), ('in_flight', 1, 0)):
+            txn = Transaction.objects.create(user=cls.user, card=card, amount=Decimal('12.00'), status='PENDING',
+                                             payment_method='VISA - 4242')
+            Transaction.objects.using(cls.shard).filter(id=txn.id).update(
+                transaction_date=now - timedelta(minutes=created), updated_at=now - timedelta(minutes=updated))
+            cls.rows[name] = txn.id
+        stats.rebuild(cls.user.id)
+
+    def status(self, name):
+        return Transaction.objects.using(self.shard).get(id=self.rows[name]).status
+
+    def cutoffs(self, now=None):
+        now = now or timezone.now()
+        return now - timedelta(minutes=5), now - timedelta(hours=1)
+
+    def test_old_stuck_rows_expire_with_stats_and_events(self):
+        stale_before, expire_before = self.cutoffs()
+        self.assertEqual(sweeper.expire_stale(stale_before, expire_before, 10, using=self.shard), 1)
+        self.assertEqual([self.status(name) for name in ('abandoned', 'stuck', 'in_flight')],
+                         ['FAILED', 'PENDING', 'PENDING'])
+        self.assertEqual(stats.get_stats(self.user.id).failed_count, 1)
+        event = OutboxEvent.objects.using(self.shard).get(transaction_id=self.rows['abandoned'])
+        self.assertEqual((event.payload['previous_status'], event.payload['status']), ('PENDING', 'FAILED'))
+        self.assertEqual(sweeper.expire_stale(stale_before, expire_before, 10, using=self.shard), 0)
+
+    def test_redrive_claim_is_a_lease(self):
+        stale_before, expire_before = self.cutoffs()
+        rows = sweeper.claim_for_redrive(stale_before, expire_before, 10, using=self.shard)
+        self.assertEqual([row[0] for row in rows], [self.rows['stuck']])
+        # Another sweeper leaves the claimed row alone while the lease is fresh...
+        self.assertEqual(sweeper.claim_for_redrive(stale_before, expire_before, 10, using=self.shard), [])
+        # ...and takes it over once the lease is as stale as a stuck row
+        stale_before, expire_before = self.cutoffs(timezone.now() + timedelta(minutes=6))
+        rows = sweeper.claim_for_redrive(stale_before, expire_before, 10, using=self.shard)
+        self.assertIn(self.rows['stuck'], [row[0] for row in rows])
+        self.assertEqual(self.status('stuck'), 'PENDING')
+
+    def test_sweep_command_expires_and_redrives(self):
+        out = StringIO()
+        with override_settings(PAYMENT_PROCESSOR_KEY='processor-key'), \
+                mock.patch.object(sweeper, '_process', return_value=True) as process:
+            call_command('sweep_pending_transactions', stdout=out)
+        process.assert_called_once_with(self.rows['stuck'], self.user.id, 10)
+        self.assertIn('expired=1 redrive_attempted=1 redrive_succeeded=1 redrive_failed=0', out.getvalue())
+
+
+@override_settings(PAYMENT_PROCESSOR_KEY='processor-key',
+                   RATE_LIMITS={'payments': {'user': None, 'ip': '2/min', 'global': None}})
+class ProcessorCreateThrottleTests(TestCase):
+    """Creates relayed by the processor's /pay share its address, so they skip the per-IP limit"""
+    # Cards and transactions live on their user's shard when DB_SHARDS > 1
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('dave', 'dave@example.com', 'pw12345!')
+        cls.card = Card.objects.create(user=cls.user, card_type='VISA', masked_number='**** **** **** 4242',
+                                       last_four_digits='4242', card_holder_name='DAVE',
+                                       expiry_month='12', expiry_year='2030')
+
+    def setUp(self):
+        throttling._local_buckets.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, **headers):
+        return self.client.post('/api/transactions/create/', {'card_id': self.card.id, 'amount': '5.00'},
+                                format='json', **headers)
+
+    def test_processor_creates_skip_the_ip_limit(self):
+        for _ in range(4):
+            self.assertEqual(self.create(HTTP_X_PROCESSOR_KEY='processor-key').status_code, 201)
+
+    def test_other_creates_are_limited_per_ip(self):
+        self.assertEqual([self.create(HTTP_X_PROCESSOR_KEY='wrong').status_code for _ in range(3)], [201, 201, 429])
+
+
+@skipUnless(sharding.enabled(), 'run with DB_SHARDS > 1, e.g. DB_SHARDS=3 with SQLite')
+class ShardRoutingTests(TransactionTestCase):
+    """Rows go to their user's shard, carry that shard's id range and are found again from the id alone"""
+    databases = '__all__'
+
+    def setUp(self):
+        self.aliases = sharding.aliases()
+        # One user per shard: with fewer than BUCKETS ids, id % shards picks the shard directly
+        self.users = [User.objects.create_user(f'shard{index}', f'shard{index}@example.com', 'pw12345!',
+                                               id=10 * len(self.aliases) + index)
+                      for index in range(len(self.aliases))]
+        self.transactions = []
+        for user in self.users:
+            card = Card.objects.create(user=user, card_type='VISA', masked_number='**** **** **** 4242',
+                                       last_four_digits='4242', card_holder_name=user.username.upper(),
+                                       expiry_month='12', expiry_year='2030')
+            self.transactions.append(Transaction.objects.create(user=user, card=card, amount=Decimal('3.00')))
+
+    def test_rows_are_written_to_their_users_shard(self):
+        for index, (user, txn) in enumerate(zip(self.users, self.transactions)):
+            alias = self.aliases[index]
+            self.assertEqual(sharding.shard_for_user(user.id), alias)
+            self.assertEqual((txn._state.db, txn.card._state.db), (alias, alias))
+            self.assertEqual([other for other in self.aliases
+                              if Transaction.objects.using(other).filter(user_id=user.id).exists()], [alias])
+
+    def test_ids_carry_the_issuing_shard(self):
+        for index, txn in enumerate(self.transactions):
+            self.assertEqual(txn.id >> sharding.ID_BITS, index)
+            self.assertEqual(txn.card_id >> sharding.ID_BITS, index)
+            self.assertEqual(sharding.shard_for_id(txn.id), self.aliases[index])
+            self.assertEqual(Transaction.objects.for_id(txn.id).get().user_id, self.users[index].id)
+        self.assertIsNone(sharding.shard_for_id(sharding.shard_id(len(self.aliases), 1)))
+        self.assertEqual(sharding.group_by_shard(txn.id for txn in reversed(self.transactions)),
+                         {alias: [txn.id] for alias, txn in zip(self.aliases, self.transactions)})
+
+    def test_scatter_runs_on_every_shard_in_order(self):
+        self.assertEqual(sharding.scatter(lambda alias: (alias, Transaction.objects.using(alias).count())),
+                         [(alias, 1) for alias in self.aliases])
+
+    def test_api_finds_a_transaction_on_any_shard(self):
+        for user, txn in zip(self.users, self.transactions):
+            client = APIClient()
+            client.force_authenticate(user)
+            response = client.get(f'/api/transactions/{txn.id}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['data']['id'], txn.id)
+
+
+class ShardCountTests(TestCase):
+    def test_changed_shard_count_is_refused(self):
+        sharding.check_shard_count()
+        with override_settings(SHARD_ALIASES=sharding.aliases() + ['another']):
+            with self.assertRaises(ImproperlyConfigured):
+                sharding.check_shard_count()
@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
     path('create/', views.create_transaction, name='create_transaction'),
-    path('list/', views.list_transactions, name='list_transactions'),
-    path('<int:transaction_id>/', views.get_transaction, name='get_transaction'),
-    path('<int:transaction_id>/update-status/', views.update_transaction_status, name='update_transaction_status'),
+    path('list/', views.alist_transactions if settings.ASYNC_VIEWS else views.list_transactions, name='list_transactions'),
+    path('recent-activity/', views.recent_activity, name='recent_activity'),
+    path('bulk-update-status/', views.bulk_update_transaction_status, name='bulk_update_transaction_status'),
+    path('outcome-minutes/', views.record_outcome_minutes, name='record_outcome_minutes'),
+    path('<int:transaction_id>/', views.aget_transaction if settings.ASYNC_VIEWS else views.get_transaction, name='get_transaction'),
+    path('<int:transaction_id>/update-status/',
+         views.aupdate_transaction_status if settings.ASYNC_VIEWS else views.update_transaction_status, name='update_transaction_status'),
 ]
\ No newline at end of file
@@ -1,17 +1,31 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import transaction as db_transaction
 from django.db.models import Q
-from datetime import datetime
+from django.utils import timezone
+from collections import defaultdict
+from decimal import Decimal
+from datetime import datetime, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from admin import sharding
+from admin.asyncviews import async_api_view
+from admin.throttling import throttles_for
+from admin_panel import stats, timeseries
+from . import outbox
 from .models import Transaction
-from .serializers import TransactionSerializer, TransactionCreateSerializer
+from .permissions import IsPaymentProcessor
+from admin.caching import Freshness, conditional
+from admin.serializers import parse_fields
+from .serializers import TransactionSerializer, TransactionCreateSerializer, serialize_transactions
 from cards.models import Card
 import csv
 from django.http import HttpResponse
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes(throttles_for('payments'))
 def create_transaction(request):
     """Create a new transaction (will be processed by FastAPI)"""
     serializer = TransactionCreateSerializer(data=request.data)
@@ -20,23 +34,31 @@ def create_transaction(request):
         card_id = serializer.validated_data['card_id']
         
         try:
-            card = Card.objects.get(id=card_id, user=request.user)
+            card = Card.objects.for_user(request.user.id).get(id=card_id, user=request.user)
         except Card.DoesNotExist:
             return Response({
                 'status': 'error',
                 'message': 'Card not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Create transaction with PENDING status
-        transaction = Transaction.objects.create(
-            user=request.user,
-            card=card,
-            amount=serializer.validated_data['amount'],
-            currency=serializer.validated_data.get('currency', 'USD'),
-            description=serializer.validated_data.get('description', ''),
-            payment_method=f"{card.card_type} - {card.last_four_digits}",
-            status='PENDING'
-        )
+        # Create transaction with PENDING status, on the user's shard with their card and stats
+        with db_transaction.atomic(using=card._state.db):
+            transaction = Transaction.objects.using(card._state.db).create(
+                user=request.user,
+                card=card,
+                amount=serializer.validated_data['amount'],
+                currency=serializer.validated_data.get('currency', 'USD'),
+                description=serializer.validated_data.get('description', ''),
+                payment_method=f"{card.card_type} - {card.last_four_digits}",
+                status='PENDING'
+            )
+            stats.transaction_created(request.user.id, transaction.status, transaction.amount, transaction.transaction_date,
+                                      transaction.currency)
+            outbox.record_created(transaction)
+            db_transaction.on_commit(
+                lambda: timeseries.record(transaction.status, transaction.currency, card.card_type, transaction.amount),
+                using=card._state.db
+            )
         
         return Response({
             'status': 'success',
@@ -50,11 +72,9 @@ def create_transaction(request):
         'errors': serializer.errors
     }, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def list_transactions(request):
-    """List all transactions for the authenticated user with filters"""
-    transactions = Transaction.objects.filter(user=request.user)
+def user_transactions(request):
+    """The authenticated user's transactions with the list filters from the query string applied"""
+    transactions = Transaction.objects.for_user(request.user.id).filter(user=request.user)
     
     # Filters
     status_filter = request.GET.get('status')
@@ -92,20 +112,71 @@ def list_transactions(request):
         except ValueError:
             pass
     
-    serializer = TransactionSerializer(transactions, many=True)
+    return transactions
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_transactions(request):
+    """List all transactions for the authenticated user with filters"""
+    transactions = user_transactions(request)
+    
+    rows, side_tables = serialize_transactions(
+        transactions,
+        fields=parse_fields(request),
+        compact=request.GET.get('compact') in ('1', 'true')
+    )
+    
+    return Response({
+        'status': 'success',
+        'data': rows,
+        'count': transactions.count(),
+        **side_tables
+    }, status=status.HTTP_200_OK)
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def alist_transactions(request):
+    """list_transactions for ASGI"""
+    transactions = user_transactions(request)
+    
+    rows, side_tables = await sync_to_async(serialize_transactions)(
+        transactions,
+        fields=parse_fields(request),
+        compact=request.GET.get('compact') in ('1', 'true')
+    )
     
     return Response({
         'status': 'success',
-        'data': serializer.data,
-        'count': transactions.count()
+        'data': rows,
+        'count': await transactions.acount(),
+        **side_tables
     }, status=status.HTTP_200_OK)
 
+def _freshness_row(request, transaction_id):
+    return (Transaction.objects.for_user(request.user.id).filter(id=transaction_id, user=request.user)
+            .values_list('status', 'updated_at'))
+
+def _transaction_freshness(request, transaction_id, row):
+    if row is None:
+        return None
+    _, updated_at = row
+    # The payload carries user_name from the users table, which updated_at does not cover,
+    # so the tag includes the name and there is no Last-Modified to validate against
+    return Freshness(etag=f'txn:{transaction_id}:{updated_at.isoformat()}:{request.user.get_full_name()}')
+
+def transaction_freshness(request, transaction_id):
+    return _transaction_freshness(request, transaction_id, _freshness_row(request, transaction_id).first())
+
+async def atransaction_freshness(request, transaction_id):
+    return _transaction_freshness(request, transaction_id, await _freshness_row(request, transaction_id).afirst())
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(transaction_freshness)
 def get_transaction(request, transaction_id):
     """Get a specific transaction"""
     try:
-        transaction = Transaction.objects.get(id=transaction_id, user=request.user)
+        transaction = Transaction.objects.for_user(request.user.id).get(id=transaction_id, user=request.user)
         serializer = TransactionSerializer(transaction)
         
         return Response({
@@ -118,21 +189,72 @@ def get_transaction(request, transaction_id):
             'message': 'Transaction not found'
         }, status=status.HTTP_404_NOT_FOUND)
 
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional(atransaction_freshness)
+async def aget_transaction(request, transaction_id):
+    """get_transaction for ASGI"""
+    try:
+        transaction = await (Transaction.objects.for_user(request.user.id).select_related('card')
+                             .aget(id=transaction_id, user=request.user))
+    except Transaction.DoesNotExist:
+        return Response({
+            'status': 'error',
+            'message': 'Transaction not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    # The serializer reads card and user; an async view cannot load them lazily
+    transaction.user = request.user
+    
+    return Response({
+        'status': 'success',
+        'data': TransactionSerializer(transaction).data
+    }, status=status.HTTP_200_OK)
+
+class StatusConflict(Exception):
+    """The transaction already has a different final status"""
+
+def set_transaction_status(transaction_id, new_status):
+    """
+    Move one PENDING transaction to new_status with its stats and outbox event;
+    returns its serialized data. SUCCESS and FAILED are final: repeating the
+    same outcome is a no-op, a different one raises StatusConflict.
+    """
+    # The id says which shard holds the row, so no lookup is needed
+    shard = sharding.shard_for_id(transaction_id)
+    if shard is None:
+        raise Transaction.DoesNotExist
+    with db_transaction.atomic(using=shard):
+        transaction = Transaction.objects.using(shard).select_for_update().get(id=transaction_id)
+        old_status = transaction.status
+        if old_status == new_status:
+            return TransactionSerializer(transaction).data
+        if old_status != 'PENDING':
+            raise StatusConflict(old_status)
+        transaction.status = new_status
+        transaction.save()
+        stats.status_changed(transaction.user_id, old_status, new_status,
+                             [(transaction.currency, stats.spend_day(transaction.transaction_date), transaction.amount)])
+        outbox.record_status_changes([(
+            transaction.id, transaction.user_id, transaction.card_id,
+            transaction.amount, transaction.currency, old_status, new_status
+        )])
+    return TransactionSerializer(transaction).data
+
 @api_view(['PATCH'])
+@authentication_classes([])
+@permission_classes([IsPaymentProcessor])
 def update_transaction_status(request, transaction_id):
-    """Update transaction status (used by FastAPI payment processor)"""
+    """Update transaction status (used by FastAPI payment processor, which sends X-Processor-Key)"""
     try:
-        transaction = Transaction.objects.get(id=transaction_id)
         new_status = request.data.get('status')
         
         if new_status in ['SUCCESS', 'FAILED']:
-            transaction.status = new_status
-            transaction.save()
+            data = set_transaction_status(transaction_id, new_status)
             
             return Response({
                 'status': 'success',
                 'message': f'Transaction status updated to {new_status}',
-                'data': TransactionSerializer(transaction).data
+                'data': data
             }, status=status.HTTP_200_OK)
         else:
             return Response({
@@ -143,4 +265,222 @@ def update_transaction_status(request, transaction_id):
         return Response({
             'status': 'error',
             'message': 'Transaction not found'
-        }, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        }, status=status.HTTP_404_NOT_FOUND)
+    except StatusConflict as e:
+        return Response({
+            'status': 'error',
+            'message': f'Transaction is already {e}'
+        }, status=status.HTTP_409_CONFLICT)
+
+@async_api_view(['PATCH'])
+@authentication_classes([])
+@permission_classes([IsPaymentProcessor])
+async def aupdate_transaction_status(request, transaction_id):
+    """update_transaction_status for ASGI"""
+    new_status = request.data.get('status')
+    if new_status not in ['SUCCESS', 'FAILED']:
+        return Response({
+            'status': 'error',
+            'message': 'Invalid status'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # The async ORM has no transactions: the locked read-modify-write runs in a thread
+        data = await sync_to_async(set_transaction_status)(transaction_id, new_status)
+    except Transaction.DoesNotExist:
+        return Response({
+            'status': 'error',
+            'message': 'Transaction not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except StatusConflict as e:
+        return Response({
+            'status': 'error',
+            'message': f'Transaction is already {e}'
+        }, status=status.HTTP_409_CONFLICT)
+    
+    return Response({
+        'status': 'success',
+        'message': f'Transaction status updated to {new_status}',
+        'data': data
+    }, status=status.HTTP_200_OK)
+
+BULK_UPDATE_LIMIT = 1000
+
+def _apply_status_updates(shard, target):
+    """
+    Apply {id: status} updates for transactions on one shard, as set_transaction_status
+    does one: only PENDING rows change. Returns the rows found.
+    """
+    with db_transaction.atomic(using=shard):
+        rows = list(Transaction.objects.using(shard).select_for_update()
+                    .filter(id__in=target)
+                    .values_list('id', 'user_id', 'status', 'amount', 'card_id', 'currency', 'transaction_date'))
+        changed = [row for row in rows if row[2] == 'PENDING']
+        
+        ids_by_status = defaultdict(list)
+        # (user, old status, new status) -> [count, {(currency, day): amount}]
+        deltas = defaultdict(lambda: [0, defaultdict(Decimal)])
+        for txn_id, user_id, old_status, amount, _, currency, created_at in changed:
+            new_status = target[txn_id]
+            ids_by_status[new_status].append(txn_id)
+            delta = deltas[(user_id, old_status, new_status)]
+            delta[0] += 1
+            delta[1][(currency, stats.spend_day(created_at))] += amount
+        
+        now = timezone.now()
+        for new_status, ids in ids_by_status.items():
+            Transaction.objects.using(shard).filter(id__in=ids).update(status=new_status, updated_at=now)
+        for (user_id, old_status, new_status), (count, spend) in deltas.items():
+            stats.status_changed(user_id, old_status, new_status,
+                                 [(currency, day, amount) for (currency, day), amount in spend.items()], count=count)
+        outbox.record_status_changes(
+            (txn_id, user_id, card_id, amount, currency, old_status, target[txn_id])
+            for txn_id, user_id, old_status, amount, card_id, currency, _ in changed
+        )
+    return rows
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([IsPaymentProcessor])
+def bulk_update_transaction_status(request):
+    """Apply many status updates at once (used by the processor to replay its write-ahead log)"""
+    updates = request.data.get('updates')
+    if not isinstance(updates, list) or len(updates) > BULK_UPDATE_LIMIT:
+        return Response({
+            'status': 'error',
+            'message': f'updates must be a list of at most {BULK_UPDATE_LIMIT} items'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Later entries for the same transaction win, matching replay order
+    target = {}
+    for update in updates:
+        if not isinstance(update, dict) or update.get('status') not in ['SUCCESS', 'FAILED']:
+            return Response({
+                'status': 'error',
+                'message': 'Invalid status'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            target[int(update['id'])] = update['status']
+        except (KeyError, TypeError, ValueError):
+            return Response({
+                'status': 'error',
+                'message': 'Invalid transaction id'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # One atomic block per shard; a replay re-sends whatever a failed shard missed
+    rows = []
+    for shard, ids in sharding.group_by_shard(target).items():
+        rows += _apply_status_updates(shard, {txn_id: target[txn_id] for txn_id in ids})
+    
+    # Rows already holding a different final status are left alone and reported
+    conflicts = sorted(row[0] for row in rows if row[2] not in ('PENDING', target[row[0]]))
+    return Response({
+        'status': 'success',
+        'message': f'{len(rows) - len(conflicts)} transactions updated',
+        'data': {
+            'updated': len(rows) - len(conflicts),
+            'not_found': sorted(set(target) - {row[0] for row in rows}),
+            'conflicts': conflicts,
+        }
+    }, status=status.HTTP_200_OK)
+
+RECENT_ACTIVITY_PAGE = 5000
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([IsPaymentProcessor])
+def recent_activity(request):
+    """
+    Transactions newer than `since` (epoch seconds), newest first, for warming
+    the processor's fraud windows. Pages walk the primary key downwards from
+    `before_id`; next_before_id is null once rows older than `since` are reached
+    on every shard.
+    """
+    try:
+        since = datetime.fromtimestamp(float(request.query_params['since']), tz=dt_timezone.utc)
+        before_id = request.query_params.get('before_id')
+        before_id = int(before_id) if before_id else None
+    except (KeyError, ValueError, OverflowError):
+        return Response({
+            'status': 'error',
+            'message': 'since must be epoch seconds and before_id an integer'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Ids are ranged by shard and grow with time within each, so the walk covers the shards
+    # one after another, last first. Filtering on the date in SQL would keep scanning past
+    # the window; stop in Python instead
+    shards = sharding.aliases()
+    index = len(shards) - 1 if before_id is None else min((before_id - 1) >> sharding.ID_BITS, len(shards) - 1)
+    page = []
+    if index >= 0:
+        queryset = Transaction.objects.using(shards[index]).order_by('-id')
+        if before_id is not None:
+            queryset = queryset.filter(id__lt=before_id)
+        page = list(queryset.values_list('id', 'user_id', 'card_id', 'amount', 'transaction_date')[:RECENT_ACTIVITY_PAGE])
+    
+    rows = [
+        [txn_id, user_id, card_id, str(amount), created.timestamp()]
+        for txn_id, user_id, card_id, amount, created in page
+        if created >= since
+    ]
+    if len(page) == RECENT_ACTIVITY_PAGE and len(rows) == len(page):
+        next_before_id = page[-1][0]
+    elif index > 0:
+        # Done with this shard (exhausted or past `since`); carry on from the top of the one below
+        next_before_id = sharding.shard_id(index, 0)
+    else:
+        next_before_id = None
+    
+    return Response({
+        'status': 'success',
+        'message': 'Recent activity retrieved',
+        'data': {
+            'rows': rows,
+            'next_before_id': next_before_id
+        }
+    }, status=status.HTTP_200_OK)
+
+OUTCOME_MINUTES_LIMIT = 5000
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([IsPaymentProcessor])
+def record_outcome_minutes(request):
+    """
+    Add the processor's per-minute outcome counters to the rollup table
+    (admin_panel/timeseries.py). Each row is {minute (epoch minutes), status,
+    currency, card_type, count, amount, timed_count, latency_ms_sum,
+    latency_ms_max}; rows add to what is stored, so send each count once.
+    """
+    minutes = request.data.get('minutes')
+    if not isinstance(minutes, list) or len(minutes) > OUTCOME_MINUTES_LIMIT:
+        return Response({
+            'status': 'error',
+            'message': f'minutes must be a list of at most {OUTCOME_MINUTES_LIMIT} items'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        rows = [
+            (int(row['minute']), (str(row['status']), str(row['currency']), str(row['card_type'])), [
+                int(row['count']), Decimal(str(row['amount'])), int(row['timed_count']),
+                float(row['latency_ms_sum']), float(row['latency_ms_max'])
+            ])
+            for row in minutes
+        ]
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        rows = None
+    # The processor only decides outcomes; created and expired payments are counted here
+    if rows is None or any(
+        txn_status not in ['SUCCESS', 'FAILED'] or len(currency) > 3 or len(card_type) > 20
+        for _, (txn_status, currency, card_type), _ in rows
+    ):
+        return Response({
+            'status': 'error',
+            'message': 'Invalid outcome row'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    timeseries.add_rollups(timeseries.minute_rows(rows))
+    return Response({
+        'status': 'success',
+        'message': f'{len(rows)} outcome rows recorded'
+    }, status=status.HTTP_200_OK)
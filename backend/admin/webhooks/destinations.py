@@ -0,0 +1,69 @@
+"""
+Which addresses webhooks may be delivered to.
+
+Endpoint URLs are chosen by users, so without a check a webhook could be
+aimed at the gateway's own services or the cloud metadata endpoint and
+the dispatcher would POST signed payloads there. A destination host must
+resolve only to public addresses: no loopback, private, link-local,
+shared, multicast or reserved ones. The check runs when an endpoint is
+registered and again when the dispatcher resolves the host to connect,
+and the dispatcher connects to the address it checked, so a DNS answer
+that changes after registration cannot redirect deliveries.
+
+WEBHOOK_ALLOW_PRIVATE_DESTINATIONS turns the check off for local
+development against receivers on the same machine.
+"""
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class UnsafeDestination(ValueError):
+    """The URL's host is missing, does not resolve, or resolves to a non-public address"""
+
+
+def is_public(address):
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def split(url):
+    """(scheme, host, port) of an http(s) URL"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        raise UnsafeDestination('URL must be http:// or https:// with a host')
+    try:
+        port = parts.port or DEFAULT_PORTS[scheme]
+    except ValueError:
+        raise UnsafeDestination('URL has an invalid port')
+    return scheme, parts.hostname, port
+
+
+def check_addresses(host, addresses):
+    """The first of a host's resolved addresses, if every one of them is public"""
+    if not addresses:
+        raise UnsafeDestination(f'{host} does not resolve')
+    for address in addresses:
+        if not is_public(address):
+            raise UnsafeDestination(f'{host} resolves to a non-public address ({address})')
+    return addresses[0]
+
+
+def addresses_from(infos):
+    """Unique addresses from getaddrinfo() results, in order"""
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+def resolve(url):
+    """Resolve a URL's host and check it; returns the address to connect to"""
+    _, host, port = split(url)
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeDestination(f'{host} does not resolve')
+    return check_addresses(host, addresses_from(infos))
@@ -0,0 +1,149 @@
+"""
+Async HTTP delivery of signed webhook payloads.
+
+Each destination (scheme + host + port) gets its own pool of at most
+`per_destination` keep-alive connections, so one slow merchant cannot hog
+the dispatcher, and a global semaphore caps requests in flight overall.
+
+Requests carry:
+    X-Webhook-Id         the event id (stable across retries, for de-duplication)
+    X-Webhook-Timestamp  unix seconds when this attempt was signed
+    X-Webhook-Signature  v1=<hex HMAC-SHA256 of "<timestamp>.<body>" with the endpoint secret>
+
+Hosts are resolved here and every address checked (webhooks/destinations.py);
+the request goes to the checked address, with the URL's host in the Host
+header and TLS server name.
+
+Resolving and sending are each cut off after `timeout` seconds in total
+(httpx's own timeouts apply per read, so a trickling server could hold a
+connection far longer), which bounds how long a batch can take; see
+max_batch_seconds().
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import socket
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+from . import destinations
+
+# Seconds a checked address is reused before the host is resolved again
+ADDRESS_TTL = 60
+
+
+def sign(secret, timestamp, body):
+    message = f'{timestamp}.'.encode() + body
+    return 'v1=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class Dispatcher:
+    def __init__(self, concurrency=100, per_destination=10, timeout=10.0, allow_private=False):
+        self.concurrency = concurrency
+        self.per_destination = per_destination
+        self.timeout = timeout
+        self.allow_private = allow_private
+        self.addresses = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pools = {}
+        # Loading CA certificates takes tens of milliseconds; do it once for every client
+        self.ssl_context = httpx.create_ssl_context()
+
+    def _pool(self, url):
+        """Queue of idle single-connection clients for the URL's origin"""
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname, parts.port)
+        pool = self.pools.get(origin)
+        if pool is None:
+            # One client per connection: httpcore's own pool rescans every connection
+            # and waiter on each request, which dominates CPU at high concurrency
+            pool = asyncio.Queue()
+            for _ in range(self.per_destination):
+                pool.put_nowait(httpx.AsyncClient(
+                    verify=self.ssl_context,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+                ))
+            self.pools[origin] = pool
+        return pool
+
+    async def _address(self, host, port):
+        """A checked address for host, resolved at most every ADDRESS_TTL seconds"""
+        now = time.monotonic()
+        cached = self.addresses.get((host, port))
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        address = destinations.check_addresses(host, destinations.addresses_from(infos))
+        self.addresses[(host, port)] = (now + ADDRESS_TTL, address)
+        return address
+
+    async def _target(self, url):
+        """(URL to connect to, extra headers, request extensions) for a checked destination"""
+        if self.allow_private:
+            return url, {}, {}
+        _, host, port = destinations.split(url)
+        address = await self._address(host, port)
+        parts = urlsplit(url)
+        userinfo, _, authority = parts.netloc.rpartition('@')
+        netloc = f'[{address}]:{port}' if ':' in address else f'{address}:{port}'
+        if userinfo:
+            netloc = f'{userinfo}@{netloc}'
+        return urlunsplit(parts._replace(netloc=netloc)), {'Host': authority}, {'sni_hostname': host}
+
+    async def send(self, url, secret, payload):
+        """Deliver one payload; returns None on a 2xx answer, else a short error description"""
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Webhook-Id': str(payload['id']),
+            'X-Webhook-Timestamp': timestamp,
+            'X-Webhook-Signature': sign(secret, timestamp, body),
+        }
+        try:
+            target, host_headers, extensions = await asyncio.wait_for(self._target(url), self.timeout)
+        except (destinations.UnsafeDestination, OSError, UnicodeError) as e:
+            return f'Destination refused: {e}'
+        except asyncio.TimeoutError:
+            return f'Destination refused: not resolved within {self.timeout}s'
+        pool = self._pool(url)
+        async with self.semaphore:
+            client = await pool.get()
+            try:
+                response = await asyncio.wait_for(
+                    client.post(target, content=body, headers={**headers, **host_headers}, extensions=extensions),
+                    self.timeout
+                )
+            except httpx.HTTPError as e:
+                return f'{type(e).__name__}: {e}'
+            except asyncio.TimeoutError:
+                return f'Timeout: no response within {self.timeout}s'
+            finally:
+                pool.put_nowait(client)
+        if 200 <= response.status_code < 300:
+            return None
+        return f'HTTP {response.status_code}'
+
+    def max_batch_seconds(self, batch_size):
+        """
+        Longest send_all() can take for batch_size rows: all of them to one host,
+        min(per_destination, concurrency) at a time, every attempt using its whole
+        timeout, after resolving for up to one more timeout.
+        """
+        rounds = math.ceil(batch_size / min(self.per_destination, self.concurrency))
+        return (rounds + 1) * self.timeout
+
+    async def send_all(self, rows):
+        """Deliver claimed (delivery_id, attempts, url, secret, payload) rows; returns {delivery_id: error or None}"""
+        errors = await asyncio.gather(*(self.send(url, secret, payload) for _, _, url, secret, payload in rows))
+        return {row[0]: error for row, error in zip(rows, errors)}
+
+    async def close(self):
+        clients = [pool.get_nowait() for pool in self.pools.values() for _ in range(pool.qsize())]
+        await asyncio.gather(*(client.aclose() for client in clients))
+        self.pools.clear()
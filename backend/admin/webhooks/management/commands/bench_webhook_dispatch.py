@@ -0,0 +1,78 @@
+import asyncio
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from webhooks.dispatcher import Dispatcher
+
+RESPONSE = b'HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n\r\n'
+
+
+async def stub_server(delay):
+    """Minimal keep-alive HTTP/1.1 server that answers every POST with 204 after `delay` seconds"""
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':')[1])
+                await reader.readexactly(length)
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+class Command(BaseCommand):
+    help = 'Measure webhook delivery throughput against local stub HTTP servers (no database needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deliveries', type=int, default=5000)
+        parser.add_argument('--destinations', type=int, default=10, help='Stub servers, one pool each')
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--per-destination', type=int, default=10)
+        parser.add_argument('--delay-ms', type=float, default=20.0, help='Simulated merchant response time')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        servers = [await stub_server(options['delay_ms'] / 1000) for _ in range(options['destinations'])]
+        urls = [f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}/hook' for server in servers]
+        payload = {'id': 0, 'type': 'transaction.status_changed', 'occurred_at': '2024-01-01T00:00:00+00:00',
+                   'data': {'transaction_id': 1, 'user_id': 1, 'card_id': 1, 'amount': '10.00',
+                            'currency': 'USD', 'status': 'SUCCESS', 'previous_status': 'PENDING'}}
+        rows = [(i, 0, urls[i % len(urls)], 'secret', {**payload, 'id': i}) for i in range(options['deliveries'])]
+
+        # The receivers are local
+        dispatcher = Dispatcher(options['concurrency'], options['per_destination'], allow_private=True)
+        batch_times = []
+        failures = 0
+        started = time.perf_counter()
+        try:
+            for start in range(0, len(rows), options['batch_size']):
+                batch_started = time.perf_counter()
+                results = await dispatcher.send_all(rows[start:start + options['batch_size']])
+                batch_times.append(time.perf_counter() - batch_started)
+                failures += sum(1 for error in results.values() if error is not None)
+        finally:
+            elapsed = time.perf_counter() - started
+            await dispatcher.close()
+            for server in servers:
+                server.close()
+
+        self.stdout.write(
+            f"{options['deliveries']} deliveries to {options['destinations']} destinations in {elapsed:.2f}s: "
+            f"{options['deliveries'] / elapsed:,.0f}/s, failures={failures}, "
+            f"mean batch {statistics.mean(batch_times) * 1000:.0f}ms "
+            f"(concurrency={options['concurrency']}, per_destination={options['per_destination']}, "
+            f"delay={options['delay_ms']}ms)"
+        )
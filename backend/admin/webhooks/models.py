@@ -0,0 +1,53 @@
+import secrets
+from django.db import models
+from django.conf import settings
+
+
+def generate_secret():
+    return secrets.token_hex(32)
+
+
+class WebhookEndpoint(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='webhook_endpoints')
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=64, default=generate_secret)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'webhook_endpoints'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user} -> {self.url}"
+
+
+class WebhookDelivery(models.Model):
+    """One event owed to one endpoint; deleted once delivered, kept as DEAD when retries run out"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('DEAD', 'Dead'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name='deliveries')
+    event_id = models.BigIntegerField()
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'webhook_deliveries'
+        constraints = [
+            # The outbox relay delivers at least once; this makes re-queueing an event a no-op
+            models.UniqueConstraint(fields=['endpoint', 'event_id'], name='webhook_endpoint_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Event {self.event_id} to endpoint {self.endpoint_id} ({self.status})"
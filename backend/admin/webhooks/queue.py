@@ -0,0 +1,103 @@
+import random
+from datetime import timedelta
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from transactions.models import OutboxEvent
+from .models import WebhookDelivery, WebhookEndpoint
+
+NOTIFY_STATUSES = ('SUCCESS', 'FAILED')
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+MAX_ATTEMPTS = 8
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number `attempts`: exponential, capped, with jitter"""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class DeliveryQueueSink:
+    """
+    Outbox sink that turns terminal status changes into webhook deliveries
+    for every active endpoint of the transaction's owner.
+    """
+
+    def publish(self, messages):
+        terminal = [
+            message for message in messages
+            if message['type'] == OutboxEvent.STATUS_CHANGED and message['data']['status'] in NOTIFY_STATUSES
+        ]
+        if not terminal:
+            return
+        endpoints = {}
+        for endpoint_id, user_id in (WebhookEndpoint.objects
+                                     .filter(user_id__in={m['data']['user_id'] for m in terminal}, is_active=True)
+                                     .values_list('id', 'user_id')):
+            endpoints.setdefault(user_id, []).append(endpoint_id)
+        now = timezone.now()
+        WebhookDelivery.objects.bulk_create([
+            WebhookDelivery(endpoint_id=endpoint_id, event_id=message['id'], payload=message, next_attempt_at=now)
+            for message in terminal
+            for endpoint_id in endpoints.get(message['data']['user_id'], ())
+        ], ignore_conflicts=True)
+
+
+def claim_due(batch_size, lease_seconds):
+    """
+    Take a lease on a batch of due deliveries by pushing next_attempt_at past the
+    send timeout, so other dispatchers skip them. Returns
+    (delivery_id, attempts, url, secret, payload) rows.
+    """
+    now = timezone.now()
+    with db_transaction.atomic():
+        rows = list(
+            WebhookDelivery.objects.filter(status='PENDING', next_attempt_at__lte=now, endpoint__is_active=True)
+            .select_for_update(skip_locked=True, of=('self',))
+            .order_by('next_attempt_at')
+            .values_list('id', 'attempts', 'endpoint__url', 'endpoint__secret', 'payload')[:batch_size]
+        )
+        if rows:
+            WebhookDelivery.objects.filter(id__in=[row[0] for row in rows]).update(
+                next_attempt_at=now + timedelta(seconds=lease_seconds)
+            )
+    return rows
+
+
+def record_results(rows, results, max_attempts=MAX_ATTEMPTS):
+    """
+    Apply dispatcher results ({delivery_id: error or None}) to claimed rows:
+    delivered rows are deleted, failures are rescheduled or marked DEAD.
+    Returns (delivered, retrying, dead) counts.
+    """
+    delivered = [delivery_id for delivery_id, error in results.items() if error is None]
+    now = timezone.now()
+    failed = []
+    for delivery_id, attempts, *_ in rows:
+        error = results.get(delivery_id)
+        if error is None:
+            continue
+        attempts += 1
+        exhausted = attempts >= max_attempts
+        failed.append(WebhookDelivery(
+            id=delivery_id,
+            attempts=attempts,
+            status='DEAD' if exhausted else 'PENDING',
+            next_attempt_at=now if exhausted else now + timedelta(seconds=backoff(attempts)),
+            last_error=error[:1000],
+        ))
+    with db_transaction.atomic():
+        if delivered:
+            WebhookDelivery.objects.filter(id__in=delivered).delete()
+        if failed:
+            WebhookDelivery.objects.bulk_update(failed, ['attempts', 'status', 'next_attempt_at', 'last_error'])
+    dead = sum(1 for delivery in failed if delivery.status == 'DEAD')
+    return len(delivered), len(failed) - dead, dead
+
+
+def requeue_dead(endpoint_id=None):
+    """Give dead-lettered deliveries a fresh set of attempts; returns how many were requeued"""
+    queryset = WebhookDelivery.objects.filter(status='DEAD')
+    if endpoint_id is not None:
+        queryset = queryset.filter(endpoint_id=endpoint_id)
+    return queryset.update(status='PENDING', attempts=0, next_attempt_at=timezone.now())
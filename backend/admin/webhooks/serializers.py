@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework import serializers
+from . import destinations
+from .models import WebhookEndpoint
+
+class WebhookEndpointSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookEndpoint
+        fields = ('id', 'url', 'is_active', 'created_at')
+        read_only_fields = ('id', 'is_active', 'created_at')
+
+    def validate_url(self, value):
+        """Only plain HTTP(S) destinations on public addresses"""
+        if not value.lower().startswith(('https://', 'http://')):
+            raise serializers.ValidationError("URL must start with http:// or https://")
+        if not settings.WEBHOOK_ALLOW_PRIVATE_DESTINATIONS:
+            try:
+                destinations.resolve(value)
+            except destinations.UnsafeDestination as e:
+                raise serializers.ValidationError(str(e))
+        return value
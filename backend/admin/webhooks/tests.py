@@ -0,0 +1,178 @@
+import asyncio
+import socket
+import time
+from datetime import timedelta
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from authentication.models import User
+from . import destinations, queue
+from .dispatcher import Dispatcher
+from .models import WebhookDelivery, WebhookEndpoint
+from .serializers import WebhookEndpointSerializer
+
+PUBLIC = '93.184.216.34'
+
+
+def resolving_to(*addresses):
+    """Patch DNS so every host resolves to addresses"""
+    infos = [(socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, 443))
+             for address in addresses]
+    return mock.patch('webhooks.destinations.socket.getaddrinfo', return_value=infos)
+
+
+@override_settings(WEBHOOK_ALLOW_PRIVATE_DESTINATIONS=False)
+class DestinationValidationTests(SimpleTestCase):
+    def assertRejected(self, url):
+        serializer = WebhookEndpointSerializer(data={'url': url})
+        self.assertFalse(serializer.is_valid(), url)
+        self.assertIn('url', serializer.errors)
+
+    def test_internal_literals_are_rejected(self):
+        for url in ['http://127.0.0.1:8000/api/', 'http://localhost:8001/process-payment',
+                    'http://169.254.169.254/latest/meta-data/', 'http://10.0.0.5/', 'https://192.168.1.1/',
+                    'http://172.16.0.1/', 'http://100.64.0.1/', 'http://0.0.0.0/', 'http://[::1]/',
+                    'http://[fe80::1]/', 'http://[::ffff:127.0.0.1]/', 'http://224.0.0.1/', 'ftp://example.com/']:
+            with self.subTest(url=url):
+                self.assertRejected(url)
+
+    def test_host_resolving_to_private_address_is_rejected(self):
+        with resolving_to('10.1.2.3'):
+            self.assertRejected('https://hooks.example.com/payments')
+
+    def test_any_private_answer_rejects_the_host(self):
+        with resolving_to(PUBLIC, '127.0.0.1'):
+            self.assertRejected('https://hooks.example.com/payments')
+
+    def test_unresolvable_host_is_rejected(self):
+        with mock.patch('webhooks.destinations.socket.getaddrinfo', side_effect=socket.gaierror('no such host')):
+            self.assertRejected('https://nowhere.invalid/')
+
+    def test_public_destination_is_accepted(self):
+        with resolving_to(PUBLIC):
+            serializer = WebhookEndpointSerializer(data={'url': 'https://hooks.example.com/payments'})
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    @override_settings(WEBHOOK_ALLOW_PRIVATE_DESTINATIONS=True)
+    def test_private_destinations_can_be_allowed_for_development(self):
+        serializer = WebhookEndpointSerializer(data={'url': 'http://127.0.0.1:9000/hook'})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+
+class DispatcherDestinationTests(SimpleTestCase):
+    def send(self, dispatcher, url):
+        async def run():
+            try:
+                return await dispatcher.send(url, 'secret', {'id': 1})
+            finally:
+                await dispatcher.close()
+        return asyncio.run(run())
+
+    def test_private_destination_is_refused_without_connecting(self):
+        with mock.patch('httpx.AsyncClient.post') as post:
+            error = self.send(Dispatcher(), 'http://127.0.0.1:8000/api/transactions/')
+        self.assertTrue(error.startswith('Destination refused'), error)
+        post.assert_not_called()
+
+    def test_host_rebound_to_private_address_after_registration_is_refused(self):
+        dispatcher = Dispatcher()
+
+        async def rebound(host, port, **kwargs):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('169.254.169.254', port))]
+
+        async def run():
+            with mock.patch.object(asyncio.get_running_loop(), 'getaddrinfo', rebound):
+                return await dispatcher._target('https://hooks.example.com/payments')
+
+        with self.assertRaises(destinations.UnsafeDestination):
+            asyncio.run(run())
+
+    def test_requests_go_to_the_checked_address(self):
+        dispatcher = Dispatcher()
+        dispatcher.addresses[('hooks.example.com', 8443)] = (float('inf'), PUBLIC)
+        target, headers, extensions = asyncio.run(dispatcher._target('https://hooks.example.com:8443/payments?x=1'))
+        self.assertEqual(target, f'https://{PUBLIC}:8443/payments?x=1')
+        self.assertEqual(headers, {'Host': 'hooks.example.com:8443'})
+        self.assertEqual(extensions, {'sni_hostname': 'hooks.example.com'})
+
+
+class RetryBackoffTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('merchant', 'merchant@example.com', 'pw12345!')
+        cls.endpoint = WebhookEndpoint.objects.create(user=cls.user, url=f'https://{PUBLIC}/hook')
+
+    def deliver(self, event_id, attempts=0):
+        return WebhookDelivery.objects.create(endpoint=self.endpoint, event_id=event_id, payload={'id': event_id},
+                                              attempts=attempts, next_attempt_at=timezone.now())
+
+    def test_backoff_doubles_with_jitter_and_is_capped(self):
+        for attempts in range(1, 15):
+            expected = min(queue.BACKOFF_BASE * 2 ** (attempts - 1), queue.BACKOFF_MAX)
+            for _ in range(20):
+                delay = queue.backoff(attempts)
+                self.assertGreaterEqual(delay, expected * 0.8)
+                self.assertLessEqual(delay, expected * 1.2)
+
+    def test_claim_takes_a_lease_on_due_rows(self):
+        due = self.deliver(1)
+        WebhookDelivery.objects.create(endpoint=self.endpoint, event_id=2, payload={'id': 2},
+                                       next_attempt_at=timezone.now() + timedelta(hours=1))
+        rows = queue.claim_due(10, lease_seconds=30)
+        self.assertEqual([row[0] for row in rows], [due.id])
+        due.refresh_from_db()
+        self.assertGreater(due.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(queue.claim_due(10, lease_seconds=30), [])
+
+    def test_results_delete_delivered_and_reschedule_failures(self):
+        delivered, failing = self.deliver(1), self.deliver(2, attempts=2)
+        rows = queue.claim_due(10, lease_seconds=30)
+        before = timezone.now()
+        counts = queue.record_results(rows, {delivered.id: None, failing.id: 'HTTP 503'})
+
+        self.assertEqual(counts, (1, 1, 0))
+        self.assertFalse(WebhookDelivery.objects.filter(id=delivered.id).exists())
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts, failing.last_error), ('PENDING', 3, 'HTTP 503'))
+        delay = (failing.next_attempt_at - before).total_seconds()
+        self.assertGreaterEqual(delay, queue.BACKOFF_BASE * 4 * 0.8 - 1)
+        self.assertLessEqual(delay, queue.BACKOFF_BASE * 4 * 1.2 + 1)
+
+    def test_last_attempt_is_dead_lettered_and_can_be_requeued(self):
+        dying = self.deliver(1, attempts=queue.MAX_ATTEMPTS - 1)
+        counts = queue.record_results(queue.claim_due(10, lease_seconds=30), {dying.id: 'ConnectError: refused'})
+
+        self.assertEqual(counts, (0, 0, 1))
+        dying.refresh_from_db()
+        self.assertEqual((dying.status, dying.attempts), ('DEAD', queue.MAX_ATTEMPTS))
+        self.assertEqual(queue.claim_due(10, lease_seconds=30), [])
+
+        self.assertEqual(queue.requeue_dead(), 1)
+        dying.refresh_from_db()
+        self.assertEqual((dying.status, dying.attempts), ('PENDING', 0))
+
+
+class DispatcherTimeoutTests(SimpleTestCase):
+    def test_lease_covers_a_batch_to_one_slow_destination(self):
+        dispatcher = Dispatcher(concurrency=100, per_destination=10, timeout=10.0)
+        # 50 rounds of 10 connections, each waiting the full 10s, after up to 10s of resolving
+        self.assertEqual(dispatcher.max_batch_seconds(500), 510.0)
+        self.assertEqual(Dispatcher(concurrency=4, per_destination=10, timeout=2.0).max_batch_seconds(9), 8.0)
+
+    def test_attempt_is_cut_off_at_the_timeout(self):
+        dispatcher = Dispatcher(timeout=0.05, allow_private=True)
+
+        async def trickle(*args, **kwargs):
+            await asyncio.sleep(5)
+
+        async def run():
+            try:
+                return await dispatcher.send_all([(7, 0, 'http://hooks.example.com/', 'secret', {'id': 1})])
+            finally:
+                await dispatcher.close()
+
+        started = time.monotonic()
+        with mock.patch('httpx.AsyncClient.post', side_effect=trickle):
+            results = asyncio.run(run())
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(results[7].startswith('Timeout'), results)
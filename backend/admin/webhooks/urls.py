@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('add/', views.add_endpoint, name='add_webhook_endpoint'),
+    path('list/', views.list_endpoints, name='list_webhook_endpoints'),
+    path('<int:endpoint_id>/delete/', views.delete_endpoint, name='delete_webhook_endpoint'),
+]
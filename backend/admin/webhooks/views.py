@@ -0,0 +1,64 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .models import WebhookEndpoint
+from .serializers import WebhookEndpointSerializer
+
+MAX_ENDPOINTS_PER_USER = 5
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def add_endpoint(request):
+    """Register a URL to be notified when the user's payments succeed or fail"""
+    serializer = WebhookEndpointSerializer(data=request.data)
+
+    if serializer.is_valid():
+        if WebhookEndpoint.objects.filter(user=request.user).count() >= MAX_ENDPOINTS_PER_USER:
+            return Response({
+                'status': 'error',
+                'message': f'At most {MAX_ENDPOINTS_PER_USER} webhook endpoints are allowed'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        endpoint = serializer.save(user=request.user)
+        return Response({
+            'status': 'success',
+            'message': 'Webhook endpoint added successfully',
+            # The signing secret is only ever shown here
+            'data': {**serializer.data, 'secret': endpoint.secret}
+        }, status=status.HTTP_201_CREATED)
+
+    return Response({
+        'status': 'error',
+        'message': 'Failed to add webhook endpoint',
+        'errors': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_endpoints(request):
+    """List the authenticated user's webhook endpoints"""
+    endpoints = WebhookEndpoint.objects.filter(user=request.user)
+    serializer = WebhookEndpointSerializer(endpoints, many=True)
+
+    return Response({
+        'status': 'success',
+        'data': serializer.data,
+        'count': len(serializer.data)
+    }, status=status.HTTP_200_OK)
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def delete_endpoint(request, endpoint_id):
+    """Remove a webhook endpoint and any deliveries still owed to it"""
+    deleted, _ = WebhookEndpoint.objects.filter(id=endpoint_id, user=request.user).delete()
+    if not deleted:
+        return Response({
+            'status': 'error',
+            'message': 'Webhook endpoint not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'status': 'success',
+        'message': 'Webhook endpoint deleted successfully'
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,82 @@
+"""
+Per-payment data-path latency: Django over HTTP vs. direct database access.
+
+Times the two data operations every payment performs (read the transaction,
+record the outcome) against a running Django + MySQL, with the bank
+simulation left out.
+
+    python bench_data_path.py --token <access token> --transaction-ids 1-200
+
+The token must belong to the owner of the transactions. DB settings are read
+from the same DB_* variables as the processor.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from datastore import DatabaseTransactionStore, HttpTransactionStore, aiomysql
+
+
+def parse_ids(spec: str):
+    if "-" in spec:
+        first, last = spec.split("-")
+        return list(range(int(first), int(last) + 1))
+    return [int(part) for part in spec.split(",")]
+
+
+async def run(store, transaction_ids, token, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(transaction_id):
+        async with semaphore:
+            started = time.perf_counter()
+            data = await store.get(transaction_id, token)
+            if data is not None:
+                outcome = "SUCCESS" if int(data["card_details"]["last_four_digits"]) < 5000 else "FAILED"
+                await store.update_status(transaction_id, outcome, token)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await store.start()
+    try:
+        wall = time.perf_counter()
+        await asyncio.gather(*(one(transaction_id) for transaction_id in transaction_ids))
+        wall = time.perf_counter() - wall
+    finally:
+        await store.stop()
+    return latencies, wall
+
+
+def report(name, latencies, wall):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:5s} n={len(latencies)} mean={statistics.mean(latencies):.2f}ms "
+        f"p50={statistics.median(latencies):.2f}ms p95={p95:.2f}ms "
+        f"throughput={len(latencies) / wall:.1f}/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--transaction-ids", required=True, help="e.g. 1-200 or 3,5,8")
+    parser.add_argument("--django-url", default="http://localhost:8000/api")
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    transaction_ids = parse_ids(args.transaction_ids)
+    stores = [("http", HttpTransactionStore(args.django_url))]
+    if aiomysql is not None:
+        stores.append(("db", DatabaseTransactionStore()))
+    else:
+        print("aiomysql is not installed; skipping the db path")
+
+    for name, store in stores:
+        latencies, wall = asyncio.run(run(store, transaction_ids, args.token, args.concurrency))
+        report(name, latencies, wall)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Fraud scoring latency and memory at scale.
+
+Fills the velocity windows with synthetic activity spread over the last 24
+hours, then times score() + record() for random users and cards. No services
+are needed.
+
+    python bench_fraud_scoring.py --keys 1000000 --events 3000000 --samples 200000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fraud import FraudScorer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=1000000, help="window slots per table (users and cards each)")
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--cards", type=int, default=1000000)
+    parser.add_argument("--events", type=int, default=1000000, help="warm-up transactions")
+    parser.add_argument("--samples", type=int, default=100000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    scorer = FraudScorer(args.keys)
+    print(f"allocated {args.keys} slots per table in {time.perf_counter() - started:.2f}s, "
+          f"{(scorer.users.memory_bytes() + scorer.cards.memory_bytes()) / 2**20:.0f} MiB of window arrays")
+
+    now = time.time()
+    rng = random.Random(7)
+    started = time.perf_counter()
+    for _ in range(args.events):
+        scorer.record(rng.randrange(args.users), rng.randrange(args.cards), rng.uniform(1, 500), now - rng.uniform(0, 86400))
+    elapsed = time.perf_counter() - started
+    print(f"warmed {args.events} events in {elapsed:.2f}s ({args.events / elapsed:,.0f}/s), "
+          f"{len(scorer.users.slots)} users / {len(scorer.cards.slots)} cards resident")
+
+    latencies = []
+    declines = 0
+    for _ in range(args.samples):
+        user_id, card_id, amount = rng.randrange(args.users), rng.randrange(args.cards), rng.uniform(1, 2000)
+        started = time.perf_counter_ns()
+        risk = scorer.score(user_id, card_id, amount)
+        scorer.record(user_id, card_id, amount)
+        latencies.append((time.perf_counter_ns() - started) / 1000)
+        declines += risk.decision == "decline"
+
+    latencies.sort()
+    print(
+        f"score+record n={len(latencies)} mean={statistics.mean(latencies):.1f}us "
+        f"p50={latencies[len(latencies) // 2]:.1f}us p99={latencies[int(len(latencies) * 0.99)]:.1f}us "
+        f"declined={declines}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Circuit breaker for the processor's calls to Django"""
+import os
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. After that a single probe call is let
+    through (half-open); its outcome closes or re-opens the circuit. A probe
+    that never reports back (e.g. its request was cancelled) is given up on
+    after another `reset_timeout`, and the next call becomes the probe.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        # When the circuit opened, or when the current half-open probe went out
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+django_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("DJANGO_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.environ.get("DJANGO_BREAKER_RESET_SECONDS", "10")),
+)
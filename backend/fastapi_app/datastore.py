@@ -0,0 +1,439 @@
+"""
+Data access for the payment processor.
+
+Two interchangeable stores read a transaction and record its outcome:
+
+- HttpTransactionStore goes through Django's REST API (the original path).
+- DatabaseTransactionStore talks to the `transactions`, `cards`, `users` and
+  `user_stats` tables directly over an aiomysql connection pool, skipping
+  two DRF request cycles per payment. It mirrors the schema in
+  transactions/models.py, the stats bookkeeping in admin_panel/stats.py and
+  the event rows written by transactions/outbox.py. With DB_SHARDS > 1 it
+  keeps a pool per shard and routes by transaction id, as admin/sharding.py does.
+
+PROCESSOR_DATA_PATH=db selects the database store; anything else, or a
+missing aiomysql, keeps the HTTP store.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import requests
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import aiomysql
+except ImportError:  # optional dependency
+    aiomysql = None
+
+DATA_PATH = os.environ.get("PROCESSOR_DATA_PATH", "http")
+
+# Shared secret for Django's service-only endpoints (PAYMENT_PROCESSOR_KEY there)
+PROCESSOR_KEY = os.environ.get("PAYMENT_PROCESSOR_KEY", "")
+
+# Seconds to wait for Django before treating the call as failed
+DJANGO_TIMEOUT = float(os.environ.get("DJANGO_TIMEOUT_SECONDS", "5"))
+
+# Must match Django's SIMPLE_JWT signing key (SECRET_KEY)
+JWT_SIGNING_KEY = os.environ.get("SECRET_KEY", "django-insecure-your-secret-key-change-in-production")
+
+# Must match admin/sharding.py: shard i issues ids from i << SHARD_ID_BITS
+SHARD_ID_BITS = 48
+DB_SHARDS = int(os.environ.get("DB_SHARDS", "1"))
+
+STATUS_FIELDS = {
+    "PENDING": "pending_count",
+    "SUCCESS": "success_count",
+    "FAILED": "failed_count",
+}
+
+
+class StoreError(Exception):
+    """The backing store could not be reached"""
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def access_token_claims(auth_token: Optional[str]) -> Optional[dict]:
+    """The claims of a validly signed, unexpired HS256 access token issued by Django"""
+    if not auth_token:
+        return None
+    try:
+        header, payload, signature = auth_token.split(".")
+        expected = hmac.new(JWT_SIGNING_KEY.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+        if claims.get("token_type") != "access" or claims.get("exp", 0) < time.time():
+            return None
+        claims["user_id"] = int(claims["user_id"])
+        return claims
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def verify_access_token(auth_token: Optional[str]) -> Optional[int]:
+    """Check an HS256 access token issued by Django and return its user id"""
+    claims = access_token_claims(auth_token)
+    return claims["user_id"] if claims is not None else None
+
+
+class HttpTransactionStore:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    @staticmethod
+    def _headers(auth_token):
+        return {'Authorization': f'Bearer {auth_token}'} if auth_token else {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.session.close()
+
+    async def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Call Django with DJANGO_TIMEOUT. An unreachable, slow, failing (5xx) or
+        throttling (429) Django raises StoreError, so the caller's breaker
+        counts it; any other response is returned for the caller to judge.
+        """
+        try:
+            response = await run_in_threadpool(
+                self.session.request, method, f"{self.base_url}{path}", timeout=DJANGO_TIMEOUT, **kwargs
+            )
+        except requests.exceptions.RequestException as e:
+            raise StoreError(str(e))
+        if response.status_code >= 500 or response.status_code == 429:
+            raise StoreError(f"{method} {path} returned {response.status_code}")
+        return response
+
+    async def get(self, transaction_id: int, auth_token: Optional[str]) -> Optional[dict]:
+        response = await self._request("GET", f"/transactions/{transaction_id}/", headers=self._headers(auth_token))
+        if response.status_code != 200:
+            return None
+        return response.json()['data']
+
+    async def update_status(self, transaction_id: int, new_status: str, auth_token: Optional[str]) -> bool:
+        # Only the processor may set an outcome; the user's token is not accepted there
+        response = await self._request(
+            "PATCH",
+            f"/transactions/{transaction_id}/update-status/",
+            json={"status": new_status},
+            headers={"X-Processor-Key": PROCESSOR_KEY}
+        )
+        return response.status_code == 200
+
+    async def update_statuses(self, updates: list) -> list:
+        """
+        Apply [{'id': ..., 'status': ...}, ...] in one request. Returns the updates
+        Django refused, each with a "reason"; a refused batch raises StoreError.
+        """
+        response = await self._request(
+            "POST",
+            "/transactions/bulk-update-status/",
+            json={"updates": updates},
+            headers={"X-Processor-Key": PROCESSOR_KEY}
+        )
+        if response.status_code != 200:
+            raise StoreError(f"bulk-update-status returned {response.status_code}")
+        try:
+            data = response.json()['data']
+            reasons = {**{txn_id: "not_found" for txn_id in data['not_found']},
+                       **{txn_id: "conflict" for txn_id in data['conflicts']}}
+        except (ValueError, KeyError, TypeError):
+            raise StoreError("bulk-update-status returned an unreadable response")
+        return [{**update, "reason": reasons[update["id"]]} for update in updates if update["id"] in reasons]
+
+    async def record_outcome_minutes(self, rows: list) -> bool:
+        """Add per-minute outcome counters (timeseries.OutcomeSeries.take()) to Django's rollups"""
+        response = await self._request(
+            "POST",
+            "/transactions/outcome-minutes/",
+            json={"minutes": rows},
+            headers={"X-Processor-Key": PROCESSOR_KEY}
+        )
+        return response.status_code == 200
+
+    async def recent_activity(self, since: float):
+        """Yield (transaction_id, user_id, card_id, amount, timestamp) for transactions created after `since`"""
+        before_id = None
+        while True:
+            params = {"since": since}
+            if before_id is not None:
+                params["before_id"] = before_id
+            response = await self._request(
+                "GET",
+                "/transactions/recent-activity/",
+                params=params,
+                headers={"X-Processor-Key": PROCESSOR_KEY}
+            )
+            if response.status_code != 200:
+                raise StoreError(f"recent-activity returned {response.status_code}")
+            data = response.json()['data']
+            for row in data['rows']:
+                yield tuple(row)
+            before_id = data['next_before_id']
+            if before_id is None:
+                return
+
+
+class DatabaseTransactionStore:
+    GET_SQL = (
+        "SELECT t.id, t.user_id, t.card_id, t.amount, t.currency, t.status, "
+        "c.card_type, c.last_four_digits, c.expires_on "
+        "FROM transactions t JOIN cards c ON c.id = t.card_id "
+        "WHERE t.id = %s"
+    )
+
+    # Users and revoked tokens stay on shard 0 (Django's default database)
+    ACCESS_SQL = (
+        "SELECT u.is_active, EXISTS(SELECT 1 FROM revoked_tokens r WHERE r.jti = %s) "
+        "FROM users u WHERE u.id = %s"
+    )
+
+    # Same additive upsert as admin_panel.timeseries.add_rollups, at minute resolution
+    ROLLUP_SQL = (
+        "INSERT INTO outcome_rollups (bucket, resolution, status, currency, card_type, count, amount, "
+        "timed_count, latency_ms_sum, latency_ms_max) VALUES (%s, 60, %s, %s, %s, %s, %s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE count = count + VALUES(count), amount = amount + VALUES(amount), "
+        "timed_count = timed_count + VALUES(timed_count), latency_ms_sum = latency_ms_sum + VALUES(latency_ms_sum), "
+        "latency_ms_max = GREATEST(latency_ms_max, VALUES(latency_ms_max))"
+    )
+
+    def __init__(self):
+        self.pools = []
+
+    @staticmethod
+    def _shard_location(index):
+        """(host, database) of shard `index`, with the same defaults as Django's settings"""
+        host = os.environ.get("DB_HOST", "localhost")
+        name = os.environ.get("DB_NAME", "payment_gateway")
+        if index == 0:
+            return host, name
+        return (os.environ.get(f"DB_SHARD{index}_HOST", host),
+                os.environ.get(f"DB_SHARD{index}_NAME", f"{name}_shard{index}"))
+
+    async def start(self):
+        for index in range(DB_SHARDS):
+            host, name = self._shard_location(index)
+            self.pools.append(await aiomysql.create_pool(
+                host=host,
+                port=int(os.environ.get("DB_PORT", "3306")),
+                user=os.environ.get("DB_USER", "root"),
+                password=os.environ.get("DB_PASSWORD", ""),
+                db=name,
+                minsize=int(os.environ.get("DB_POOL_MIN", "2")),
+                maxsize=int(os.environ.get("DB_POOL_MAX", "20")),
+                autocommit=True,
+            ))
+
+    async def stop(self):
+        for pool in self.pools:
+            pool.close()
+            await pool.wait_closed()
+        self.pools = []
+
+    def _pool_for(self, transaction_id: int):
+        """Pool of the shard that issued transaction_id, or None if none did"""
+        index = transaction_id >> SHARD_ID_BITS
+        return self.pools[index] if 0 <= index < len(self.pools) else None
+
+    async def get(self, transaction_id: int, auth_token: Optional[str]) -> Optional[dict]:
+        claims = access_token_claims(auth_token)
+        pool = self._pool_for(transaction_id)
+        if claims is None or pool is None:
+            return None
+        user_id = claims["user_id"]
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute(self.GET_SQL, (transaction_id,))
+                    row = await cur.fetchone()
+            if row is None or row["user_id"] != user_id:
+                return None
+            # Django rejects the token of a deactivated user, or one revoked at logout
+            # (authentication/revocation.py), on every request; the signature alone
+            # would keep it paying here until it expires
+            async with self.pools[0].acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(self.ACCESS_SQL, (str(claims.get("jti", "")), user_id))
+                    access = await cur.fetchone()
+        except aiomysql.Error as e:
+            raise StoreError(str(e))
+        if access is None or not access[0] or access[1]:
+            return None
+        return {
+            "id": row["id"],
+            "user": row["user_id"],
+            "card": row["card_id"],
+            "amount": str(row["amount"]),
+            "currency": row["currency"],
+            "status": row["status"],
+            "card_details": {
+                "id": row["card_id"],
+                "card_type": row["card_type"],
+                "last_four_digits": row["last_four_digits"],
+                "expires_on": row["expires_on"].isoformat(),
+            },
+        }
+
+    async def update_status(self, transaction_id: int, new_status: str, auth_token: Optional[str]) -> bool:
+        pool = self._pool_for(transaction_id)
+        if new_status not in ("SUCCESS", "FAILED") or pool is None:
+            return False
+        try:
+            async with pool.acquire() as conn:
+                await conn.begin()
+                try:
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            "SELECT user_id, status, amount, card_id, currency, transaction_date "
+                            "FROM transactions WHERE id = %s FOR UPDATE",
+                            (transaction_id,)
+                        )
+                        row = await cur.fetchone()
+                        if row is None:
+                            await conn.rollback()
+                            return False
+                        user_id, old_status, amount, card_id, currency, created = row
+                        # SUCCESS and FAILED are final, as in Django's set_transaction_status
+                        if old_status != "PENDING":
+                            await conn.rollback()
+                            return old_status == new_status
+                        await cur.execute(
+                            "UPDATE transactions SET status = %s, updated_at = UTC_TIMESTAMP(6) WHERE id = %s",
+                            (new_status, transaction_id)
+                        )
+                        spend = self._spend_update(user_id, old_status, new_status, currency, created, amount)
+                        if await cur.execute(*self._stats_update(user_id, old_status, new_status)) and spend:
+                            await cur.execute(*spend)
+                        await cur.execute(
+                            "INSERT INTO outbox_events (transaction_id, event_type, payload, created_at) "
+                            "VALUES (%s, 'transaction.status_changed', %s, UTC_TIMESTAMP(6))",
+                            (transaction_id, json.dumps({
+                                "transaction_id": transaction_id,
+                                "user_id": user_id,
+                                "card_id": card_id,
+                                "amount": str(amount),
+                                "currency": currency,
+                                "status": new_status,
+                                "previous_status": old_status,
+                            }))
+                        )
+                    await conn.commit()
+                except BaseException:
+                    await conn.rollback()
+                    raise
+        except aiomysql.Error as e:
+            raise StoreError(str(e))
+        return True
+
+    async def update_statuses(self, updates: list) -> list:
+        """Apply the updates one by one; returns the refused ones, as HttpTransactionStore does"""
+        refused = []
+        for update in updates:
+            if not await self.update_status(update["id"], update["status"], None):
+                refused.append({**update, "reason": "refused"})
+        return refused
+
+    async def record_outcome_minutes(self, rows: list) -> bool:
+        """Add per-minute outcome counters to the rollup table, which lives on the default database"""
+        try:
+            async with self.pools[0].acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.executemany(self.ROLLUP_SQL, [
+                        # Django stores naive UTC datetimes in MySQL
+                        (datetime.fromtimestamp(row["minute"] * 60, timezone.utc).replace(tzinfo=None),
+                         row["status"], row["currency"], row["card_type"], row["count"], row["amount"],
+                         row["timed_count"], row["latency_ms_sum"], row["latency_ms_max"])
+                        for row in rows
+                    ])
+        except aiomysql.Error as e:
+            raise StoreError(str(e))
+        return True
+
+    async def recent_activity(self, since: float, page_size: int = 5000):
+        """
+        Yield (transaction_id, user_id, card_id, amount, timestamp) for transactions
+        created after `since`, walking the primary key downwards so only the window is read.
+        Shards are walked one after another; a user's rows all come from one shard.
+        """
+        for pool in reversed(self.pools):
+            async for row in self._recent_on(pool, since, page_size):
+                yield row
+
+    @staticmethod
+    async def _recent_on(pool, since: float, page_size: int):
+        before_id = None
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    while True:
+                        if before_id is None:
+                            await cur.execute(
+                                "SELECT id, user_id, card_id, amount, transaction_date "
+                                "FROM transactions ORDER BY id DESC LIMIT %s",
+                                (page_size,)
+                            )
+                        else:
+                            await cur.execute(
+                                "SELECT id, user_id, card_id, amount, transaction_date "
+                                "FROM transactions WHERE id < %s ORDER BY id DESC LIMIT %s",
+                                (before_id, page_size)
+                            )
+                        page = await cur.fetchall()
+                        for transaction_id, user_id, card_id, amount, created in page:
+                            # Django stores naive UTC datetimes in MySQL
+                            timestamp = created.replace(tzinfo=timezone.utc).timestamp()
+                            if timestamp < since:
+                                return
+                            yield transaction_id, user_id, card_id, amount, timestamp
+                        if len(page) < page_size:
+                            return
+                        before_id = page[-1][0]
+        except aiomysql.Error as e:
+            raise StoreError(str(e))
+
+    @staticmethod
+    def _stats_update(user_id, old_status, new_status):
+        """Same deltas as admin_panel.stats.status_changed; a missing row is rebuilt lazily by Django"""
+        old_field, new_field = STATUS_FIELDS[old_status], STATUS_FIELDS[new_status]
+        sql = (
+            f"UPDATE user_stats SET {old_field} = {old_field} - 1, {new_field} = {new_field} + 1, "
+            "updated_at = UTC_TIMESTAMP(6) WHERE user_id = %s"
+        )
+        return sql, (user_id,)
+
+    @staticmethod
+    def _spend_update(user_id, old_status, new_status, currency, created, amount):
+        """
+        The user_spend upsert for a move into or out of SUCCESS, keyed like
+        admin_panel.stats.spend_day(): Django stores naive UTC datetimes, so
+        the day is the UTC date. Only applied when the user_stats row exists.
+        """
+        if new_status == "SUCCESS":
+            delta = amount
+        elif old_status == "SUCCESS":
+            delta = -amount
+        else:
+            return None
+        sql = (
+            "INSERT INTO user_spend (user_id, currency, day, amount) VALUES (%s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE amount = amount + VALUES(amount)"
+        )
+        return sql, (user_id, currency, created.date(), delta)
+
+
+def create_store(django_api_url: str):
+    if DATA_PATH == "db" and aiomysql is not None:
+        return DatabaseTransactionStore()
+    return HttpTransactionStore(django_api_url)
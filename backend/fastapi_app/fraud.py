@@ -0,0 +1,210 @@
+"""
+Velocity and amount-anomaly scoring for the payment processor.
+
+Per-user and per-card activity is tracked in sliding windows (1 minute,
+1 hour, 24 hours), each split into a small ring of time buckets holding a
+count and a sum. All rings live in flat preallocated arrays indexed by a
+slot number, so memory is fixed up front by `max_keys`; when the table is
+full, the least recently touched key is recycled (CLOCK eviction).
+"""
+import os
+import time
+from array import array
+from collections import OrderedDict
+from typing import NamedTuple
+
+# (name, window seconds, buckets)
+WINDOWS = (
+    ("1m", 60, 6),
+    ("1h", 3600, 6),
+    ("24h", 86400, 12),
+)
+
+COUNT_MAX = 65535
+
+ALLOW = "allow"
+FLAG = "flag"
+DECLINE = "decline"
+
+RULES = {
+    "user_count_1m": int(os.environ.get("FRAUD_USER_COUNT_1M", "5")),
+    "user_count_1h": int(os.environ.get("FRAUD_USER_COUNT_1H", "30")),
+    "card_count_1h": int(os.environ.get("FRAUD_CARD_COUNT_1H", "20")),
+    "user_sum_24h": float(os.environ.get("FRAUD_USER_SUM_24H", "50000")),
+    "amount_vs_average": float(os.environ.get("FRAUD_AMOUNT_VS_AVERAGE", "10")),
+    "amount_floor": float(os.environ.get("FRAUD_AMOUNT_FLOOR", "1000")),
+}
+
+
+class WindowTable:
+    """
+    Count/sum sliding windows for up to `max_keys` keys in fixed-size arrays.
+
+    Each key owns `buckets` consecutive entries per window plus the epoch
+    (time // bucket width) of its newest bucket. Buckets that have slid out
+    of the window are zeroed lazily the next time the key is touched, so
+    a window total is a plain slice sum. About 250 bytes per key.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.slots = {}
+        self.keys = [None] * max_keys
+        self.referenced = bytearray(max_keys)
+        self.hand = 0
+        self.used = 0
+        self.windows = []
+        for name, seconds, buckets in WINDOWS:
+            size = max_keys * buckets
+            self.windows.append((
+                name,
+                seconds / buckets,
+                buckets,
+                # Repeating a one-item array fills in place; array(typecode, bytes(n)) copies n zero bytes
+                array("H", [0]) * size,             # counts, saturating at COUNT_MAX
+                array("d", [0]) * size,             # sums, as doubles: float32 loses cents past 100000
+                array("i", [0]) * max_keys,         # newest bucket epoch per key
+            ))
+
+    def _slot(self, key, create: bool):
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.referenced[slot] = 1
+            return slot
+        if not create:
+            return None
+        if self.used < self.max_keys:
+            slot = self.used
+            self.used += 1
+        else:
+            slot = self._evict()
+        self.slots[key] = slot
+        self.keys[slot] = key
+        self.referenced[slot] = 1
+        return slot
+
+    def _evict(self) -> int:
+        """Second-chance sweep: recycle the first slot not touched since the hand last passed it"""
+        while True:
+            slot = self.hand
+            self.hand = (self.hand + 1) % self.max_keys
+            if self.referenced[slot]:
+                self.referenced[slot] = 0
+                continue
+            del self.slots[self.keys[slot]]
+            for _, _, buckets, counts, sums, epochs in self.windows:
+                start = slot * buckets
+                counts[start:start + buckets] = array("H", bytes(2 * buckets))
+                sums[start:start + buckets] = array("d", bytes(8 * buckets))
+                epochs[slot] = 0
+            return slot
+
+    @staticmethod
+    def _advance(slot, epoch, buckets, counts, sums, epochs):
+        """Zero the buckets between the key's newest bucket and `epoch`"""
+        last = epochs[slot]
+        if epoch <= last:
+            return
+        start = slot * buckets
+        if epoch - last >= buckets:
+            counts[start:start + buckets] = array("H", bytes(2 * buckets))
+            sums[start:start + buckets] = array("d", bytes(8 * buckets))
+        else:
+            for e in range(last + 1, epoch + 1):
+                i = start + e % buckets
+                counts[i] = 0
+                sums[i] = 0.0
+        epochs[slot] = epoch
+
+    def add(self, key, amount: float, now: float):
+        slot = self._slot(key, create=True)
+        for _, width, buckets, counts, sums, epochs in self.windows:
+            epoch = int(now // width)
+            self._advance(slot, epoch, buckets, counts, sums, epochs)
+            if epochs[slot] - epoch >= buckets:
+                continue  # older than the window (e.g. out-of-order warm-up rows)
+            i = slot * buckets + epoch % buckets
+            if counts[i] < COUNT_MAX:
+                counts[i] += 1
+            sums[i] += amount
+
+    def totals(self, key, now: float) -> dict:
+        """{window name: (count, sum)} for a key"""
+        slot = self._slot(key, create=False)
+        result = {}
+        for name, width, buckets, counts, sums, epochs in self.windows:
+            if slot is None:
+                result[name] = (0, 0.0)
+                continue
+            self._advance(slot, int(now // width), buckets, counts, sums, epochs)
+            start = slot * buckets
+            result[name] = (sum(counts[start:start + buckets]), sum(sums[start:start + buckets]))
+        return result
+
+    def memory_bytes(self) -> int:
+        return sum(arr.itemsize * len(arr) for w in self.windows for arr in w[3:]) + len(self.referenced)
+
+
+class Score(NamedTuple):
+    decision: str
+    reasons: list
+
+
+class FraudScorer:
+    def __init__(self, max_keys: int, max_recorded: int = None):
+        self.users = WindowTable(max_keys)
+        self.cards = WindowTable(max_keys)
+        # Ids of the transactions counted so far, oldest first, so one that is processed twice
+        # (a client retry racing a sweeper re-drive) or was already loaded by warm() counts once
+        self.recorded = OrderedDict()
+        self.max_recorded = max_keys if max_recorded is None else max_recorded
+
+    def record(self, user_id, card_id, amount: float, now: float = None, transaction_id=None) -> bool:
+        """Count a payment in the windows; False if its transaction was already counted"""
+        if transaction_id is not None:
+            if transaction_id in self.recorded:
+                return False
+            if len(self.recorded) >= self.max_recorded:
+                self.recorded.popitem(last=False)
+            self.recorded[transaction_id] = None
+        now = time.time() if now is None else now
+        self.users.add(user_id, amount, now)
+        self.cards.add(card_id, amount, now)
+        return True
+
+    def score(self, user_id, card_id, amount: float, now: float = None) -> Score:
+        """Score a payment against activity seen so far (the payment itself excluded)"""
+        now = time.time() if now is None else now
+        user = self.users.totals(user_id, now)
+        card = self.cards.totals(card_id, now)
+        declines = []
+        flags = []
+
+        if user["1m"][0] >= RULES["user_count_1m"]:
+            declines.append("user_velocity_1m")
+        if user["1h"][0] >= RULES["user_count_1h"]:
+            flags.append("user_velocity_1h")
+        if card["1h"][0] >= RULES["card_count_1h"]:
+            declines.append("card_velocity_1h")
+        if user["24h"][1] + amount > RULES["user_sum_24h"]:
+            declines.append("user_amount_24h")
+        count_24h, sum_24h = user["24h"]
+        if count_24h and amount >= RULES["amount_floor"] and amount > RULES["amount_vs_average"] * sum_24h / count_24h:
+            flags.append("amount_anomaly")
+
+        if declines:
+            return Score(DECLINE, declines + flags)
+        if flags:
+            return Score(FLAG, flags)
+        return Score(ALLOW, [])
+
+    async def warm(self, rows):
+        """Load recent activity from an async iterator of (transaction_id, user_id, card_id, amount, timestamp)"""
+        loaded = 0
+        async for transaction_id, user_id, card_id, amount, timestamp in rows:
+            loaded += self.record(user_id, card_id, float(amount), timestamp, transaction_id)
+        return loaded
+
+
+scorer = FraudScorer(int(os.environ.get("FRAUD_MAX_KEYS", "200000")),
+                     int(os.environ.get("FRAUD_MAX_RECORDED_IDS", "200000")))
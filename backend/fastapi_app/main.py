@@ -1,13 +1,141 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field, validator
 from typing import Optional
-import random
+from decimal import Decimal
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import json
+import logging
 import requests
-from datetime import datetime
-import uvicorn
+from datetime import date, datetime
+import os
+import time
+from circuit import django_breaker
+from datastore import (DJANGO_TIMEOUT, PROCESSOR_KEY, HttpTransactionStore, StoreError, create_store,
+                       verify_access_token)
+from fraud import ALLOW, DECLINE, Score, scorer
+import profiling
+from ratelimit import admission, limiter
+from timeseries import TIMESERIES_FLUSH_SECONDS, outcomes
+from wal import WriteAheadLog
 
-app = FastAPI(title="Payment Gateway - Payment Processor", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+# Django Backend URL
+DJANGO_API_URL = os.environ.get("DJANGO_API_URL", "http://localhost:8000/api")
+
+# Seconds the simulated bank takes to answer
+BANK_SIMULATION_DELAY = float(os.environ.get("BANK_SIMULATION_DELAY", "1"))
+
+# Where transactions are read from and written to: Django over HTTP, or the database directly
+store = create_store(DJANGO_API_URL)
+
+# Outcomes that could not be written while Django was unavailable
+outcome_log = WriteAheadLog(os.environ.get("OUTCOME_WAL_DIR", "wal"))
+WAL_REPLAY_INTERVAL = float(os.environ.get("OUTCOME_WAL_REPLAY_SECONDS", "2"))
+# Outcomes are written through Django's processor-only endpoints, which refuse every call without the key
+WAL_REPLAY_ENABLED = bool(PROCESSOR_KEY) or not isinstance(store, HttpTransactionStore)
+
+# enforce: decline on velocity rules; flag: only report what would be declined; off: skip scoring
+FRAUD_MODE = os.environ.get("FRAUD_MODE", "enforce")
+FRAUD_WARM_HOURS = float(os.environ.get("FRAUD_WARM_HOURS", "24"))
+fraud_warm_state = {"status": "pending", "loaded": 0}
+
+async def warm_fraud_windows():
+    """Fill the velocity windows with recent transactions so scoring is accurate right after a restart"""
+    fraud_warm_state["status"] = "running"
+    try:
+        since = datetime.now().timestamp() - FRAUD_WARM_HOURS * 3600
+        fraud_warm_state["loaded"] = await scorer.warm(store.recent_activity(since))
+    except StoreError:
+        fraud_warm_state["status"] = "failed"
+    else:
+        fraud_warm_state["status"] = "done"
+
+async def replay_outcomes_forever():
+    """Push logged outcomes to Django whenever the circuit lets a call through"""
+    while True:
+        await asyncio.sleep(WAL_REPLAY_INTERVAL)
+        if not outcome_log.has_pending() or not django_breaker.allow_request():
+            continue
+        try:
+            await outcome_log.replay(send_outcomes)
+        except StoreError as e:
+            django_breaker.record_failure()
+            logger.warning("Outcome replay failed, %s outcomes still queued: %s", outcome_log.queued(), e)
+        except Exception:
+            # e.g. a segment that cannot be read; the probe must still be reported and the loop kept alive
+            django_breaker.record_failure()
+            logger.exception("Outcome replay failed, %s outcomes still queued", outcome_log.queued())
+        except BaseException:
+            django_breaker.record_failure()
+            raise
+        else:
+            django_breaker.record_success()
+
+async def send_outcomes(records: list) -> bool:
+    # A refused batch raises StoreError and stays in the log for the next attempt; single outcomes
+    # the store refused will never apply, so they are set aside rather than retried or dropped
+    refused = await store.update_statuses(records)
+    if refused:
+        logger.error("Django refused %s replayed outcomes, moved to %s: %s",
+                     len(refused), outcome_log.dead_letter_path, refused)
+        await outcome_log.dead_letter(refused)
+    return True
+
+async def flush_outcome_counts_forever():
+    """Send the per-minute decision counts to the rollup table, keeping them while the store is unavailable"""
+    while True:
+        await asyncio.sleep(TIMESERIES_FLUSH_SECONDS)
+        rows = outcomes.take()
+        if not rows:
+            continue
+        if not django_breaker.allow_request():
+            outcomes.restore(rows)
+            continue
+        # This call may be the half-open probe, so its result always goes back to the breaker
+        try:
+            written = await store.record_outcome_minutes(rows)
+        except StoreError:
+            django_breaker.record_failure()
+            written = False
+        except BaseException:
+            django_breaker.record_failure()
+            outcomes.restore(rows)
+            raise
+        else:
+            # Django answered; a refusal keeps the rows but says nothing against its availability
+            django_breaker.record_success()
+        if not written:
+            outcomes.restore(rows)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await store.start()
+    await outcome_log.start()
+    if WAL_REPLAY_ENABLED:
+        replayer = asyncio.create_task(replay_outcomes_forever())
+    else:
+        replayer = None
+        logger.error("PAYMENT_PROCESSOR_KEY is not set: Django will refuse every outcome, "
+                     "and queued outcomes will be kept in %s but not replayed",
+                     outcome_log.directory)
+    flusher = asyncio.create_task(flush_outcome_counts_forever())
+    warmer = asyncio.create_task(warm_fraud_windows()) if FRAUD_MODE != "off" else None
+    yield
+    if replayer is not None:
+        replayer.cancel()
+    flusher.cancel()
+    if warmer is not None:
+        warmer.cancel()
+    await outcome_log.stop()
+    await store.stop()
+
+app = FastAPI(title="Payment Gateway - Payment Processor", version="1.0.0", lifespan=lifespan)
 
 # CORS Configuration
 app.add_middleware(
@@ -17,9 +145,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Django Backend URL
-DJANGO_API_URL = "http://localhost:8000/api"
+# Added last so it runs outermost and times the whole request
+app.add_middleware(profiling.ProfilingMiddleware)
 
 # Pydantic Models
 class PaymentRequest(BaseModel):
@@ -32,6 +159,13 @@ class PaymentRequest(BaseModel):
             raise ValueError('Transaction ID must be positive')
         return v
 
+class PayRequest(BaseModel):
+    card_id: int = Field(..., description="Card ID from Django")
+    amount: Decimal = Field(..., description="Amount to charge")
+    currency: str = Field("USD", description="Currency code")
+    description: Optional[str] = Field("", description="Payment description")
+    auth_token: Optional[str] = Field(None, description="Authentication token")
+
 class PaymentResponse(BaseModel):
     status: str
     message: str
@@ -39,6 +173,8 @@ class PaymentResponse(BaseModel):
     payment_status: str
     amount: Optional[float] = None
     timestamp: str
+    status_queued: bool = False
+    risk_flags: list[str] = []
 
 # Dummy Card Database for Testing
 DUMMY_CARDS = {
@@ -49,60 +185,122 @@ DUMMY_CARDS = {
     "5555555555554444": {"status": "FAILED", "bank": "Test Bank"},   # Mastercard - Always Fail
 }
 
-def simulate_payment_processing(transaction_id: int, auth_token: str = None) -> dict:
+def auth_headers(auth_token: Optional[str]) -> dict:
+    return {'Authorization': f'Bearer {auth_token}'} if auth_token else {}
+
+def decide_payment(transaction_data: dict) -> dict:
+    """Apply the dummy card rules to a transaction fetched from Django"""
+    card_number = transaction_data['card_details']['last_four_digits']
+    amount = float(transaction_data['amount'])
+    
+    # Check if last 4 digits match any dummy card pattern
+    # Cards ending in 0000-4999 = SUCCESS
+    # Cards ending in 5000-9999 = FAILED
+    last_four = int(card_number)
+    
+    if last_four < 5000:
+        payment_status = "SUCCESS"
+        reason = "Payment processed successfully"
+    else:
+        payment_status = "FAILED"
+        reason = "Insufficient funds or card declined"
+    
+    # Alternatively, use random simulation (70% success rate)
+    # payment_status = random.choices(["SUCCESS", "FAILED"], weights=[70, 30])[0]
+    
+    return {
+        "status": payment_status,
+        "reason": reason,
+        "amount": amount,
+        "transaction_id": transaction_data['id']
+    }
+
+async def simulate_payment_processing(transaction_id: int, auth_token: str = None, transaction_data: dict = None) -> dict:
     """
     Simulate payment processing with dummy card logic
     Returns SUCCESS or FAILED based on card number pattern
-    """
-    # Simulate processing delay
-    import time
-    time.sleep(1)
     
-    # Get transaction details from Django
-    try:
-        headers = {}
-        if auth_token:
-            headers['Authorization'] = f'Bearer {auth_token}'
-        
-        response = requests.get(
-            f"{DJANGO_API_URL}/transactions/{transaction_id}/",
-            headers=headers
-        )
+    transaction_data can be passed when the caller already has the
+    transaction, which saves the lookup.
+    """
+    if transaction_data is None:
+        # Get transaction details
+        transaction_data = await fetch_transaction(transaction_id, auth_token)
         
-        if response.status_code != 200:
+        if transaction_data is None:
             return {"status": "FAILED", "reason": "Transaction not found"}
-        
-        transaction_data = response.json()['data']
-        card_number = transaction_data['card_details']['last_four_digits']
-        amount = float(transaction_data['amount'])
-        
-        # Check if last 4 digits match any dummy card pattern
-        # Cards ending in 0000-4999 = SUCCESS
-        # Cards ending in 5000-9999 = FAILED
-        last_four = int(card_number)
-        
-        if last_four < 5000:
-            payment_status = "SUCCESS"
-            reason = "Payment processed successfully"
-        else:
-            payment_status = "FAILED"
-            reason = "Insufficient funds or card declined"
-        
-        # Alternatively, use random simulation (70% success rate)
-        # payment_status = random.choices(["SUCCESS", "FAILED"], weights=[70, 30])[0]
-        
+    
+    if transaction_data.get('status', "PENDING") != "PENDING":
+        # Already decided (e.g. a retry after a lost response): not scored, counted or sent to the bank again
         return {
-            "status": payment_status,
-            "reason": reason,
-            "amount": amount,
-            "transaction_id": transaction_id
+            "status": transaction_data['status'],
+            "reason": "Transaction already processed",
+            "amount": float(transaction_data['amount']),
+            "transaction_id": transaction_data['id'],
+            "already_processed": True,
         }
+    
+    try:
+        # Expired cards never reach the bank; expires_on comes with the card details already fetched
+        if card_expired(transaction_data['card_details']):
+            result = {
+                "status": "FAILED",
+                "reason": "Card expired",
+                "amount": float(transaction_data['amount']),
+                "transaction_id": transaction_data['id']
+            }
+        else:
+            # Velocity checks run before the bank is asked, so a declined payment costs no bank call
+            risk = score_payment(transaction_data)
+            if risk.decision == DECLINE and FRAUD_MODE == "enforce":
+                result = {
+                    "status": "FAILED",
+                    "reason": "Declined by risk checks",
+                    "amount": float(transaction_data['amount']),
+                    "transaction_id": transaction_data['id'],
+                    "risk_flags": risk.reasons
+                }
+            else:
+                # Simulate processing delay
+                await asyncio.sleep(BANK_SIMULATION_DELAY)
+                
+                result = decide_payment(transaction_data)
+                result["risk_flags"] = risk.reasons
         
     except Exception as e:
         return {
             "status": "FAILED",
             "reason": f"Processing error: {str(e)}"
         }
+    
+    # What the outcome time series is broken down by
+    result["currency"] = transaction_data.get('currency')
+    result["card_type"] = transaction_data['card_details'].get('card_type')
+    return result
+
+def card_expired(card_details: dict) -> bool:
+    """True once the card's last valid day has passed"""
+    expires_on = card_details.get('expires_on')
+    return expires_on is not None and date.fromisoformat(expires_on) < date.today()
+
+def score_payment(transaction_data: dict):
+    """Score a payment against the velocity windows, then count it in them"""
+    if FRAUD_MODE == "off":
+        return Score(ALLOW, [])
+    user_id, card_id = transaction_data['user'], transaction_data['card']
+    amount = float(transaction_data['amount'])
+    risk = scorer.score(user_id, card_id, amount)
+    scorer.record(user_id, card_id, amount, transaction_id=transaction_data['id'])
+    return risk
+
+def token_subject(auth_token: Optional[str]) -> Optional[str]:
+    """
+    The user id of a validly signed access token, for rate-limit keying.
+    A forged or expired token gets no user bucket, only the IP and global ones,
+    so it cannot spend another user's budget.
+    """
+    user_id = verify_access_token(auth_token)
+    return str(user_id) if user_id is not None else None
 
 @app.get("/")
 def root():
@@ -116,11 +314,16 @@ def root():
 def health_check():
     return {
         "status": "healthy",
+        "django_circuit": django_breaker.state,
+        "queued_outcomes": outcome_log.queued(),
+        "dead_lettered_outcomes": outcome_log.dead_lettered(),
+        "outcome_replay": "running" if WAL_REPLAY_ENABLED else "disabled: PAYMENT_PROCESSOR_KEY not set",
+        "fraud_windows": fraud_warm_state,
         "timestamp": datetime.now().isoformat()
     }
 
 @app.post("/process-payment", response_model=PaymentResponse)
-async def process_payment(payment_request: PaymentRequest):
+async def process_payment(payment_request: PaymentRequest, request: Request):
     """
     Process payment for a given transaction
     
@@ -131,53 +334,191 @@ async def process_payment(payment_request: PaymentRequest):
     transaction_id = payment_request.transaction_id
     auth_token = payment_request.auth_token
     
+    admit(request, auth_token)
+    try:
+        return await complete_payment(transaction_id, auth_token)
+    finally:
+        admission.release()
+
+@app.post("/pay", response_model=PaymentResponse)
+async def create_and_process_payment(pay_request: PayRequest, request: Request):
+    """
+    Create the transaction in Django and process it in one call
+    
+    The transaction returned by Django's create endpoint is used directly,
+    so the client makes a single request and the processor skips the GET.
+    """
+    admit(request, pay_request.auth_token)
+    try:
+        return await create_and_complete_payment(pay_request)
+    finally:
+        admission.release()
+
+def is_processor_call(request: Request) -> bool:
+    """Whether the request carries the shared processor key, as re-drives from Django's sweeper do"""
+    key = request.headers.get("X-Processor-Key")
+    return bool(PROCESSOR_KEY) and key is not None and hmac.compare_digest(key, PROCESSOR_KEY)
+
+def admit(request: Request, auth_token: Optional[str]):
+    """Apply rate limits and take an admission slot, or raise 429/503"""
+    # Sweeper re-drives all come from one host and are already bounded by its --concurrency;
+    # the admission cap still applies to them
+    retry_after = 0 if is_processor_call(request) else limiter.check({
+        "user": token_subject(auth_token),
+        "ip": request.client.host if request.client else None,
+        "global": "all",
+    })
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    if not admission.try_acquire():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment processor is at capacity",
+            headers={"Retry-After": "1"}
+        )
+
+async def create_and_complete_payment(pay_request: PayRequest) -> PaymentResponse:
+    """Create the PENDING transaction in Django, then run it through the processor"""
+    try:
+        create_response = await run_in_threadpool(
+            requests.post,
+            f"{DJANGO_API_URL}/transactions/create/",
+            json={
+                "card_id": pay_request.card_id,
+                "amount": str(pay_request.amount),
+                "currency": pay_request.currency,
+                "description": pay_request.description or "",
+            },
+            # The key exempts the create from Django's per-IP limit, which would otherwise
+            # be shared by every /pay client; admit() has already limited this one
+            headers={**auth_headers(pay_request.auth_token), "X-Processor-Key": PROCESSOR_KEY},
+            timeout=DJANGO_TIMEOUT
+        )
+    except requests.exceptions.RequestException as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Communication error with Django: {str(e)}"
+        )
+    
+    try:
+        body = create_response.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        # A proxy error page or a truncated body, not Django's JSON envelope
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Django returned an unreadable response (HTTP {create_response.status_code}) to transaction create"
+        )
+    
+    if create_response.status_code != 201:
+        raise HTTPException(
+            status_code=create_response.status_code,
+            detail=body.get("message") or body.get("detail") or "Failed to create transaction"
+        )
+    
+    transaction_data = body.get('data')
+    if not isinstance(transaction_data, dict) or 'id' not in transaction_data:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Django's transaction create response has no transaction"
+        )
+    return await complete_payment(transaction_data['id'], pay_request.auth_token, transaction_data)
+
+async def complete_payment(transaction_id: int, auth_token: Optional[str], transaction_data: dict = None) -> PaymentResponse:
+    """Run the bank simulation and record the outcome"""
     # Simulate payment processing
-    result = simulate_payment_processing(transaction_id, auth_token)
+    started = time.perf_counter()
+    result = await simulate_payment_processing(transaction_id, auth_token, transaction_data)
     
     if result["status"] in ["SUCCESS", "FAILED"]:
-        # Update transaction status in Django
+        queued = False
+        # An already processed transaction has its outcome recorded and counted
+        if not result.get("already_processed"):
+            queued = await record_outcome(transaction_id, result["status"], auth_token)
+            outcomes.record(result["status"], result.get("currency"), result.get("card_type"),
+                            Decimal(str(result.get("amount", 0))), (time.perf_counter() - started) * 1000)
+        
+        return PaymentResponse(
+            status="success",
+            message=result["reason"],
+            transaction_id=transaction_id,
+            payment_status=result["status"],
+            amount=result.get("amount"),
+            timestamp=datetime.now().isoformat(),
+            status_queued=queued,
+            risk_flags=result.get("risk_flags", [])
+        )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("reason", "Payment processing failed")
+        )
+
+async def fetch_transaction(transaction_id: int, auth_token: Optional[str]) -> Optional[dict]:
+    """Read a transaction through the circuit breaker; 503 while Django is unavailable"""
+    if django_breaker.allow_request():
         try:
-            headers = {}
-            if auth_token:
-                headers['Authorization'] = f'Bearer {auth_token}'
-            
-            update_response = requests.patch(
-                f"{DJANGO_API_URL}/transactions/{transaction_id}/update-status/",
-                json={"status": result["status"]},
-                headers=headers
-            )
-            
-            if update_response.status_code != 200:
+            transaction_data = await store.get(transaction_id, auth_token)
+        except StoreError:
+            django_breaker.record_failure()
+        except BaseException:
+            # A cancelled request or an unreadable response must not leave a half-open probe unreported
+            django_breaker.record_failure()
+            raise
+        else:
+            django_breaker.record_success()
+            return transaction_data
+    
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Transaction store unavailable",
+        headers={"Retry-After": str(int(django_breaker.reset_timeout))}
+    )
+
+async def record_outcome(transaction_id: int, payment_status: str, auth_token: Optional[str]) -> bool:
+    """
+    Write a decided outcome to Django, or to the local write-ahead log when
+    Django is unreachable or the circuit is open. Returns True if it was queued.
+    """
+    if django_breaker.allow_request():
+        try:
+            updated = await store.update_status(transaction_id, payment_status, auth_token)
+        except StoreError:
+            django_breaker.record_failure()
+        except BaseException:
+            django_breaker.record_failure()
+            raise
+        else:
+            django_breaker.record_success()
+            if not updated:
+                logger.error("Django refused outcome %s for transaction %s", payment_status, transaction_id)
+                await outcome_log.dead_letter([{"id": transaction_id, "status": payment_status, "reason": "refused"}])
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Failed to update transaction status"
                 )
-            
-            return PaymentResponse(
-                status="success",
-                message=result["reason"],
-                transaction_id=transaction_id,
-                payment_status=result["status"],
-                amount=result.get("amount"),
-                timestamp=datetime.now().isoformat()
-            )
-            
-        except requests.exceptions.RequestException as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Communication error with Django: {str(e)}"
-            )
-    else:
+            return False
+    
+    try:
+        await outcome_log.append({"id": transaction_id, "status": payment_status})
+    except OSError as e:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=result.get("reason", "Payment processing failed")
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Could not record payment outcome: {str(e)}"
         )
+    return True
 
 @app.get("/transaction-status/{transaction_id}")
 async def get_transaction_status(transaction_id: int):
     """Get transaction status from Django"""
     try:
-        response = requests.get(f"{DJANGO_API_URL}/transactions/{transaction_id}/")
+        response = requests.get(f"{DJANGO_API_URL}/transactions/{transaction_id}/", timeout=DJANGO_TIMEOUT)
         
         if response.status_code == 200:
             return response.json()
@@ -197,6 +538,14 @@ async def get_transaction_status(transaction_id: int):
             detail=f"Communication error: {str(e)}"
         )
 
+@app.get("/timeseries")
+def outcome_timeseries(minutes: int = 60):
+    """This process's payment decisions per minute, from memory; the admin panel has the gateway-wide series"""
+    return {
+        "buckets": outcomes.buckets(max(minutes, 1)),
+        "dropped": outcomes.dropped
+    }
+
 @app.get("/dummy-cards")
 def get_dummy_cards():
     """Get list of dummy test cards"""
@@ -232,5 +581,37 @@ def get_dummy_cards():
         "note": "Cards with last 4 digits 0000-4999 will succeed, 5000-9999 will fail"
     }
 
+@app.get("/profiles")
+def list_profiles(x_profile: Optional[str] = Header(None), limit: int = 50):
+    """Summaries of the stored request profiles, newest first"""
+    if not profiling.is_admin(x_profile):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profiling key required")
+    summaries = []
+    for profile_id in profiling.stored_ids()[:max(limit, 0)]:
+        path = profiling.stored_path(profile_id, ".json")
+        if path is None:
+            continue
+        with open(path) as f:
+            document = json.load(f)
+        document.pop("queries", None)
+        document.pop("http_calls", None)
+        summaries.append(document)
+    return {"profiles": summaries}
+
+@app.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, format: str = "folded", x_profile: Optional[str] = Header(None)):
+    """A stored profile: collapsed stacks (folded) or the full JSON document"""
+    if not profiling.is_admin(x_profile):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profiling key required")
+    if format not in ("folded", "json"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="format must be folded or json")
+    path = profiling.stored_path(profile_id, f".{format}")
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    media_type = "application/json" if format == "json" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=f"{profile_id}.{format}")
+
 if __name__ == "__main__":
+    # Servers import uvicorn themselves (uvicorn main:app); only a direct run needs it here
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
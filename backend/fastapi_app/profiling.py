@@ -0,0 +1,391 @@
+"""
+On-demand request profiling for the processor.
+
+A request is profiled when it carries `X-Profile: <PROFILE_KEY>` (an
+admin-only shared secret; the header trigger is off while PROFILE_KEY is
+unset) or when it is picked at random at PROFILE_SAMPLE_RATE. While it
+runs, a thread samples the event loop every PROFILE_INTERVAL_MS and keeps
+the samples that belong to this request: where it was running, or where it
+was waiting. SQL sent through aiomysql and HTTP calls made through
+http.client (requests, including in the thread pool) are timed too. The
+result is written to PROFILE_DIR as <id>.folded, collapsed stacks for
+flamegraph.pl or speedscope, and <id>.json with the queries and calls.
+The id comes back in X-Profile-Id, and GET /profiles serves both files.
+They are written by a background thread, shortly after the response.
+
+An untriggered request costs one header scan, plus one random() when
+sampling is on. The query and HTTP hooks are patched in only while some
+request is being profiled. Query parameters and URL query strings are
+never recorded.
+"""
+import asyncio
+import hmac
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+try:
+    import aiomysql
+except ImportError:  # optional dependency
+    aiomysql = None
+
+PROFILE_KEY = os.environ.get("PROFILE_KEY", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "200"))
+
+# Bounds on what one profile keeps
+MAX_QUERIES = 2000
+MAX_HTTP_CALLS = 500
+# Finished profiles waiting for the writer thread; more than this and new ones are dropped
+MAX_UNWRITTEN = 100
+
+logger = logging.getLogger(__name__)
+
+_active = ContextVar("profile", default=None)
+
+
+class Profile:
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.status = None
+        self.stacks = Counter()
+        self.queries = []
+        self.queries_dropped = 0
+        self.http_calls = []
+
+    def add_query(self, sql: str, elapsed: float):
+        if len(self.queries) < MAX_QUERIES:
+            self.queries.append({"sql": sql, "ms": round(elapsed * 1000, 3)})
+        else:
+            self.queries_dropped += 1
+
+    def add_http_call(self, method: str, url: str, status, elapsed: float):
+        if len(self.http_calls) < MAX_HTTP_CALLS:
+            self.http_calls.append({"method": method, "url": url, "status": status, "ms": round(elapsed * 1000, 3)})
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "samples": sum(self.stacks.values()),
+            "query_count": len(self.queries) + self.queries_dropped,
+            "query_ms": round(sum(query["ms"] for query in self.queries), 3),
+            "http_call_count": len(self.http_calls),
+            "http_ms": round(sum(call["ms"] for call in self.http_calls), 3),
+        }
+
+
+# Stack sampling
+
+_labels = {}
+
+
+def _short_path(filename: str) -> str:
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        # One entry per function rather than per line, so samples in the same function merge
+        label = _labels[code] = f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def _await_chain(coro) -> list:
+    """Frames of a suspended coroutine and everything it awaits, outermost first"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the stacks of one request's task every `interval` seconds until
+    stopped, from the `root` frame (the middleware) down. The loop also runs
+    other requests: samples taken while this task runs keep its frames only,
+    and the rest count as waiting at the point where it awaits.
+    """
+
+    def __init__(self, thread_id: int, interval: float, root, task: asyncio.Task):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.task = task
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frames = self.sample()
+            if frames:
+                self.stacks[";".join(frames)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def sample(self):
+        if self.task.done():
+            return None
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        stack.reverse()
+        chain = _await_chain(self.task.get_coro())
+        if chain and chain[0] in stack:
+            return self._fold(stack[stack.index(chain[0]):])
+        return self._fold(chain) + ["[await]"]
+
+    def _fold(self, frames: list) -> list:
+        if self.root in frames:
+            frames = frames[frames.index(self.root):]
+        return [_label(frame.f_code) for frame in frames]
+
+
+# Query and HTTP hooks, patched in only while profiles run
+
+def _aiomysql_patches():
+    cursor_execute = aiomysql.Cursor.execute
+
+    async def execute(self, query, args=None):
+        profile = _active.get()
+        if profile is None:
+            return await cursor_execute(self, query, args)
+        started = time.perf_counter()
+        try:
+            return await cursor_execute(self, query, args)
+        finally:
+            profile.add_query(query, time.perf_counter() - started)
+
+    return [(aiomysql.Cursor, "execute", execute)]
+
+
+def _http_client_patches():
+    # putrequest and the base getresponse are the two steps urllib and urllib3 (requests) both go through
+    connection_putrequest = http.client.HTTPConnection.putrequest
+    connection_getresponse = http.client.HTTPConnection.getresponse
+
+    def putrequest(self, method, url, *args, **kwargs):
+        if _active.get() is not None:
+            scheme = "https" if self.default_port == 443 else "http"
+            target = url if "://" in url else f"{scheme}://{self.host}:{self.port}{url}"
+            self._profile_call = (method, target.split("?")[0], time.perf_counter())
+        return connection_putrequest(self, method, url, *args, **kwargs)
+
+    def getresponse(self):
+        call = self.__dict__.pop("_profile_call", None)
+        profile = _active.get()
+        if call is None or profile is None:
+            return connection_getresponse(self)
+        method, url, started = call
+        status = None
+        try:
+            response = connection_getresponse(self)
+            status = response.status
+            return response
+        finally:
+            profile.add_http_call(method, url, status, time.perf_counter() - started)
+
+    return [(http.client.HTTPConnection, "putrequest", putrequest),
+            (http.client.HTTPConnection, "getresponse", getresponse)]
+
+
+_patch_lock = threading.Lock()
+_profiles_running = 0
+_originals = []
+
+
+def _patch_in():
+    """Called as a profile starts: the first one running puts the hooks in place"""
+    global _profiles_running
+    with _patch_lock:
+        if _profiles_running == 0:
+            patches = _http_client_patches() + (_aiomysql_patches() if aiomysql is not None else [])
+            for owner, name, wrapper in patches:
+                _originals.append((owner, name, getattr(owner, name)))
+                setattr(owner, name, wrapper)
+        _profiles_running += 1
+
+
+def _patch_out():
+    """Called as a profile finishes: the last one running puts the originals back"""
+    global _profiles_running
+    with _patch_lock:
+        _profiles_running -= 1
+        if _profiles_running == 0:
+            while _originals:
+                owner, name, original = _originals.pop()
+                setattr(owner, name, original)
+
+
+# Storage
+
+def _remove(profile_id: str):
+    for suffix in (".json", ".folded"):
+        try:
+            os.remove(os.path.join(PROFILE_DIR, profile_id + suffix))
+        except FileNotFoundError:
+            pass
+
+
+class ProfileWriter(threading.Thread):
+    """
+    Writes finished profiles to PROFILE_DIR and prunes all but the newest
+    PROFILE_KEEP, off the event loop. The directory is listed once, on the
+    first write; after that the writer keeps its own list of what is stored.
+    """
+
+    def __init__(self):
+        super().__init__(name="profile-writer", daemon=True)
+        self.queue = queue.Queue(MAX_UNWRITTEN)
+        self.kept = None
+
+    def submit(self, profile: Profile):
+        try:
+            self.queue.put_nowait(profile)
+        except queue.Full:
+            logger.warning("Profile writer is behind; dropped profile %s", profile.id)
+
+    def run(self):
+        while True:
+            profile = self.queue.get()
+            try:
+                self.write(profile)
+            except OSError:
+                logger.exception("Could not write profile %s", profile.id)
+            finally:
+                self.queue.task_done()
+
+    def write(self, profile: Profile):
+        if self.kept is None:
+            # Oldest first
+            self.kept = deque(reversed(stored_ids()))
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, profile.id)
+        with open(base + ".folded", "w") as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(base + ".json", "w") as f:
+            json.dump({**profile.summary(), "queries_dropped": profile.queries_dropped,
+                       "queries": profile.queries, "http_calls": profile.http_calls}, f)
+        self.kept.append(profile.id)
+        while len(self.kept) > PROFILE_KEEP:
+            _remove(self.kept.popleft())
+
+    def flush(self):
+        """Wait until every submitted profile is written"""
+        self.queue.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def writer() -> ProfileWriter:
+    """The process's profile writer, started on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ProfileWriter()
+            _writer.start()
+        return _writer
+
+
+def stored_ids() -> list:
+    """Ids of the stored profiles, newest first"""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-5] for name in names if name.endswith(".json")), reverse=True)
+
+
+def stored_path(profile_id: str, suffix: str):
+    """Path of a stored profile file, or None; ids are checked so they cannot leave PROFILE_DIR"""
+    if profile_id not in stored_ids():
+        return None
+    return os.path.join(PROFILE_DIR, profile_id + suffix)
+
+
+def is_admin(key) -> bool:
+    return bool(PROFILE_KEY) and key is not None and hmac.compare_digest(key, PROFILE_KEY)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests picked by X-Profile or PROFILE_SAMPLE_RATE"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/profiles"):
+            return await self.app(scope, receive, send)
+        trigger = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                trigger = "header" if is_admin(value.decode("latin-1")) else None
+                break
+        else:
+            if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+                trigger = "sample"
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope["method"], scope["path"], trigger)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000, sys._getframe(),
+                               asyncio.current_task())
+        _patch_in()
+        token = _active.set(profile)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            sampler.stop()
+            profile.stacks = sampler.stacks
+            _active.reset(token)
+            _patch_out()
+            writer().submit(profile)
@@ -0,0 +1,133 @@
+"""
+Rate limiting and admission control for the payment processor.
+
+Token buckets are kept in Redis when REDIS_URL is set (shared across
+workers, updated atomically by a Lua script) and in process memory
+otherwise, or whenever Redis cannot be reached.
+"""
+import math
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+# capacity N, refilled at N per period
+RATE_LIMITS = {
+    "user": os.environ.get("RATE_LIMIT_PROCESS_USER", "30/min"),
+    "ip": os.environ.get("RATE_LIMIT_PROCESS_IP", "60/min"),
+    "global": os.environ.get("RATE_LIMIT_PROCESS_GLOBAL", "1000/min"),
+}
+
+MAX_IN_FLIGHT = int(os.environ.get("PROCESSOR_MAX_IN_FLIGHT", "32"))
+
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+def parse_rate(rate: str):
+    """Parse 'N/period' into (capacity, tokens refilled per second)"""
+    num, period = rate.split("/")
+    capacity = int(num)
+    seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+    return capacity, capacity / seconds
+
+
+class TokenBucketLimiter:
+    LOCAL_BUCKET_LIMIT = 10000
+
+    def __init__(self, redis_url: str = None):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._script = None
+        if redis_url and redis is not None:
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.05)
+            self._script = self._redis.register_script(_TOKEN_BUCKET_LUA)
+
+    def consume(self, key: str, rate: str):
+        """Take one token; returns (allowed, seconds until the next token)"""
+        capacity, refill = parse_rate(rate)
+        now = time.time()
+        if self._script is not None:
+            try:
+                allowed, tokens = self._script(keys=[key], args=[capacity, refill, now])
+                tokens = float(tokens)
+                return bool(allowed), 0 if allowed else (1 - tokens) / refill
+            except redis.RedisError:
+                pass
+        with self._lock:
+            if len(self._buckets) > self.LOCAL_BUCKET_LIMIT:
+                self._buckets.clear()
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * refill)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return True, 0
+            self._buckets[key] = (tokens, now)
+            return False, (1 - tokens) / refill
+
+    def check(self, idents: dict):
+        """
+        Check every configured bucket for the given identities
+        ({'user': ..., 'ip': ..., 'global': ...}).
+        Returns seconds to wait, or 0 when the request is allowed.
+        """
+        for kind, ident in idents.items():
+            rate = RATE_LIMITS.get(kind)
+            if not rate or ident is None:
+                continue
+            allowed, wait = self.consume(f"rl:process:{kind}:{ident}", rate)
+            if not allowed:
+                return max(1, math.ceil(wait))
+        return 0
+
+
+class AdmissionController:
+    """
+    Caps the number of payments being processed at once.
+    Requests over the cap are rejected immediately instead of queueing
+    behind slow work and timing out.
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+limiter = TokenBucketLimiter(REDIS_URL)
+admission = AdmissionController(MAX_IN_FLIGHT)
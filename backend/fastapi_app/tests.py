@@ -0,0 +1,218 @@
+"""
+Tests for the payment processor; run from this directory with python -m unittest tests
+"""
+import base64
+import hashlib
+import hmac
+import http.client
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import asynccontextmanager
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import datastore
+import fraud
+import profiling
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def access_token(user_id, jti, expires_in=300):
+    """An HS256 access token shaped like the ones Django's simplejwt issues"""
+    header = _b64(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    payload = _b64(json.dumps({"token_type": "access", "exp": int(time.time()) + expires_in,
+                               "jti": jti, "user_id": user_id}).encode())
+    signature = hmac.new(datastore.JWT_SIGNING_KEY.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+    return f"{header}.{payload}.{_b64(signature)}"
+
+
+class FakeDatabase:
+    """Answers DatabaseTransactionStore's reads from a transactions row, user flags and revoked jtis"""
+
+    def __init__(self, transaction, active_users, revoked):
+        self.transaction = transaction
+        self.active_users = active_users
+        self.revoked = revoked
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    @asynccontextmanager
+    async def cursor(self, *args):
+        yield FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.result = None
+
+    async def execute(self, sql, params):
+        if "revoked_tokens" in sql:
+            jti, user_id = params
+            self.result = (user_id in self.database.active_users, jti in self.database.revoked)
+        else:
+            transaction = self.database.transaction
+            self.result = transaction if transaction["id"] == params[0] else None
+
+    async def fetchone(self):
+        return self.result
+
+
+class DatabaseStoreAccessTests(unittest.IsolatedAsyncioTestCase):
+    """The database path refuses tokens Django would refuse, not just badly signed ones"""
+
+    def setUp(self):
+        patch = mock.patch.object(datastore, "aiomysql", SimpleNamespace(DictCursor=object, Error=OSError))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.database = FakeDatabase(
+            {"id": 7, "user_id": 3, "card_id": 5, "amount": Decimal("12.50"), "currency": "USD",
+             "status": "PENDING", "card_type": "VISA", "last_four_digits": "0366", "expires_on": date(2030, 12, 31)},
+            active_users={3}, revoked={"revoked-jti"},
+        )
+        self.store = datastore.DatabaseTransactionStore()
+        self.store.pools = [self.database]
+
+    async def test_valid_token_reads_its_transaction(self):
+        transaction = await self.store.get(7, access_token(3, "live-jti"))
+        self.assertEqual((transaction["id"], transaction["amount"], transaction["status"]), (7, "12.50", "PENDING"))
+
+    async def test_revoked_token_is_refused(self):
+        self.assertIsNone(await self.store.get(7, access_token(3, "revoked-jti")))
+
+    async def test_deactivated_user_is_refused(self):
+        self.database.active_users.clear()
+        self.assertIsNone(await self.store.get(7, access_token(3, "live-jti")))
+
+    async def test_other_users_and_bad_tokens_are_refused(self):
+        self.assertIsNone(await self.store.get(7, access_token(4, "live-jti")))
+        self.assertIsNone(await self.store.get(7, access_token(3, "live-jti", expires_in=-10)))
+        self.assertIsNone(await self.store.get(7, access_token(3, "live-jti")[:-2] + "xx"))
+
+
+class WindowTableTests(unittest.TestCase):
+    def test_sums_keep_cents_at_large_totals(self):
+        table = fraud.WindowTable(4)
+        for _ in range(10):
+            table.add("user", 99999.99, 1000.0)
+        self.assertAlmostEqual(table.totals("user", 1000.0)["24h"][1], 999999.90, places=2)
+
+    def test_activity_slides_out_of_each_window(self):
+        table = fraud.WindowTable(4)
+        table.add("user", 10.0, 1000.0)
+        table.add("user", 5.0, 1030.0)
+        self.assertEqual(table.totals("user", 1030.0), {"1m": (2, 15.0), "1h": (2, 15.0), "24h": (2, 15.0)})
+        self.assertEqual(table.totals("user", 1075.0)["1m"], (1, 5.0))
+        self.assertEqual(table.totals("user", 1000.0 + 7200)["1h"], (0, 0.0))
+        self.assertEqual(table.totals("user", 1000.0 + 7200)["24h"], (2, 15.0))
+
+    def test_full_table_recycles_the_least_recently_touched_key(self):
+        table = fraud.WindowTable(2)
+        table.add("a", 1.0, 1000.0)
+        table.add("b", 2.0, 1000.0)
+        table.add("c", 3.0, 1000.0)
+        table.add("d", 4.0, 1000.0)
+        self.assertEqual(len(table.slots), 2)
+        self.assertEqual(table.totals("a", 1000.0)["1m"], (0, 0.0))
+        self.assertEqual(table.totals("d", 1000.0)["1m"], (1, 4.0))
+
+
+class FraudScorerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.scorer = fraud.FraudScorer(100)
+
+    def test_user_velocity_declines_then_recovers(self):
+        for n in range(fraud.RULES["user_count_1m"]):
+            self.assertEqual(self.scorer.score(1, 10 + n, 20.0, 1000.0).decision, fraud.ALLOW)
+            self.scorer.record(1, 10 + n, 20.0, 1000.0)
+        self.assertEqual(self.scorer.score(1, 99, 20.0, 1001.0), fraud.Score(fraud.DECLINE, ["user_velocity_1m"]))
+        self.assertEqual(self.scorer.score(1, 99, 20.0, 1070.0).decision, fraud.ALLOW)
+
+    def test_daily_amount_declines_and_outliers_flag(self):
+        self.scorer.record(1, 10, fraud.RULES["user_sum_24h"] - 100, 1000.0)
+        self.assertEqual(self.scorer.score(1, 10, 200.0, 1100.0).reasons, ["user_amount_24h"])
+        self.scorer.record(2, 20, 50.0, 1000.0)
+        self.assertEqual(self.scorer.score(2, 20, fraud.RULES["amount_floor"], 1100.0),
+                         fraud.Score(fraud.FLAG, ["amount_anomaly"]))
+
+    def test_a_transaction_counts_once(self):
+        self.assertTrue(self.scorer.record(1, 10, 20.0, 1000.0, transaction_id=7))
+        self.assertFalse(self.scorer.record(1, 10, 20.0, 1000.0, transaction_id=7))
+        self.assertEqual(self.scorer.users.totals(1, 1000.0)["1m"], (1, 20.0))
+
+    def test_remembered_ids_are_bounded(self):
+        scorer = fraud.FraudScorer(100, max_recorded=2)
+        for transaction_id in (1, 2, 3):
+            scorer.record(1, 10, 1.0, 1000.0, transaction_id=transaction_id)
+        self.assertEqual(list(scorer.recorded), [2, 3])
+
+    async def test_warm_skips_payments_already_recorded(self):
+        self.scorer.record(1, 10, 20.0, 1000.0, transaction_id=7)
+
+        async def rows():
+            for row in ((7, 1, 10, Decimal("20.00"), 1000.0), (8, 1, 10, Decimal("5.50"), 1010.0)):
+                yield row
+
+        self.assertEqual(await self.scorer.warm(rows()), 1)
+        self.assertEqual(self.scorer.users.totals(1, 1010.0)["1m"], (2, 25.5))
+
+
+class ProfilingTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, value in (("PROFILE_DIR", directory), ("PROFILE_SAMPLE_RATE", 1.0), ("PROFILE_INTERVAL_MS", 1)):
+            patch = mock.patch.object(profiling, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.putrequest = http.client.HTTPConnection.putrequest
+
+    async def test_hooks_are_in_place_only_while_a_request_is_profiled(self):
+        seen = []
+
+        async def app(scope, receive, send):
+            seen.append(http.client.HTTPConnection.putrequest)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        middleware = profiling.ProfilingMiddleware(app)
+        self.assertIs(http.client.HTTPConnection.putrequest, self.putrequest)
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await middleware({"type": "http", "method": "GET", "path": "/pay", "headers": []}, None, send)
+        self.assertIsNot(seen[0], self.putrequest)
+        self.assertIs(http.client.HTTPConnection.putrequest, self.putrequest)
+
+        profile_id = dict(messages[0]["headers"])[b"x-profile-id"].decode()
+        profiling.writer().flush()
+        self.assertEqual(profiling.stored_ids(), [profile_id])
+
+    def test_writer_prunes_without_listing_the_directory_again(self):
+        writer = profiling.ProfileWriter()
+        writer.start()
+        with mock.patch.object(profiling, "PROFILE_KEEP", 2), \
+                mock.patch.object(profiling, "stored_ids", wraps=profiling.stored_ids) as listing:
+            for n in range(4):
+                profile = profiling.Profile("GET", "/pay", "sample")
+                profile.id = f"20260101T00000{n}-abcd1234"
+                writer.submit(profile)
+            writer.flush()
+        self.assertEqual(listing.call_count, 1)
+        self.assertEqual(profiling.stored_ids(), ["20260101T000003-abcd1234", "20260101T000002-abcd1234"])
+
+
+if __name__ == "__main__":
+    unittest.main()
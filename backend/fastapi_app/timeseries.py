@@ -0,0 +1,102 @@
+"""
+Per-minute counters of the processor's payment decisions.
+
+Every SUCCESS/FAILED decision is counted by currency and card type, with
+the time the processor took, in a ring of RING_MINUTES per-minute slots
+that GET /timeseries reads directly. Counts recorded since the last flush
+are sent to the rollup table behind the admin panel's time series
+(Django's admin_panel/timeseries.py) every TIMESERIES_FLUSH_SECONDS; a
+failed flush keeps them for the next one until they are an hour old.
+
+Everything runs on the event loop, so there is no locking.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Optional
+
+RING_MINUTES = 60
+TIMESERIES_FLUSH_SECONDS = float(os.environ.get("TIMESERIES_FLUSH_SECONDS", "10"))
+
+
+def _empty() -> list:
+    # count, amount, timed count, latency sum (ms), latency max (ms)
+    return [0, Decimal("0"), 0, 0.0, 0.0]
+
+
+def _add(counters: list, amount: Decimal, latency_ms: float):
+    counters[0] += 1
+    counters[1] += amount
+    counters[2] += 1
+    counters[3] += latency_ms
+    counters[4] = max(counters[4], latency_ms)
+
+
+class OutcomeSeries:
+    def __init__(self, minutes: int = RING_MINUTES):
+        self.minutes = minutes
+        # minute % minutes -> (minute, {(status, currency, card_type): counters})
+        self.slots = [None] * minutes
+        # Not yet flushed: (minute, key) -> counters
+        self.pending = {}
+        self.dropped = 0
+
+    def record(self, payment_status: str, currency: Optional[str], card_type: Optional[str],
+               amount: Decimal, latency_ms: float):
+        minute = int(time.time() // 60)
+        key = (payment_status, currency or "", card_type or "")
+        slot = self.slots[minute % self.minutes]
+        if slot is None or slot[0] != minute:
+            slot = self.slots[minute % self.minutes] = (minute, {})
+        _add(slot[1].setdefault(key, _empty()), amount, latency_ms)
+        _add(self.pending.setdefault((minute, key), _empty()), amount, latency_ms)
+
+    def take(self) -> list:
+        """The unflushed counts as rows for the store's record_outcome_minutes(), emptying them"""
+        pending, self.pending = self.pending, {}
+        return [
+            {
+                "minute": minute, "status": key[0], "currency": key[1], "card_type": key[2],
+                "count": counters[0], "amount": str(counters[1]), "timed_count": counters[2],
+                "latency_ms_sum": round(counters[3], 3), "latency_ms_max": round(counters[4], 3),
+            }
+            for (minute, key), counters in pending.items()
+        ]
+
+    def restore(self, rows: list):
+        """Keep rows a flush could not write, unless they have aged out of the ring"""
+        oldest = int(time.time() // 60) - self.minutes
+        for row in rows:
+            if row["minute"] <= oldest:
+                self.dropped += row["count"]
+                continue
+            counters = self.pending.setdefault((row["minute"], (row["status"], row["currency"], row["card_type"])), _empty())
+            counters[0] += row["count"]
+            counters[1] += Decimal(row["amount"])
+            counters[2] += row["timed_count"]
+            counters[3] += row["latency_ms_sum"]
+            counters[4] = max(counters[4], row["latency_ms_max"])
+
+    def buckets(self, minutes: int) -> list:
+        """Per-minute decisions, approval rate and latency for the last `minutes`, oldest first"""
+        now = int(time.time() // 60)
+        buckets = []
+        for minute in range(now - min(minutes, self.minutes) + 1, now + 1):
+            slot = self.slots[minute % self.minutes]
+            keys = slot[1] if slot is not None and slot[0] == minute else {}
+            success = sum(counters[0] for key, counters in keys.items() if key[0] == "SUCCESS")
+            failed = sum(counters[0] for key, counters in keys.items() if key[0] == "FAILED")
+            timed = sum(counters[2] for counters in keys.values())
+            buckets.append({
+                "start": datetime.fromtimestamp(minute * 60, timezone.utc).isoformat(),
+                "success": success,
+                "failed": failed,
+                "approval_rate": round(success / (success + failed), 4) if success + failed else None,
+                "latency_ms_avg": round(sum(counters[3] for counters in keys.values()) / timed, 1) if timed else None,
+                "latency_ms_max": round(max(counters[4] for counters in keys.values()), 1) if timed else None,
+            })
+        return buckets
+
+
+outcomes = OutcomeSeries()
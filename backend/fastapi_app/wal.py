@@ -0,0 +1,167 @@
+"""
+Local write-ahead log for payment outcomes that could not be delivered to Django.
+
+Records are appended as JSON lines to an active segment. Appends are
+group-committed: a background flusher writes whatever has queued up and
+fsyncs once per batch, and each append() returns only after its record is
+on disk. For replay the active segment is sealed (renamed) and a fresh one
+opened, so new outcomes keep landing while sealed segments are sent to
+Django in bulk and deleted once acknowledged. Outcomes the store refuses
+(the transaction already has another final status, or does not exist)
+are moved to a dead-letter file for reconciliation instead of being dropped.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from fastapi.concurrency import run_in_threadpool
+
+ACTIVE_NAME = "outcomes.log"
+SEALED_GLOB = "outcomes.*.sealed"
+DEAD_LETTER_NAME = "outcomes.dead"
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, flush_interval: float = 0.005, max_batch: int = 512):
+        self.directory = Path(directory)
+        self.active_path = self.directory / ACTIVE_NAME
+        self.dead_letter_path = self.directory / DEAD_LETTER_NAME
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._file = None
+        self._pending = []
+        self._wakeup = None
+        self._io_lock = None
+        self._flusher = None
+
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.active_path, "ab")
+        if self._file.tell() > 0:
+            # Terminate a line torn by a crash so the next record starts cleanly
+            with open(self.active_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._write(b"\n")
+        self._wakeup = asyncio.Event()
+        self._io_lock = asyncio.Lock()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        await self._flush()
+        self._file.close()
+
+    async def append(self, record: dict):
+        """Queue a record and wait until it has been fsynced"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((json.dumps(record) + "\n").encode(), future))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        await future
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush()
+
+    async def _flush(self):
+        async with self._io_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                await run_in_threadpool(self._write, b"".join(line for line, _ in batch))
+            except OSError as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            for _, future in batch:
+                future.set_result(None)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def dead_letter(self, records: list):
+        """Append refused records (with the reason) to the dead-letter file; they are never replayed"""
+        await run_in_threadpool(self._append_dead, b"".join((json.dumps(record) + "\n").encode() for record in records))
+
+    def _append_dead(self, data: bytes):
+        with open(self.dead_letter_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def queued(self) -> int:
+        """Records on disk awaiting replay, counted from the segments so it survives restarts"""
+        return self._count_lines([self.active_path, *self.directory.glob(SEALED_GLOB)])
+
+    def dead_lettered(self) -> int:
+        return self._count_lines([self.dead_letter_path])
+
+    @staticmethod
+    def _count_lines(paths) -> int:
+        count = 0
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        count += chunk.count(b"\n")
+            except FileNotFoundError:
+                # Not written yet, or sealed or deleted by a replay since the listing
+                continue
+        return count
+
+    def has_pending(self) -> bool:
+        return self._file.tell() > 0 or any(self.directory.glob(SEALED_GLOB))
+
+    async def seal(self):
+        """Close off the active segment and return all sealed segments, oldest first"""
+        async with self._io_lock:
+            if self._file.tell() > 0:
+                self._file.close()
+                os.replace(self.active_path, self.directory / f"outcomes.{time.time_ns()}.sealed")
+                self._file = open(self.active_path, "ab")
+        return sorted(self.directory.glob(SEALED_GLOB))
+
+    @staticmethod
+    def read_segment(path: Path) -> list:
+        records = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-write; it was never acknowledged
+                    continue
+        return records
+
+    async def replay(self, send_batch, batch_size: int = 500) -> int:
+        """
+        Send every sealed segment through send_batch(records) -> bool.
+        Stops at the first failure, leaving that segment for the next attempt;
+        status updates are idempotent, so resending its delivered part is harmless.
+        Returns the number of records delivered.
+        """
+        delivered = 0
+        for path in await self.seal():
+            records = await run_in_threadpool(self.read_segment, path)
+            for start in range(0, len(records), batch_size):
+                if not await send_batch(records[start:start + batch_size]):
+                    return delivered
+                delivered += len(records[start:start + batch_size])
+            path.unlink()
+        return delivered
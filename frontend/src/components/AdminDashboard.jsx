@@ -1,13 +1,25 @@
 import { useState, useEffect } from 'react';
 import { adminAPI } from '../utils/api';
 
+const USERS_PAGE_SIZE = 50;
+const NO_USER_FILTERS = { q: '', is_active: '', is_staff: '', joined_from: '', joined_to: '' };
+
+// Only the filters that are set; the server ignores the rest anyway
+const activeFilters = (filters) => Object.fromEntries(Object.entries(filters).filter(([, value]) => value !== ''));
+
 export default function AdminDashboard({ onBack }) {
   const [activeTab, setActiveTab] = useState('dashboard');
   const [dashboardStats, setDashboardStats] = useState(null);
   const [users, setUsers] = useState([]);
+  const [userPage, setUserPage] = useState(1);
+  const [userTotal, setUserTotal] = useState(0);
+  const [userFilterDraft, setUserFilterDraft] = useState(NO_USER_FILTERS);
+  const [userFilters, setUserFilters] = useState(NO_USER_FILTERS);
+  const [selectedUserIds, setSelectedUserIds] = useState([]);
   const [cards, setCards] = useState([]);
   const [transactions, setTransactions] = useState([]);
   const [dailySummary, setDailySummary] = useState(null);
+  const [timeseries, setTimeseries] = useState(null);
   const [selectedDate, setSelectedDate] = useState(new Date().toISOString().split('T')[0]);
   const [loading, setLoading] = useState(true);
 
@@ -15,9 +27,20 @@ export default function AdminDashboard({ onBack }) {
     loadDashboardData();
   }, []);
 
+  // Per-minute outcomes come from the rollups, so polling them costs no transaction scans
+  useEffect(() => {
+    if (activeTab !== 'dashboard') return;
+    loadTimeseries();
+    const timer = setInterval(loadTimeseries, 30000);
+    return () => clearInterval(timer);
+  }, [activeTab]);
+
   useEffect(() => {
     if (activeTab === 'users') loadUsers();
-    else if (activeTab === 'cards') loadCards();
+  }, [activeTab, userPage, userFilters]);
+
+  useEffect(() => {
+    if (activeTab === 'cards') loadCards();
     else if (activeTab === 'transactions') loadTransactions();
     else if (activeTab === 'daily') loadDailySummary();
   }, [activeTab, selectedDate]);
@@ -34,10 +57,21 @@ export default function AdminDashboard({ onBack }) {
     }
   };
 
+  const loadTimeseries = async () => {
+    try {
+      const response = await adminAPI.getTimeseries(60);
+      setTimeseries(response.data);
+    } catch (error) {
+      console.error('Error loading time series:', error);
+    }
+  };
+
   const loadUsers = async () => {
     try {
-      const response = await adminAPI.getUsers();
+      const response = await adminAPI.getUsers({ ...activeFilters(userFilters), page: userPage, page_size: USERS_PAGE_SIZE });
       setUsers(response.data || []);
+      setUserTotal(response.pagination?.total || 0);
+      setSelectedUserIds([]);
     } catch (error) {
       console.error('Error loading users:', error);
     }
@@ -80,6 +114,46 @@ export default function AdminDashboard({ onBack }) {
     }
   };
 
+  const handleApplyUserFilters = (e) => {
+    e.preventDefault();
+    setUserPage(1);
+    setUserFilters(userFilterDraft);
+  };
+
+  const handleClearUserFilters = () => {
+    setUserPage(1);
+    setUserFilterDraft(NO_USER_FILTERS);
+    setUserFilters(NO_USER_FILTERS);
+  };
+
+  const toggleUserSelected = (userId) => {
+    setSelectedUserIds(ids => ids.includes(userId) ? ids.filter(id => id !== userId) : [...ids, userId]);
+  };
+
+  // Staff accounts are never changed by the bulk action, so they cannot be selected
+  const selectableUsers = users.filter(user => !user.is_staff);
+  const allUsersSelected = selectableUsers.length > 0 && selectableUsers.every(user => selectedUserIds.includes(user.id));
+
+  const handleSelectAllUsers = () => {
+    setSelectedUserIds(allUsersSelected ? [] : selectableUsers.map(user => user.id));
+  };
+
+  // selection is {user_ids: [...]} or {filter: {...}}; the server skips staff and the caller
+  const handleBulkUserStatus = async (isActive, selection, count) => {
+    const action = isActive ? 'activate' : 'deactivate';
+    if (!window.confirm(`Are you sure you want to ${action} ${count} user${count === 1 ? '' : 's'}?`)) return;
+    try {
+      const response = await adminAPI.bulkUserStatus(isActive, selection);
+      window.alert(response.message);
+      loadUsers();
+    } catch (error) {
+      console.error('Error changing user status:', error);
+    }
+  };
+
+  const userPages = Math.max(1, Math.ceil(userTotal / USERS_PAGE_SIZE));
+  const userFiltersSet = Object.keys(activeFilters(userFilters)).length > 0;
+
   const handleExportTransactions = () => {
     adminAPI.exportTransactions();
   };
@@ -257,57 +331,233 @@ export default function AdminDashboard({ onBack }) {
                   </div>
                 </div>
               </div>
+
+              {/* Last Hour */}
+              {timeseries && (() => {
+                const buckets = timeseries.buckets;
+                const peak = Math.max(1, ...buckets.map(b => b.success + b.failed));
+                const success = buckets.reduce((sum, b) => sum + b.success, 0);
+                const failed = buckets.reduce((sum, b) => sum + b.failed, 0);
+                const timed = buckets.filter(b => b.latency_ms_avg !== null);
+                return (
+                  <div className="bg-white p-6 rounded-xl shadow-sm border border-slate-200">
+                    <div className="flex justify-between items-center mb-4">
+                      <h3 className="font-bold text-slate-800">Last Hour</h3>
+                      <div className="flex space-x-6 text-sm text-slate-600">
+                        <span>Approval <span className="font-bold text-slate-900">{success + failed ? `${(100 * success / (success + failed)).toFixed(1)}%` : '-'}</span></span>
+                        <span>Volume <span className="font-bold text-green-600">{buckets.reduce((sum, b) => sum + b.volume, 0).toFixed(2)} {timeseries.currency}</span></span>
+                        <span>Latency <span className="font-bold text-slate-900">{timed.length ? `${Math.round(timed.reduce((sum, b) => sum + b.latency_ms_avg, 0) / timed.length)} ms` : '-'}</span></span>
+                      </div>
+                    </div>
+                    <div className="flex items-end h-32 space-x-px">
+                      {buckets.map(b => (
+                        <div
+                          key={b.start}
+                          className="flex-1 h-full flex flex-col justify-end"
+                          title={`${new Date(b.start).toLocaleTimeString()}: ${b.success} approved, ${b.failed} failed, ${b.created} created`}
+                        >
+                          <div className="bg-red-400" style={{ height: `${100 * b.failed / peak}%` }}></div>
+                          <div className="bg-green-500" style={{ height: `${100 * b.success / peak}%` }}></div>
+                        </div>
+                      ))}
+                    </div>
+                    <p className="text-xs text-slate-400 mt-2">Payments decided per minute: approved (green) and failed (red)</p>
+                  </div>
+                );
+              })()}
             </div>
           )}
 
           {/* USERS TAB */}
           {activeTab === 'users' && (
-            <div className="bg-white rounded-xl shadow-sm border border-slate-200 overflow-hidden animate-fade-in">
-              <div className="overflow-x-auto">
-                <table className="w-full text-left border-collapse">
-                  <thead>
-                    <tr className="bg-slate-50 border-b border-slate-200 text-xs uppercase text-slate-500 font-semibold tracking-wider">
-                      <th className="px-6 py-4">ID</th>
-                      <th className="px-6 py-4">User Details</th>
-                      <th className="px-6 py-4">Role</th>
-                      <th className="px-6 py-4">Status</th>
-                      <th className="px-6 py-4 text-right">Actions</th>
-                    </tr>
-                  </thead>
-                  <tbody className="divide-y divide-slate-100">
-                    {users.map(user => (
-                      <tr key={user.id} className="hover:bg-slate-50 transition-colors">
-                        <td className="px-6 py-4 text-sm text-slate-500 font-mono">#{user.id}</td>
-                        <td className="px-6 py-4">
-                          <div className="flex flex-col">
-                            <span className="font-medium text-slate-900">{user.first_name} {user.last_name}</span>
-                            <span className="text-xs text-slate-500">{user.email}</span>
-                          </div>
-                        </td>
-                        <td className="px-6 py-4">
-                          <span className={`inline-flex items-center px-2 py-1 rounded text-xs font-medium ${user.is_staff ? 'bg-purple-100 text-purple-700' : 'bg-slate-100 text-slate-600'}`}>
-                            {user.is_staff ? 'Administrator' : 'Customer'}
-                          </span>
-                        </td>
-                        <td className="px-6 py-4">
-                          <span className={`inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium ${user.is_active ? 'bg-green-100 text-green-800' : 'bg-red-100 text-red-800'}`}>
-                            {user.is_active ? 'Active' : 'Suspended'}
-                          </span>
-                        </td>
-                        <td className="px-6 py-4 text-right">
-                          {!user.is_staff && (
-                            <button
-                              onClick={() => handleToggleUserStatus(user.id)}
-                              className={`text-xs font-medium hover:underline ${user.is_active ? 'text-red-600 hover:text-red-800' : 'text-green-600 hover:text-green-800'}`}
-                            >
-                              {user.is_active ? 'Deactivate User' : 'Activate User'}
-                            </button>
-                          )}
-                        </td>
+            <div className="space-y-4 animate-fade-in">
+              <form onSubmit={handleApplyUserFilters} className="bg-white p-4 rounded-xl shadow-sm border border-slate-200 flex flex-wrap gap-4 items-end">
+                <div>
+                  <label className="block text-xs font-medium text-slate-500 mb-1">Username or email</label>
+                  <input
+                    type="text"
+                    value={userFilterDraft.q}
+                    onChange={(e) => setUserFilterDraft({ ...userFilterDraft, q: e.target.value })}
+                    placeholder="Starts with..."
+                    className="block px-3 py-2 rounded-lg border border-slate-300 text-sm focus:border-indigo-500 focus:ring-indigo-500"
+                  />
+                </div>
+                <div>
+                  <label className="block text-xs font-medium text-slate-500 mb-1">Status</label>
+                  <select
+                    value={userFilterDraft.is_active}
+                    onChange={(e) => setUserFilterDraft({ ...userFilterDraft, is_active: e.target.value })}
+                    className="block px-3 py-2 rounded-lg border border-slate-300 text-sm"
+                  >
+                    <option value="">All</option>
+                    <option value="true">Active</option>
+                    <option value="false">Suspended</option>
+                  </select>
+                </div>
+                <div>
+                  <label className="block text-xs font-medium text-slate-500 mb-1">Role</label>
+                  <select
+                    value={userFilterDraft.is_staff}
+                    onChange={(e) => setUserFilterDraft({ ...userFilterDraft, is_staff: e.target.value })}
+                    className="block px-3 py-2 rounded-lg border border-slate-300 text-sm"
+                  >
+                    <option value="">All</option>
+                    <option value="false">Customer</option>
+                    <option value="true">Administrator</option>
+                  </select>
+                </div>
+                <div>
+                  <label className="block text-xs font-medium text-slate-500 mb-1">Joined from</label>
+                  <input
+                    type="date"
+                    value={userFilterDraft.joined_from}
+                    onChange={(e) => setUserFilterDraft({ ...userFilterDraft, joined_from: e.target.value })}
+                    className="block px-3 py-2 rounded-lg border border-slate-300 text-sm"
+                  />
+                </div>
+                <div>
+                  <label className="block text-xs font-medium text-slate-500 mb-1">Joined to</label>
+                  <input
+                    type="date"
+                    value={userFilterDraft.joined_to}
+                    onChange={(e) => setUserFilterDraft({ ...userFilterDraft, joined_to: e.target.value })}
+                    className="block px-3 py-2 rounded-lg border border-slate-300 text-sm"
+                  />
+                </div>
+                <div className="flex space-x-2">
+                  <button type="submit" className="bg-indigo-600 hover:bg-indigo-700 text-white px-4 py-2 rounded-lg text-sm font-medium transition-colors">
+                    Apply
+                  </button>
+                  <button type="button" onClick={handleClearUserFilters} className="px-4 py-2 rounded-lg text-sm font-medium text-slate-600 hover:bg-slate-100 transition-colors">
+                    Clear
+                  </button>
+                </div>
+              </form>
+
+              {(selectedUserIds.length > 0 || userFiltersSet) && (
+                <div className="bg-indigo-50 border border-indigo-100 rounded-xl px-4 py-3 flex flex-wrap gap-4 items-center justify-between text-sm">
+                  {selectedUserIds.length > 0 ? (
+                    <div className="flex items-center space-x-3">
+                      <span className="font-medium text-indigo-900">{selectedUserIds.length} selected</span>
+                      <button
+                        onClick={() => handleBulkUserStatus(true, { user_ids: selectedUserIds }, selectedUserIds.length)}
+                        className="text-green-700 font-medium hover:underline"
+                      >
+                        Activate
+                      </button>
+                      <button
+                        onClick={() => handleBulkUserStatus(false, { user_ids: selectedUserIds }, selectedUserIds.length)}
+                        className="text-red-700 font-medium hover:underline"
+                      >
+                        Deactivate
+                      </button>
+                    </div>
+                  ) : <span />}
+                  {userFiltersSet && (
+                    <div className="flex items-center space-x-3">
+                      <span className="text-indigo-900">All {userTotal} matching:</span>
+                      <button
+                        onClick={() => handleBulkUserStatus(true, { filter: activeFilters(userFilters) }, userTotal)}
+                        className="text-green-700 font-medium hover:underline"
+                      >
+                        Activate
+                      </button>
+                      <button
+                        onClick={() => handleBulkUserStatus(false, { filter: activeFilters(userFilters) }, userTotal)}
+                        className="text-red-700 font-medium hover:underline"
+                      >
+                        Deactivate
+                      </button>
+                    </div>
+                  )}
+                </div>
+              )}
+
+              <div className="bg-white rounded-xl shadow-sm border border-slate-200 overflow-hidden">
+                <div className="overflow-x-auto">
+                  <table className="w-full text-left border-collapse">
+                    <thead>
+                      <tr className="bg-slate-50 border-b border-slate-200 text-xs uppercase text-slate-500 font-semibold tracking-wider">
+                        <th className="pl-6 py-4">
+                          <input
+                            type="checkbox"
+                            checked={allUsersSelected}
+                            onChange={handleSelectAllUsers}
+                            disabled={selectableUsers.length === 0}
+                            aria-label="Select all users on this page"
+                          />
+                        </th>
+                        <th className="px-6 py-4">ID</th>
+                        <th className="px-6 py-4">User Details</th>
+                        <th className="px-6 py-4">Role</th>
+                        <th className="px-6 py-4">Status</th>
+                        <th className="px-6 py-4 text-right">Actions</th>
                       </tr>
-                    ))}
-                  </tbody>
-                </table>
+                    </thead>
+                    <tbody className="divide-y divide-slate-100">
+                      {users.map(user => (
+                        <tr key={user.id} className="hover:bg-slate-50 transition-colors">
+                          <td className="pl-6 py-4">
+                            <input
+                              type="checkbox"
+                              checked={selectedUserIds.includes(user.id)}
+                              onChange={() => toggleUserSelected(user.id)}
+                              disabled={user.is_staff}
+                              aria-label={`Select user ${user.id}`}
+                            />
+                          </td>
+                          <td className="px-6 py-4 text-sm text-slate-500 font-mono">#{user.id}</td>
+                          <td className="px-6 py-4">
+                            <div className="flex flex-col">
+                              <span className="font-medium text-slate-900">{user.first_name} {user.last_name}</span>
+                              <span className="text-xs text-slate-500">{user.email}</span>
+                            </div>
+                          </td>
+                          <td className="px-6 py-4">
+                            <span className={`inline-flex items-center px-2 py-1 rounded text-xs font-medium ${user.is_staff ? 'bg-purple-100 text-purple-700' : 'bg-slate-100 text-slate-600'}`}>
+                              {user.is_staff ? 'Administrator' : 'Customer'}
+                            </span>
+                          </td>
+                          <td className="px-6 py-4">
+                            <span className={`inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium ${user.is_active ? 'bg-green-100 text-green-800' : 'bg-red-100 text-red-800'}`}>
+                              {user.is_active ? 'Active' : 'Suspended'}
+                            </span>
+                          </td>
+                          <td className="px-6 py-4 text-right">
+                            {!user.is_staff && (
+                              <button
+                                onClick={() => handleToggleUserStatus(user.id)}
+                                className={`text-xs font-medium hover:underline ${user.is_active ? 'text-red-600 hover:text-red-800' : 'text-green-600 hover:text-green-800'}`}
+                              >
+                                {user.is_active ? 'Deactivate User' : 'Activate User'}
+                              </button>
+                            )}
+                          </td>
+                        </tr>
+                      ))}
+                    </tbody>
+                  </table>
+                </div>
+                <div className="px-6 py-3 border-t border-slate-200 flex justify-between items-center text-sm text-slate-600">
+                  <span>{userTotal} users</span>
+                  <div className="flex items-center space-x-3">
+                    <button
+                      onClick={() => setUserPage(page => page - 1)}
+                      disabled={userPage <= 1}
+                      className="px-3 py-1 rounded border border-slate-300 disabled:opacity-40 hover:bg-slate-50"
+                    >
+                      Previous
+                    </button>
+                    <span>Page {userPage} of {userPages}</span>
+                    <button
+                      onClick={() => setUserPage(page => page + 1)}
+                      disabled={userPage >= userPages}
+                      className="px-3 py-1 rounded border border-slate-300 disabled:opacity-40 hover:bg-slate-50"
+                    >
+                      Next
+                    </button>
+                  </div>
+                </div>
               </div>
             </div>
           )}
@@ -1,9 +1,10 @@
 import { useState, useEffect } from 'react';
-import { cardAPI, transactionAPI } from '../utils/api';
+import { authAPI } from '../utils/api';
 
 export default function Dashboard({ user, onNavigate, onLogout }) {
   const [cards, setCards] = useState([]);
-  const [transactions, setTransactions] = useState([]);
+  const [recentTransactions, setRecentTransactions] = useState([]);
+  const [totals, setTotals] = useState({ total_transactions: 0, total_spent: 0 });
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -12,13 +13,11 @@ export default function Dashboard({ user, onNavigate, onLogout }) {
 
   const loadData = async () => {
     try {
-      const [cardsRes, transactionsRes] = await Promise.all([
-        cardAPI.listCards(),
-        transactionAPI.listTransactions()
-      ]);
+      const overview = await authAPI.getOverview(5);
       
-      setCards(cardsRes.data || []);
-      setTransactions(transactionsRes.data || []);
+      setCards(overview.data.cards || []);
+      setRecentTransactions(overview.data.recent_transactions || []);
+      setTotals(overview.data.totals);
     } catch (error) {
       console.error('Error loading data:', error);
     } finally {
@@ -31,9 +30,7 @@ export default function Dashboard({ user, onNavigate, onLogout }) {
     onLogout();
   };
 
-  const recentTransactions = transactions.slice(0, 5);
-  const successfulTransactions = transactions.filter(t => t.status === 'SUCCESS');
-  const totalSpent = successfulTransactions.reduce((sum, t) => sum + parseFloat(t.amount), 0);
+  const totalSpent = parseFloat(totals.total_spent || 0);
 
   // Status Badge Helper
   const getStatusColor = (status) => {
@@ -137,7 +134,7 @@ export default function Dashboard({ user, onNavigate, onLogout }) {
           <div className="bg-white p-6 rounded-xl shadow-[0_2px_10px_-3px_rgba(6,81,237,0.1)] border border-slate-100 flex items-center justify-between">
             <div>
               <p className="text-sm font-medium text-slate-500">Transactions</p>
-              <p className="text-3xl font-bold text-slate-900 mt-1">{transactions.length}</p>
+              <p className="text-3xl font-bold text-slate-900 mt-1">{totals.total_transactions}</p>
             </div>
             <div className="h-12 w-12 bg-emerald-50 rounded-full flex items-center justify-center">
               <svg className="h-6 w-6 text-emerald-600" fill="none" viewBox="0 0 24 24" stroke="currentColor">
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { cardAPI, transactionAPI, paymentAPI } from '../utils/api';
+import { cardAPI, paymentAPI } from '../utils/api';
 
 export default function MakePayment({ onBack }) {
   const [cards, setCards] = useState([]);
@@ -38,46 +38,29 @@ export default function MakePayment({ onBack }) {
     e.preventDefault();
     setError('');
     setSuccess('');
-    setLoading(true);
+    setProcessing(true);
 
     try {
-      // Step 1: Create transaction in Django
-      const transactionResponse = await transactionAPI.createTransaction(formData);
+      // Create and process the transaction in one round trip
+      const paymentResponse = await paymentAPI.pay(formData);
+      const transactionId = paymentResponse.transaction_id;
       
-      if (transactionResponse.status === 'success') {
-        const transactionId = transactionResponse.data.id;
-        
-        setLoading(false); // Stop generic loading, start specific processing
-        setProcessing(true);
-        
-        // Step 2: Process payment via FastAPI
-        try {
-          // Simulate a slight delay for better UX animation (optional)
-          await new Promise(resolve => setTimeout(resolve, 1500));
-          
-          const paymentResponse = await paymentAPI.processPayment(transactionId);
-          
-          if (paymentResponse.payment_status === 'SUCCESS') {
-            setSuccess(`Payment successful! Transaction ID: ${transactionId}`);
-            // Reset form
-            setFormData({
-              card_id: '',
-              amount: '',
-              currency: 'USD',
-              description: ''
-            });
-          } else {
-            setError(`Payment failed: ${paymentResponse.message}`);
-          }
-        } catch (paymentError) {
-          setError('Payment processing failed. Please try again.');
-        } finally {
-          setProcessing(false);
-        }
+      if (paymentResponse.payment_status === 'SUCCESS') {
+        setSuccess(`Payment successful! Transaction ID: ${transactionId}`);
+        // Reset form
+        setFormData({
+          card_id: '',
+          amount: '',
+          currency: 'USD',
+          description: ''
+        });
+      } else {
+        setError(`Payment failed: ${paymentResponse.message}`);
       }
     } catch (err) {
-      setError(err.message || 'Failed to initiate transaction');
-      setLoading(false);
+      setError(err.message || 'Payment processing failed. Please try again.');
+    } finally {
+      setProcessing(false);
     }
   };
 
@@ -56,7 +56,10 @@ export const authAPI = {
     body: JSON.stringify({ refresh_token: refreshToken })
   }),
   
-  getProfile: () => apiRequest(`${DJANGO_API}/auth/profile/`)
+  getProfile: () => apiRequest(`${DJANGO_API}/auth/profile/`),
+  
+  // Profile, cards, recent transactions and totals in one request
+  getOverview: (recent = 5) => apiRequest(`${DJANGO_API}/me/overview/?recent=${recent}`)
 };
 
 // Card APIs
@@ -103,6 +106,18 @@ export const paymentAPI = {
     });
   },
   
+  // Create the transaction and process it in a single call
+  pay: (paymentData) => {
+    const token = getAuthToken();
+    return apiRequest(`${FASTAPI_API}/pay`, {
+      method: 'POST',
+      body: JSON.stringify({
+        ...paymentData,
+        auth_token: token
+      })
+    });
+  },
+  
   getTransactionStatus: (transactionId) => apiRequest(`${FASTAPI_API}/transaction-status/${transactionId}`),
   
   getDummyCards: () => apiRequest(`${FASTAPI_API}/dummy-cards`)
@@ -112,7 +127,15 @@ export const paymentAPI = {
 export const adminAPI = {
   getDashboard: () => apiRequest(`${DJANGO_API}/admin-panel/dashboard/`),
   
-  getUsers: () => apiRequest(`${DJANGO_API}/admin-panel/users/`),
+  getUsers: (filters = {}) => {
+    const params = new URLSearchParams(filters).toString();
+    return apiRequest(`${DJANGO_API}/admin-panel/users/${params ? '?' + params : ''}`);
+  },
+  
+  bulkUserStatus: (isActive, selection) => apiRequest(`${DJANGO_API}/admin-panel/users/bulk-status/`, {
+    method: 'POST',
+    body: JSON.stringify({ is_active: isActive, ...selection })
+  }),
   
   getUserDetails: (userId) => apiRequest(`${DJANGO_API}/admin-panel/users/${userId}/`),
   
@@ -132,6 +155,8 @@ export const adminAPI = {
     return apiRequest(`${DJANGO_API}/admin-panel/daily-summary/${params}`);
   },
   
+  getTimeseries: (minutes = 60) => apiRequest(`${DJANGO_API}/admin-panel/timeseries/?minutes=${minutes}`),
+  
   exportTransactions: () => {
     const token = getAuthToken();
     